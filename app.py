@@ -1,20 +1,55 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, abort, send_from_directory, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, abort, send_from_directory, send_file, Response, make_response, stream_with_context, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.sql.expression import Select, CompoundSelect
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_migrate import Migrate
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 from werkzeug.utils import secure_filename
 import os
 import pytz
 import qrcode
 import io
+import gzip
+import json
+import mimetypes
+import tempfile
+import zipfile
+import hashlib
+import uuid
+import random
+import bisect
+import math
+import atexit
+import csv
+import click
+import time
+import threading
+import multiprocessing
+from collections import deque, namedtuple, OrderedDict
+from itertools import groupby
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor
 import stripe
 from dotenv import load_dotenv
-from PIL import Image, ImageDraw, ImageFont
-from functools import wraps  # Dodaj ten import na początku pliku
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from functools import wraps, lru_cache  # Dodaj ten import na początku pliku
+from contextlib import contextmanager
 from flask_login import UserMixin
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+try:
+    import brotli
+except ImportError:  # brotli jest opcjonalny - bez niego serwujemy tylko gzip
+    brotli = None
 
 
 
@@ -25,15 +60,266 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = os.getenv("SECRET_KEY", "defaultsecretkey")
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-db = SQLAlchemy(app)
+# Lokalny zamiennik API Stripe do testów (np. stripe-mock: http://localhost:12111)
+if os.getenv("STRIPE_API_BASE"):
+    stripe.api_base = os.getenv("STRIPE_API_BASE")
+# Sekret podpisu webhooka (whsec_...) - z panelu Stripe albo z `stripe listen`
+app.config['STRIPE_WEBHOOK_SECRET'] = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Po tylu sekundach bez webhooka strona powrotu z płatności zleca sprawdzenie sesji bezpośrednio w Stripe
+app.config['STRIPE_RECONCILE_DELAY'] = int(os.getenv("STRIPE_RECONCILE_DELAY", 30))
+# Repliki tylko do odczytu (adresy oddzielone przecinkami) dla widoków oznaczonych @read_replica
+app.config['SQLALCHEMY_BINDS'] = {
+    f'replica_{index}': url.strip()
+    for index, url in enumerate(filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(',')))
+}
+app.config['READ_REPLICA_KEYS'] = sorted(app.config['SQLALCHEMY_BINDS'])
+# Przez tyle sekund po własnym zapisie klient czyta z bazy głównej (widzi swoje zmiany mimo opóźnienia replik)
+app.config['READ_REPLICA_STICKY_SECONDS'] = int(os.getenv("READ_REPLICA_STICKY_SECONDS", 10))
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    # Zwykłe SELECT-y w żądaniu z ustawionym info["db_replica"] idą do tej repliki. Flush, DML
+    # i SELECT ... FOR UPDATE przełączają sesję na bazę główną do końca żądania.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('db_replica')
+        if replica is not None and bind is None:
+            if not self._flushing and isinstance(clause, (Select, CompoundSelect)) \
+                    and getattr(clause, '_for_update_arg', None) is None:
+                return self._db.engines[replica]
+            self.info.pop('db_replica')
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 migrate = Migrate(app, db)
 app.config['UPLOAD_FOLDER'] = '/var/data/images'
+# Serwowanie wgranych zdjęć: None (Flask), "x-accel-redirect" (nginx) lub "x-sendfile" (Apache/lighttpd)
+app.config['UPLOAD_OFFLOAD'] = os.getenv("UPLOAD_OFFLOAD")
+# Wewnętrzna lokalizacja nginx wskazująca na UPLOAD_FOLDER, np. "location /_uploads/ { internal; alias /var/data/images/; }"
+app.config['UPLOAD_ACCEL_PREFIX'] = os.getenv("UPLOAD_ACCEL_PREFIX", "/_uploads/")
+# Czas cache dla adresów bez ?v= (z ?v= plik jest niezmienny)
+app.config['UPLOAD_MAX_AGE'] = int(os.getenv("UPLOAD_MAX_AGE", 3600))
+# Skompresowane kopie plików statycznych (gdy obok pliku nie ma gotowego .gz/.br)
+app.config['ASSET_CACHE_FOLDER'] = os.getenv("ASSET_CACHE_FOLDER", os.path.join(tempfile.gettempdir(), 'ordering-assets'))
+# Warianty zdjęć (szerokości w px) generowane w tle po każdym uploadzie
+app.config['IMAGE_VARIANT_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'variants')
+app.config['IMAGE_VARIANT_WIDTHS'] = (320, 640, 1280)
+# Kody QR stolików - nazwa pliku to skrót treści, więc niezmienione kody nie są renderowane ponownie
+app.config['QR_CODE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'qr_codes')
+app.config['QR_RENDER_WORKERS'] = int(os.getenv("QR_RENDER_WORKERS", os.cpu_count() or 1))
+# Publiczny adres aplikacji używany w kodach QR (gdy aplikacja stoi za proxy)
+app.config['PUBLIC_BASE_URL'] = os.getenv("PUBLIC_BASE_URL")
+# Maksymalny czas jednego połączenia SSE (sekundy) - potem przeglądarka łączy się ponownie z Last-Event-ID
+app.config['BOARD_STREAM_TIMEOUT'] = int(os.getenv("BOARD_STREAM_TIMEOUT", 300))
+app.config['BOARD_HEARTBEAT_INTERVAL'] = 15
+# Ile połączeń SSE/long-poll może jednocześnie trzymać jeden proces (każde zajmuje wątek workera
+# gthread - patrz gunicorn.conf.py). Po przekroczeniu limitu, albo na workerze bez wątków,
+# tablice przechodzą na zwykłe odpytywanie co BOARD_SHORT_POLL_INTERVAL sekund.
+app.config['BOARD_MAX_STREAMS'] = int(os.getenv("BOARD_MAX_STREAMS", 16))
+app.config['BOARD_SHORT_POLL_INTERVAL'] = 5
+# Co ile sekund proces z otwartymi tablicami sprawdza licznik zmian zamówień (zmiany z innych workerów)
+app.config['BOARD_EVENT_POLL_INTERVAL'] = float(os.getenv("BOARD_EVENT_POLL_INTERVAL", 1))
+# Co ile sekund sprawdzamy wersje treści w bazie (zmiany z innych workerów)
+app.config['CACHE_VERSION_CHECK_INTERVAL'] = int(os.getenv("CACHE_VERSION_CHECK_INTERVAL", 30))
+# Cache wyrenderowanych stron publicznych (0 wyłącza cache)
+app.config['PAGE_CACHE_TTL'] = int(os.getenv("PAGE_CACHE_TTL", 300))
+app.config['PAGE_CACHE_MAX_AGE'] = int(os.getenv("PAGE_CACHE_MAX_AGE", 60))
+app.config['PAGE_CACHE_MAX_ENTRIES'] = 256
+# Historia zamówień: rozmiar strony i jak długo (s) trzymamy przybliżoną liczbę zamówień
+app.config['ORDER_HISTORY_PER_PAGE'] = 50
+app.config['ORDER_HISTORY_COUNT_TTL'] = int(os.getenv("ORDER_HISTORY_COUNT_TTL", 300))
+# Eksport zamówień: ile wierszy pobieramy z kursora naraz i co ile bajtów wysyłamy fragment odpowiedzi
+app.config['ORDER_EXPORT_BATCH_SIZE'] = 1000
+app.config['ORDER_EXPORT_CHUNK_SIZE'] = 64 * 1024
+# Dziennik statusów zamówień: co ile sekund i jak dużymi paczkami zapisujemy zdarzenia z bufora
+app.config['ORDER_EVENT_FLUSH_INTERVAL'] = float(os.getenv("ORDER_EVENT_FLUSH_INTERVAL", 2))
+app.config['ORDER_EVENT_BATCH_SIZE'] = 500
+# Gdy baza jest niedostępna, trzymamy najwyżej tyle zdarzeń - starsze odrzucamy
+app.config['ORDER_EVENT_BUFFER_LIMIT'] = 20000
+# Prognoza czasu realizacji: ile zamówień kuchnia przygotowuje równolegle i domyślny czas dania bez historii
+app.config['KITCHEN_PARALLEL_ORDERS'] = int(os.getenv("KITCHEN_PARALLEL_ORDERS", 3))
+app.config['ORDER_ETA_DEFAULT_PREP_MINUTES'] = 15
+app.config['ORDER_ETA_HISTORY_DAYS'] = 14
+app.config['ORDER_ETA_SMOOTHING'] = 0.2
+# Co ile sekund kolejka i historia są odczytywane z bazy (zmiany z innych workerów)
+app.config['ORDER_ETA_QUEUE_RESYNC'] = 30
+app.config['ORDER_ETA_HISTORY_REFRESH'] = 3600
+# Metryki: opcjonalny token dla /metrics (nagłówek "Authorization: Bearer <token>")
+app.config['METRICS_TOKEN'] = os.getenv("METRICS_TOKEN")
+# Żądania wolniejsze niż tyle sekund trafiają do logu razem z wykonanym SQL (brak = wyłączone)
+app.config['SLOW_REQUEST_THRESHOLD'] = float(os.getenv("SLOW_REQUEST_THRESHOLD")) if os.getenv("SLOW_REQUEST_THRESHOLD") else None
+app.config['SLOW_REQUEST_MAX_STATEMENTS'] = 100
+# Kolejka zadań w tle: "thread" - wątki w każdym procesie aplikacji, "external" - tylko `flask run-jobs`
+app.config['JOB_WORKER_MODE'] = os.getenv("JOB_WORKER_MODE", "thread")
+app.config['JOB_WORKER_THREADS'] = int(os.getenv("JOB_WORKER_THREADS", 2))
+app.config['JOB_POLL_INTERVAL'] = 1.0
+# Ponowienia: opóźnienie rośnie wykładniczo od JOB_RETRY_BASE_DELAY do JOB_RETRY_MAX_DELAY sekund
+app.config['JOB_RETRY_BASE_DELAY'] = 5
+app.config['JOB_RETRY_MAX_DELAY'] = 600
+# Zadanie "running" dłużej niż tyle sekund uznajemy za porzucone (np. restart workera) i wraca do kolejki
+app.config['JOB_LOCK_TIMEOUT'] = 600
+# Limity publicznych endpointów (kubełek żetonów): nazwa -> (pojemność, sekundy na pełne napełnienie).
+# Właściwe limity są na stolik lub zamówienie. Limity "*:ip" są tylko luźnym zabezpieczeniem przed
+# zalewem żądań - cały lokal na wspólnym Wi-Fi (NAT) ma jeden adres i dzieli te kubełki.
+# Zamówienia z dostawą (bez stolika) i zapytania o lokalizację nie mają stolika ani zamówienia,
+# więc dzielą jeden kubełek na wszystkich klientów ("*:delivery", "*:all").
+app.config['RATE_LIMIT_ENABLED'] = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+app.config['RATE_LIMITS'] = {
+    'order:ip': (120, 60),
+    'order:table': (6, 60),
+    'order:delivery': (30, 60),
+    'call_waiter:ip': (120, 60),
+    'request_bill:ip': (120, 60),
+    'request_bill:order': (3, 60),
+    'check_location:ip': (300, 60),
+    'check_location:all': (1200, 60),
+    'checkout:ip': (60, 60),
+    'checkout:table': (6, 60),
+    'checkout:delivery': (30, 60),
+    'delivery_zone:ip': (300, 60),
+    'delivery_zone:all': (1200, 60),
+}
+# "memory" - kubełki osobno w każdym procesie, "database" - wspólne dla wszystkich workerów (tabela rate_limit_bucket)
+app.config['RATE_LIMIT_BACKEND'] = os.getenv("RATE_LIMIT_BACKEND", "memory")
+app.config['RATE_LIMIT_MEMORY_KEYS'] = 100000
+# Kubełki nieużywane dłużej niż tyle sekund są pełne - usuwamy je z bazy
+app.config['RATE_LIMIT_IDLE_SECONDS'] = 3600
+# Maksymalna liczba równoczesnych żądań w procesie (0 = bez limitu) - nadmiar dostaje 503 zamiast czekać na bazę
+app.config['MAX_CONCURRENT_REQUESTS'] = int(os.getenv("MAX_CONCURRENT_REQUESTS", 32))
+# Za reverse proxy adres klienta pochodzi z X-Forwarded-For - liczba zaufanych proxy przed aplikacją
+app.config['PROXY_FIX_X_FOR'] = int(os.getenv("PROXY_FIX_X_FOR", 0))
+# Limity "*:ip" domyślnie tylko za skonfigurowanym proxy - bez PROXY_FIX_X_FOR wszyscy klienci
+# za reverse proxy mają jego adres i wspólny kubełek
+app.config['RATE_LIMIT_BY_IP'] = os.getenv(
+    "RATE_LIMIT_BY_IP", "1" if app.config['PROXY_FIX_X_FOR'] else "0") != "0"
+# Bok komórki siatki indeksu lokali i stref dostaw w stopniach (0.01° szerokości to ok. 1,1 km)
+app.config['LOCATION_GRID_CELL_DEG'] = 0.01
+# Opłaty doliczane do zamówienia (PLN) - "takeaway" raz za każdą pozycję na wynos
+app.config['ORDER_FEES'] = {
+    'takeaway': Decimal(os.getenv("TAKEAWAY_FEE", "2.35")),
+}
+
+
+if app.config['PROXY_FIX_X_FOR']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
 
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"  # Przekierowanie na stronę logowania
 
+# Pliki statyczne z odciskiem treści: url_for('static', ...) dopisuje ?v=<skrót>,
+# a taki adres można cache'ować w przeglądarce bez rewalidacji
+StaticAsset = namedtuple('StaticAsset', ['path', 'digest', 'mimetype', 'compressible'])
+COMPRESSIBLE_ASSET_EXTENSIONS = {'.css', '.js', '.svg', '.ico', '.wav', '.bmp', '.eps', '.ttf', '.json', '.txt'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def build_asset_manifest(static_folder):
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            digest = hashlib.sha256()
+            with open(path, 'rb') as asset_file:
+                for chunk in iter(lambda: asset_file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            relative_path = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            manifest[relative_path] = StaticAsset(
+                path=path,
+                digest=digest.hexdigest()[:12],
+                mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                compressible=os.path.splitext(name)[1].lower() in COMPRESSIBLE_ASSET_EXTENSIONS,
+            )
+    return manifest
+
+
+asset_manifest = build_asset_manifest(app.static_folder)
+
+
+def file_version_token(path):
+    # Silny ETag bez czytania pliku - zmienia się przy każdym nadpisaniu
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and 'v' not in values:
+        asset = asset_manifest.get(values.get('filename'))
+        if asset:
+            values['v'] = asset.digest
+    elif endpoint == 'uploaded_file' and 'v' not in values and values.get('filename'):
+        path = safe_join(app.config['UPLOAD_FOLDER'], values['filename'])
+        if path and os.path.isfile(path):
+            values['v'] = file_version_token(path)
+
+
+def compressed_asset_path(asset, encoding):
+    # Najpierw gotowy plik obok oryginału (np. style.css.gz), potem kopia w ASSET_CACHE_FOLDER
+    extension = 'br' if encoding == 'br' else 'gz'
+    sibling_path = f"{asset.path}.{extension}"
+    if os.path.exists(sibling_path):
+        return sibling_path
+
+    cache_folder = app.config['ASSET_CACHE_FOLDER']
+    cached_path = os.path.join(cache_folder, f"{asset.digest}.{extension}")
+    if not os.path.exists(cached_path):
+        os.makedirs(cache_folder, exist_ok=True)
+        with open(asset.path, 'rb') as asset_file:
+            data = asset_file.read()
+        if encoding == 'br':
+            compressed = brotli.compress(data)
+        else:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as compressed_file:
+            compressed_file.write(compressed)
+        os.replace(tmp_path, cached_path)
+    return cached_path
+
+
+def serve_static_asset(filename):
+    asset = asset_manifest.get(filename)
+    if asset is None:
+        return app.send_static_file(filename)
+
+    path = asset.path
+    encoding = None
+    if asset.compressible:
+        if brotli is not None and 'br' in request.accept_encodings:
+            encoding = 'br'
+        elif 'gzip' in request.accept_encodings:
+            encoding = 'gzip'
+    if encoding:
+        compressed_path = compressed_asset_path(asset, encoding)
+        # Kompresja, która prawie nic nie daje (np. już skompresowane dane), nie jest warta dekodowania
+        if os.path.getsize(compressed_path) < os.path.getsize(asset.path) * 0.9:
+            path = compressed_path
+        else:
+            encoding = None
+
+    response = send_file(path, mimetype=asset.mimetype, conditional=True,
+                         etag=f"{asset.digest}-{encoding}" if encoding else asset.digest)
+    if encoding:
+        response.content_encoding = encoding
+    if asset.compressible:
+        response.vary.add('Accept-Encoding')
+
+    if request.args.get('v') == asset.digest:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # Adres bez odcisku (np. z CSS) - przeglądarka rewaliduje przez ETag
+        response.cache_control.no_cache = True
+    return response
+
+
+app.view_functions['static'] = serve_static_asset
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -100,6 +386,592 @@ def employee_required(f):
     return decorated_function
 
 
+# Kanał zdarzeń dla tablic kelnera i kuchni (SSE + long-poll)
+# Zdarzenia są trzymane w pamięci procesu w buforze cyklicznym. Zmiany zapisane przez inne
+# workery gunicorna widać tylko w bazie: dopóki proces ma otwarte tablice, wątek w tle co
+# BOARD_EVENT_POLL_INTERVAL sekund porównuje licznik zmian "orders" z wersją ostatniego
+# własnego zdarzenia i przy różnicy publikuje "orders_changed".
+class BoardEventBroker:
+    def __init__(self, history=500):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._listeners = 0
+        self._seen_version = None
+        self._watcher = None
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def attach_listener(self, limit):
+        # Miejsce na jedno trzymane połączenie; False, gdy proces ma już limit otwartych
+        with self._condition:
+            if self._listeners >= limit:
+                return False
+            self._listeners += 1
+            self._ensure_watcher()
+            self._condition.notify_all()
+            return True
+
+    def detach_listener(self):
+        with self._condition:
+            self._listeners -= 1
+
+    def publish(self, event_type, version=None, **data):
+        with self._condition:
+            if version is not None and self._seen_version is not None:
+                self._seen_version = max(self._seen_version, version)
+            self._append(event_type, data)
+
+    def _append(self, event_type, data):
+        self._last_id += 1
+        self._events.append({"id": self._last_id, "type": event_type, "data": data})
+        self._condition.notify_all()
+
+    def events_after(self, last_id):
+        # Zwraca (zdarzenia, resync). resync=True gdy klient ma id spoza bufora
+        # (np. po restarcie workera) i musi pobrać pełny stan.
+        with self._condition:
+            return self._collect(last_id)
+
+    def wait(self, last_id, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id != last_id, timeout)
+            return self._collect(last_id)
+
+    def _collect(self, last_id):
+        if last_id > self._last_id:
+            return [], True
+        if self._events and last_id < self._events[0]["id"] - 1:
+            return list(self._events), True
+        return [e for e in self._events if e["id"] > last_id], False
+
+    def _ensure_watcher(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, name='board-events', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            with self._condition:
+                if not self._listeners:
+                    # Bez słuchaczy nie odpytujemy bazy; po powrocie wersję ustalamy od nowa
+                    self._seen_version = None
+                    self._condition.wait_for(lambda: self._listeners > 0)
+            try:
+                with app.app_context():
+                    version = current_change_version('orders')
+            except Exception as e:
+                print(f"Błąd odczytu licznika zmian zamówień: {e}")
+                version = None
+            with self._condition:
+                if version is not None:
+                    if self._seen_version is not None and version > self._seen_version:
+                        self._append('orders_changed', {"version": version})
+                    self._seen_version = max(version, self._seen_version or 0)
+            time.sleep(app.config['BOARD_EVENT_POLL_INTERVAL'])
+
+
+board_events_broker = BoardEventBroker()
+
+
+def publish_board_event(event_type, order):
+    # Wywoływane po commicie, żeby tablice nie dostały zdarzenia dla wycofanej transakcji
+    board_events_broker.publish(
+        event_type,
+        version=order.version,
+        order_id=order.id,
+        order_number=order.order_number,
+        table_id=order.table_id,
+        status=order.status,
+    )
+
+
+def _format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def board_stream_slot():
+    # Połączenie trzymamy tylko na workerze wielowątkowym (gthread, gevent) - na workerze "sync"
+    # zająłby cały proces. Zwraca True, jeśli zajęto miejsce (zwalnia je detach_listener).
+    if not request.environ.get('wsgi.multithread'):
+        return False
+    return board_events_broker.attach_listener(app.config['BOARD_MAX_STREAMS'])
+
+
+def _requested_last_event_id():
+    value = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Kolejka zadań w tle. Zadania zapisujemy w tej samej transakcji co zmianę, która je wywołała,
+# a po commicie budzimy wątki robocze. Przy JOB_WORKER_MODE="external" zadania wykonuje
+# tylko osobny proces `flask run-jobs` (wiele procesów może działać jednocześnie).
+JOB_HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    # Błąd, którego ponowienie nie naprawi - zadanie od razu kończy się statusem "failed"
+    pass
+
+
+def job_handler(kind, max_attempts=5):
+    def decorator(f):
+        JOB_HANDLERS[kind] = (f, max_attempts)
+        return f
+    return decorator
+
+
+def enqueue_job(kind, payload, dedupe_key=None, run_at=None):
+    if dedupe_key is not None:
+        existing = Job.query.filter_by(dedupe_key=dedupe_key).first()
+        if existing:
+            return existing
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        dedupe_key=dedupe_key,
+        max_attempts=JOB_HANDLERS[kind][1],
+        run_at=run_at or datetime.utcnow(),
+    )
+    if dedupe_key is None:
+        db.session.add(job)
+    else:
+        # Dwa równoczesne żądania (np. podwójne przekierowanie po płatności) mogą oba nie znaleźć
+        # zadania powyżej - drugie dostaje zadanie pierwszego zamiast błędu unikalności dedupe_key
+        job = insert_deduplicated_job(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+def insert_deduplicated_job(job):
+    insert = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}.get(db.engine.dialect.name)
+    if insert is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(job)
+            return job
+        except IntegrityError:
+            return Job.query.filter_by(dedupe_key=job.dedupe_key).one()
+
+    # INSERT ... ON CONFLICT DO NOTHING czeka na transakcję, która wstawiła ten sam klucz,
+    # i po jej commicie nie wstawia nic - wtedy odczytujemy tamto zadanie
+    job_id = db.session.execute(
+        insert(Job).values(kind=job.kind, payload=job.payload, dedupe_key=job.dedupe_key,
+                           max_attempts=job.max_attempts, run_at=job.run_at)
+        .on_conflict_do_nothing(index_elements=['dedupe_key'])
+        .returning(Job.id)
+    ).scalar()
+    if job_id is None:
+        return Job.query.filter_by(dedupe_key=job.dedupe_key).one()
+    return db.session.get(Job, job_id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def wake_job_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        job_worker.wake()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_enqueued_jobs(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def job_retry_delay(attempts):
+    delay = min(app.config['JOB_RETRY_BASE_DELAY'] * 2 ** (attempts - 1), app.config['JOB_RETRY_MAX_DELAY'])
+    # Rozrzut, żeby zadania, które padły razem (np. awaria Stripe), nie wracały jednocześnie
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_job(worker_id):
+    now = datetime.utcnow()
+    candidate = db.select(Job.id)\
+        .where(Job.status == 'queued', Job.run_at <= now)\
+        .order_by(Job.run_at, Job.id)\
+        .limit(1)
+    if db.engine.dialect.name == 'postgresql':
+        # Równoległe workery pomijają zadania zablokowane przez innych zamiast czekać
+        candidate = candidate.with_for_update(skip_locked=True)
+    job_id = db.session.execute(
+        db.update(Job)
+        .where(Job.id == candidate.scalar_subquery(), Job.status == 'queued')
+        .values(status='running', locked_at=now, locked_by=worker_id, attempts=Job.attempts + 1)
+        .returning(Job.id)
+    ).scalar()
+    db.session.commit()
+    return db.session.get(Job, job_id) if job_id else None
+
+
+def requeue_stale_jobs():
+    stale_before = datetime.utcnow() - timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'])
+    db.session.execute(
+        db.update(Job)
+        .where(Job.status == 'running', Job.locked_at < stale_before)
+        .values(status='queued', locked_at=None, locked_by=None, run_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+def run_job(job):
+    handler, _ = JOB_HANDLERS[job.kind]
+    try:
+        result = handler(json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = f"{type(e).__name__}: {e}"
+        job.locked_at = None
+        job.locked_by = None
+        if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            print(f"Zadanie {job.kind} #{job.id} nieudane: {job.last_error}")
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=job_retry_delay(job.attempts))
+        db.session.commit()
+        return
+
+    job = db.session.get(Job, job.id)
+    job.status = 'succeeded'
+    job.result = json.dumps(result) if result is not None else None
+    job.finished_at = datetime.utcnow()
+    job.locked_at = None
+    job.locked_by = None
+    db.session.commit()
+
+
+def work_off_jobs(worker_id, limit=None):
+    # Wykonuje zadania, dopóki są gotowe do uruchomienia; zwraca liczbę wykonanych
+    done = 0
+    while limit is None or done < limit:
+        with app.app_context():
+            job = claim_job(worker_id)
+            if job is None:
+                return done
+            run_job(job)
+        done += 1
+    return done
+
+
+class JobWorker:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._threads = []
+        self._last_stale_check = 0
+        self._started_pid = None
+
+    def start(self):
+        # Raz na proces (po forku workera gunicorna wątki rodzica nie istnieją)
+        if app.config['JOB_WORKER_MODE'] != 'thread' or self._started_pid == os.getpid():
+            return
+        with self._condition:
+            self._ensure_threads()
+            self._started_pid = os.getpid()
+
+    def wake(self):
+        if app.config['JOB_WORKER_MODE'] != 'thread':
+            return
+        with self._condition:
+            self._ensure_threads()
+            self._condition.notify_all()
+
+    def _ensure_threads(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < app.config['JOB_WORKER_THREADS']:
+            thread = threading.Thread(target=self._run, name=f'jobs-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        worker_id = f"{os.getpid()}:{threading.current_thread().name}"
+        while True:
+            try:
+                if time.monotonic() - self._last_stale_check > app.config['JOB_LOCK_TIMEOUT'] / 2:
+                    self._last_stale_check = time.monotonic()
+                    with app.app_context():
+                        requeue_stale_jobs()
+                work_off_jobs(worker_id)
+            except Exception as e:
+                print(f"Błąd kolejki zadań: {e}")
+            with self._condition:
+                self._condition.wait(app.config['JOB_POLL_INTERVAL'])
+
+
+job_worker = JobWorker()
+
+
+@app.before_request
+def start_job_worker():
+    # Wątki kolejki startują przy pierwszym żądaniu procesu, a nie dopiero przy pierwszym nowym zadaniu -
+    # zadania zapisane przed restartem (np. odłożone uzgodnienia płatności) ruszają od razu.
+    # Nie przy imporcie, żeby `flask db ...` i `flask run-jobs` nie uruchamiały wątków.
+    job_worker.start()
+
+
+@app.cli.command('run-jobs', help='Wykonuje zadania z kolejki w tym procesie (dla JOB_WORKER_MODE=external).')
+@click.option('--once', is_flag=True, help='Wykonaj gotowe zadania i zakończ.')
+def run_jobs_command(once):
+    worker_id = f"{os.getpid()}:cli"
+    requeue_stale_jobs()
+    while True:
+        done = work_off_jobs(worker_id)
+        if once:
+            click.echo(f"Wykonano zadań: {done}")
+            return
+        if not done:
+            time.sleep(app.config['JOB_POLL_INTERVAL'])
+
+
+def serialize_job(job):
+    return {
+        'id': job.public_id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_at': job.run_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'last_error': job.last_error,
+        'result': json.loads(job.result) if job.result else None,
+    }
+
+
+@app.route('/jobs/<public_id>', methods=['GET'])
+def job_status(public_id):
+    job = Job.query.filter_by(public_id=public_id).first_or_404()
+    response = jsonify(serialize_job(job))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/admin/jobs', methods=['GET'])
+@login_required
+@admin_required
+def admin_jobs():
+    # Ostatnie zadania, opcjonalnie tylko w danym statusie (?status=failed)
+    query = Job.query.order_by(Job.id.desc())
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    return jsonify([serialize_job(job) for job in query.limit(100)])
+
+
+# Limity żądań publicznych endpointów (kubełek żetonów). Kubełek o pojemności N napełnia się
+# w całości w ciągu `period` sekund, każde żądanie zabiera jeden żeton; pusty kubełek = 429 z Retry-After.
+class MemoryRateLimitBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def acquire(self, key, capacity, rate, now):
+        # Zwraca 0, gdy żeton pobrano, w przeciwnym razie liczbę sekund do kolejnego żetonu
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            retry_after = 0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if not retry_after else tokens, now)
+            while len(self._buckets) > app.config['RATE_LIMIT_MEMORY_KEYS']:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class DatabaseRateLimitBackend:
+    # Kubełki wspólne dla wszystkich procesów. Pobranie żetonu to jeden warunkowy UPDATE na osobnym
+    # połączeniu (poza sesją żądania), nowy kubełek - INSERT.
+    def __init__(self):
+        self._pruned_at = 0
+
+    def acquire(self, key, capacity, rate, now):
+        buckets = RateLimitBucket.__table__
+        refilled = buckets.c.tokens + (now - buckets.c.updated_at) * rate
+        refilled = db.case((refilled > capacity, capacity), else_=refilled)
+        try:
+            with db.engine.begin() as connection:
+                if now - self._pruned_at > app.config['RATE_LIMIT_IDLE_SECONDS']:
+                    self._pruned_at = now
+                    connection.execute(buckets.delete().where(
+                        buckets.c.updated_at < now - app.config['RATE_LIMIT_IDLE_SECONDS']))
+                taken = connection.execute(
+                    buckets.update()
+                    .where(buckets.c.key == key, refilled >= 1)
+                    .values(tokens=refilled - 1, updated_at=now)
+                ).rowcount
+                if taken:
+                    return 0
+                if self._create(connection, key, capacity - 1, now):
+                    return 0
+                tokens = connection.execute(db.select(refilled).where(buckets.c.key == key)).scalar()
+        except SQLAlchemyError as e:
+            # Awaria bazy nie może blokować wszystkich żądań - przepuszczamy
+            app.logger.warning(f"Limit żądań niedostępny: {e}")
+            return 0
+        return (1 - tokens) / rate if tokens is not None else 0
+
+    @staticmethod
+    def _create(connection, key, tokens, now):
+        buckets = RateLimitBucket.__table__
+        if connection.dialect.name == 'postgresql':
+            return connection.execute(
+                postgresql_insert(buckets).values(key=key, tokens=tokens, updated_at=now).on_conflict_do_nothing()
+            ).rowcount
+        try:
+            with connection.begin_nested():
+                connection.execute(buckets.insert().values(key=key, tokens=tokens, updated_at=now))
+            return 1
+        except IntegrityError:
+            return 0
+
+
+RATE_LIMIT_BACKENDS = {
+    'memory': MemoryRateLimitBackend(),
+    'database': DatabaseRateLimitBackend(),
+}
+
+
+def client_ip():
+    # None - limit nie dotyczy żądania (patrz RATE_LIMIT_BY_IP)
+    return request.remote_addr if app.config['RATE_LIMIT_BY_IP'] else None
+
+
+def all_clients():
+    # Jeden kubełek wspólny dla wszystkich klientów
+    return 'all'
+
+
+def order_table_id():
+    # Numer stolika z koszyka (POST /order, /create-checkout-session); None - zamówienie z dostawą
+    return (request.get_json(silent=True) or {}).get('table_id')
+
+
+def delivery_order_key():
+    return all_clients() if order_table_id() is None else None
+
+
+def active_table_required(f):
+    # Koszyk do stolika tylko dla aktywnego stolika - przed limitami, żeby dowolne numery
+    # nie tworzyły nowych kubełków "order:table" i nie omijały limitu
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        table_id = order_table_id()
+        if table_id is not None and (type(table_id) is not int or table_id not in table_registry):
+            return jsonify({'error': 'Nieznany stolik', 'rejected': []}), 400
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def rate_limit(name, key, message="Zbyt wiele żądań. Spróbuj ponownie za chwilę."):
+    # `key()` zwraca identyfikator klienta (IP, stolik, zamówienie) albo None, gdy limit nie dotyczy żądania
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limit = app.config['RATE_LIMITS'].get(name)
+            client = key() if app.config['RATE_LIMIT_ENABLED'] and limit else None
+            if client is not None:
+                capacity, period = limit
+                backend = RATE_LIMIT_BACKENDS[app.config['RATE_LIMIT_BACKEND']]
+                retry_after = backend.acquire(f"{name}:{client}", capacity, capacity / period, time.time())
+                request_metrics.observe_rate_limit(name, allowed=not retry_after)
+                if retry_after:
+                    response = jsonify({"status": "error", "message": message})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+class AdmissionControl:
+    # Limit równoczesnych żądań w procesie. Nadmiar odrzucamy od razu (503), zanim żądania
+    # ustawią się w kolejce po połączenie z bazą i zaczną przekraczać czasy oczekiwania.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def try_enter(self, limit):
+        with self._lock:
+            if self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+admission_control = AdmissionControl()
+
+
+def admission_exempt(f):
+    # Strumienie i długie odpytywanie trzymają żądanie otwarte, a nie obciążają bazy
+    f.admission_exempt = True
+    return f
+
+
+@app.before_request
+def admit_request():
+    limit = app.config['MAX_CONCURRENT_REQUESTS']
+    if not limit or request.endpoint in (None, 'static', 'metrics'):
+        return
+    if getattr(app.view_functions.get(request.endpoint), 'admission_exempt', False):
+        return
+    if not admission_control.try_enter(limit):
+        request_metrics.observe_shed(request.endpoint)
+        response = jsonify({"status": "error", "message": "Serwer jest przeciążony. Spróbuj ponownie za chwilę."})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    g.admitted = True
+
+
+@app.teardown_request
+def release_admission(exc):
+    if g.pop('admitted', False):
+        admission_control.leave()
+
+
+# Logo wklejane w kody QR
+QR_LOGO_PATH = os.path.join(app.root_path, 'static', 'images', 'PAPU_logo_bitmap.jpg')
+# Zmiana wyglądu kodów QR wymaga podbicia wersji - stare pliki przestaną pasować do skrótu
+QR_RENDER_VERSION = 1
+
+
+@lru_cache(maxsize=1)
+def _prepared_qr_logo():
+    # Logo przygotowujemy raz na proces (odczyt z dysku i skalowanie są kosztowne)
+    logo = Image.open(QR_LOGO_PATH)
+    
+    # Obliczenie rozmiaru logo proporcjonalnie do rozmiaru modułów QR kodu
+    # Każdy moduł ma 20x20 pikseli, więc logo będzie miało 9 modułów (180x180 pikseli)
+    logo_size = 9 * 20  # 9 modułów * 20 pikseli na moduł
+    
+    # Plik logo ma 10000x10000 px - dekoder JPEG od razu zmniejsza go do rozmiaru bliskiego docelowemu
+    logo.draft('RGB', (logo_size, logo_size))
+    
+    # Konwersja logo do trybu RGBA
+    logo = logo.convert('RGBA')
+    
+    # Zmiana rozmiaru logo
+    logo = logo.resize((logo_size, logo_size))
+    
+    # Tworzenie białego obramowania
+    border_size = 1  # 1 moduł = 20 pikseli
+    bordered_logo = Image.new('RGBA', (logo_size + 2*border_size, logo_size + 2*border_size), (255, 255, 255, 255))
+    bordered_logo.paste(logo, (border_size, border_size), logo)
+    return bordered_logo
+
+
+@lru_cache(maxsize=1)
+def _qr_logo_fingerprint():
+    with open(QR_LOGO_PATH, 'rb') as logo_file:
+        return hashlib.sha256(logo_file.read()).hexdigest()
+
 
 # Funkcja pomocnicza do generowania QR kodów
 def generate_qr_code(link, table_id):
@@ -120,25 +992,11 @@ def generate_qr_code(link, table_id):
     qr_size = img.size[0]
     
     # Dodanie logo w środku QR kodu
-    logo = Image.open('static/images/PAPU_logo_bitmap.jpeg')
-    
-    # Konwersja logo do trybu RGBA
-    logo = logo.convert('RGBA')
-    
-    # Obliczenie rozmiaru logo proporcjonalnie do rozmiaru modułów QR kodu
-    # Każdy moduł ma 20x20 pikseli, więc logo będzie miało 9 modułów (180x180 pikseli)
-    logo_size = 9 * 20  # 9 modułów * 20 pikseli na moduł
-    
-    # Zmiana rozmiaru logo
-    logo = logo.resize((logo_size, logo_size))
-    
-    # Tworzenie białego obramowania
-    border_size = 1  # 1 moduł = 20 pikseli
-    bordered_logo = Image.new('RGBA', (logo_size + 2*border_size, logo_size + 2*border_size), (255, 255, 255, 255))
-    bordered_logo.paste(logo, (border_size, border_size), logo)
+    bordered_logo = _prepared_qr_logo()
+    logo_size = bordered_logo.size[0]
     
     # Obliczenie pozycji logo z obramowaniem (środek QR kodu)
-    pos = ((qr_size - (logo_size + 2*border_size)) // 2, (qr_size - (logo_size + 2*border_size)) // 2)
+    pos = ((qr_size - logo_size) // 2, (qr_size - logo_size) // 2)
     
     # Wklejenie logo z obramowaniem na QR kod z zachowaniem przezroczystości
     img.paste(bordered_logo, pos, bordered_logo)
@@ -146,10 +1004,89 @@ def generate_qr_code(link, table_id):
     return img
 
 
+def table_qr_link(table_id):
+    base_url = app.config['PUBLIC_BASE_URL']
+    if base_url:
+        return base_url.rstrip('/') + url_for('menu', table_id=table_id)
+    return url_for('menu', table_id=table_id, _external=True)
+
+
+def qr_code_path(link):
+    digest = hashlib.sha256(f"{QR_RENDER_VERSION}:{_qr_logo_fingerprint()}:{link}".encode()).hexdigest()[:24]
+    return os.path.join(app.config['QR_CODE_FOLDER'], f"{digest}.png")
+
+
+def _render_qr_file(link, path):
+    # Uruchamiane w procesach puli - zapis przez plik tymczasowy, żeby nie serwować niepełnego PNG
+    img = generate_qr_code(link, None)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    img.save(tmp_path, format='PNG', optimize=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def render_table_qr_codes(table_ids):
+    # Zwraca {table_id: ścieżka}. Brakujące kody renderujemy równolegle w puli procesów.
+    os.makedirs(app.config['QR_CODE_FOLDER'], exist_ok=True)
+    paths = {}
+    missing = []
+    for table_id in table_ids:
+        link = table_qr_link(table_id)
+        path = qr_code_path(link)
+        paths[table_id] = path
+        if not os.path.exists(path):
+            missing.append((link, path))
+
+    if len(missing) == 1:
+        _render_qr_file(*missing[0])
+    elif missing:
+        # Procesy startowane przez "spawn", nie fork: wywołujemy to z wątku kolejki zadań lub żądania,
+        # a fork procesu z wątkami kopiuje zajęte przez nie blokady (pula połączeń, logowanie)
+        # i proces potomny może się na nich zawiesić
+        workers = max(1, min(app.config['QR_RENDER_WORKERS'], len(missing)))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            list(pool.map(_render_qr_file, *zip(*missing)))
+
+    return paths
+
+
+@job_handler('render_qr_codes', max_attempts=3)
+def render_qr_codes_job(payload):
+    # Adresy w kodach budujemy jak w requeście, który zlecił zadanie (chyba że ustawiono PUBLIC_BASE_URL)
+    with app.test_request_context(base_url=payload['base_url']):
+        render_table_qr_codes(payload['table_ids'])
+
+
 # Modele bazy danych
 class Table(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     qr_code = db.Column(db.String(100), unique=True)
+    # Stoliki usunięte, do których odwołują się stare zamówienia, zostają w bazie jako nieaktywne
+    active = db.Column(db.Boolean, default=True, nullable=False)
+
+# Lokale restauracji - gość zamawiający przy stoliku musi być w promieniu onsite_radius_m od lokalu
+class Venue(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    onsite_radius_m = db.Column(db.Float, nullable=False, default=100)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    delivery_zones = db.relationship('DeliveryZone', backref='venue', lazy=True)
+
+# Strefa dostaw lokalu: wielokąt i/lub lista kodów pocztowych
+class DeliveryZone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    fee = db.Column(db.Float, nullable=False, default=0)
+    # Współrzędne jak w GeoJSON Polygon: [[[lon, lat], ...], ...otwory]
+    polygon = db.Column(db.Text, nullable=True)
+    # Kody oddzielone przecinkami, np. "42-600, 42-605"
+    postal_codes = db.Column(db.Text, nullable=True)
+    # Przy nakładających się strefach wygrywa niższy priorytet
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    active = db.Column(db.Boolean, nullable=False, default=True)
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -175,7 +1112,7 @@ class MenuItem(db.Model):
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     table_id = db.Column(db.Integer, db.ForeignKey('table.id'), nullable=True)
-    status = db.Column(db.String(50), default='Pending')
+    status = db.Column(db.String(50), default='Pending', index=True)
     total_price = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     order_items = db.relationship('OrderItem', backref='order', lazy=True)
@@ -193,36 +1130,115 @@ class Order(db.Model):
     delivery_address = db.Column(db.String(255), nullable=True)
     delivery_postal = db.Column(db.String(20), nullable=True)
     delivery_comments = db.Column(db.Text, nullable=True)
+    delivery_zone_id = db.Column(db.Integer, db.ForeignKey('delivery_zone.id'), nullable=True)
+    delivery_fee = db.Column(db.Float, nullable=True)
+    # Numer wersji zmiany - rośnie przy każdej zmianie statusu, wezwania lub rachunku
+    version = db.Column(db.BigInteger, nullable=True, index=True)
+
+    __table_args__ = (
+        # Historia zamówień: filtr po statusie + stronicowanie po (created_at, id) od najnowszych
+        db.Index('ix_order_status_created_at_id', status, created_at.desc(), id.desc()),
+    )
 
     @staticmethod
-    def generate_order_number():
-        # Definiujemy strefę czasową
-        timezone = pytz.timezone('Europe/Warsaw')
-        today = datetime.now(timezone).date()
-
-        # Znalezienie maksymalnego numeru zamówienia dla bieżącego dnia
-        last_order_number = db.session.query(func.max(Order.order_number)).filter(
-            func.date(Order.created_at) == today
+    def generate_order_number(connection):
+        # Dzień roboczy liczymy w strefie Europe/Warsaw, niezależnie od strefy serwera
+        business_day = datetime.now(pytz.timezone('Europe/Warsaw')).date()
+        return DailyOrderCounter.allocate(connection, business_day)
+
+
+# Licznik numerów zamówień - jeden wiersz na dzień roboczy
+class DailyOrderCounter(db.Model):
+    business_day = db.Column(db.Date, primary_key=True)
+    last_number = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def allocate(connection, business_day):
+        counters = DailyOrderCounter.__table__
+        if connection.dialect.name == 'postgresql':
+            # Atomowy upsert - równoległe zamówienia czekają na blokadę wiersza dnia
+            statement = postgresql_insert(counters).values(business_day=business_day, last_number=1)
+            statement = statement.on_conflict_do_update(
+                index_elements=[counters.c.business_day],
+                set_={'last_number': counters.c.last_number + 1}
+            ).returning(counters.c.last_number)
+            return connection.execute(statement).scalar()
+
+        # SQLite i inne bazy: UPDATE bierze blokadę zapisu, INSERT tylko dla pierwszego zamówienia dnia
+        updated = connection.execute(
+            counters.update()
+            .where(counters.c.business_day == business_day)
+            .values(last_number=counters.c.last_number + 1)
+        )
+        if updated.rowcount == 0:
+            connection.execute(counters.insert().values(business_day=business_day, last_number=1))
+        return connection.execute(
+            db.select(counters.c.last_number).where(counters.c.business_day == business_day)
         ).scalar()
 
-        # Jeśli brak zamówień na dzisiejszy dzień, zaczynamy od 1; w przeciwnym razie zwiększamy numer
-        return 1 if last_order_number is None else last_order_number + 1
 
 # Event do ustawienia order_number dla nowego zamówienia
 @event.listens_for(Order, 'before_insert')
 def set_order_number(mapper, connection, target):
-    target.order_number = Order.generate_order_number()
+    target.order_number = Order.generate_order_number(connection)
 
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), index=True)
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'))
     quantity = db.Column(db.Integer)
     customization = db.Column(db.String(200))
     takeaway = db.Column(db.Boolean, default=False)
+    # Ustawiane przy oznaczeniu całej partii jako gotowej na tablicy produkcji kuchni
+    prepared_at = db.Column(db.DateTime, nullable=True)
+    # Cena dania w chwili zamówienia (bez opłaty za wynos) - raporty nie zależą od późniejszych zmian cen
+    unit_price = db.Column(db.Numeric(10, 2), nullable=True)
     menu_item = db.relationship('MenuItem')
 
+
+# Dziennik zmian statusu zamówień - tylko dopisywanie, zapisywany paczkami w tle (OrderEventWriter)
+class OrderStatusEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_order_status_event_order_id_created_at', 'order_id', 'created_at'),
+    )
+
+
+# Zagregowana sprzedaż - raporty czytają tylko tabele *Rollup, nigdy order/order_item.
+# bucket_start to początek godziny lub dnia w czasie lokalnym Warszawy, channel: table/online/delivery
+class SalesRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    channel = db.Column(db.String(10), nullable=False)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    tips = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('period', 'bucket_start', 'channel', name='uq_sales_rollup_bucket'),
+    )
+
+
+class CategorySalesRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    channel = db.Column(db.String(10), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('period', 'bucket_start', 'channel', 'category', name='uq_category_sales_rollup_bucket'),
+    )
+
+
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -238,72 +1254,1333 @@ class Popup(db.Model):
     image_filename = db.Column(db.String(500), nullable=False)
     is_active = db.Column(db.Boolean, default=True)  # Nowe pole
 
+# Przeskalowane warianty wgranych zdjęć (WebP + JPEG)
+class ImageVariant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source_filename = db.Column(db.String(500), nullable=False, index=True)
+    filename = db.Column(db.String(600), nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+
+# Kolejka zadań w tle (Stripe, zdjęcia, kody QR) - trwała, więc przetrwa restart procesu
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Publiczny identyfikator do API statusu - nie da się zgadnąć cudzych zadań
+    public_id = db.Column(db.String(32), unique=True, nullable=False, default=lambda: uuid.uuid4().hex)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # Ten sam klucz = to samo zadanie (np. powrót z płatności odświeżony przez klienta)
+    dedupe_key = db.Column(db.String(200), unique=True, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+
+# Płatność online w Stripe. Koszyk zapisujemy przed przekierowaniem do Stripe, a zamówienie
+# powstaje dopiero z webhooka - unikalne stripe_session_id gwarantuje jedno zamówienie na sesję.
+class CheckoutSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Przekazywany do Stripe w metadanych sesji i używany w publicznym API statusu
+    public_id = db.Column(db.String(32), unique=True, nullable=False, default=lambda: uuid.uuid4().hex)
+    stripe_session_id = db.Column(db.String(255), unique=True, nullable=True)
+    # creating -> open -> paid / expired / failed
+    status = db.Column(db.String(20), nullable=False, default='creating')
+    # JSON: {"table_id", "items": [wiersze order_item], "delivery_info"}
+    cart = db.Column(db.Text, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), unique=True, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+
+# Wspólne kubełki limitów żądań (RATE_LIMIT_BACKEND="database"); czas jako znacznik epoki w sekundach
+class RateLimitBucket(db.Model):
+    key = db.Column(db.String(200), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+
+# Liczniki wersji zmian (np. "orders") - jeden wiersz na licznik
+class ChangeCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+def next_change_version(connection, name):
+    # UPDATE ... RETURNING blokuje wiersz licznika do końca transakcji,
+    # więc wersje są widoczne dla innych w kolejności commitów
+    counters = ChangeCounter.__table__
+    value = connection.execute(
+        counters.update()
+        .where(counters.c.name == name)
+        .values(value=counters.c.value + 1)
+        .returning(counters.c.value)
+    ).scalar()
+    if value is None:
+        connection.execute(counters.insert().values(name=name, value=1))
+        value = 1
+    return value
+
+
+def current_change_version(name):
+    return db.session.query(ChangeCounter.value).filter_by(name=name).scalar() or 0
+
+
+ORDER_VERSIONED_FIELDS = (
+    'status', 'call_waiter', 'request_bill', 'bill_payment_method',
+    'tip', 'nip', 'estimated_completion_time', 'last_call_time'
+)
+
+
+@event.listens_for(db.session, 'before_flush')
+def bump_order_versions(session, flush_context, instances):
+    changed_orders = [obj for obj in session.new if isinstance(obj, Order)]
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            state = db.inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in ORDER_VERSIONED_FIELDS):
+                changed_orders.append(obj)
+
+    if changed_orders:
+        # Jedna wersja na flush - wszystkie zmienione zamówienia dostają ten sam numer
+        version = next_change_version(session.connection(), 'orders')
+        for order in changed_orders:
+            order.version = version
+
+
+# Zapis zdarzeń statusu paczkami: po commicie trafiają do bufora w pamięci, a wątek w tle
+# wstawia je jednym INSERT-em co ORDER_EVENT_FLUSH_INTERVAL sekund (lub gdy uzbiera się paczka).
+# Przy awarii procesu możemy stracić zdarzenia z ostatnich sekund - to dane analityczne.
+class OrderEventWriter:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def add(self, events):
+        with self._condition:
+            self._pending.extend(events)
+            overflow = len(self._pending) - app.config['ORDER_EVENT_BUFFER_LIMIT']
+            for _ in range(max(overflow, 0)):
+                self._pending.popleft()
+            if len(self._pending) >= app.config['ORDER_EVENT_BATCH_SIZE']:
+                self._condition.notify()
+            self._ensure_thread()
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                with self._condition:
+                    batch = [self._pending.popleft()
+                             for _ in range(min(len(self._pending), app.config['ORDER_EVENT_BATCH_SIZE']))]
+                if not batch:
+                    return
+                try:
+                    with app.app_context():
+                        db.session.execute(db.insert(OrderStatusEvent), batch)
+                        db.session.commit()
+                except Exception as e:
+                    print(f"Błąd zapisu dziennika statusów zamówień: {e}")
+                    with self._condition:
+                        self._pending.extendleft(reversed(batch))
+                    return
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='order-events', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(app.config['ORDER_EVENT_FLUSH_INTERVAL'])
+            self.flush()
+
+
+order_event_writer = OrderEventWriter()
+atexit.register(order_event_writer.flush)
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_order_status_events(session, flush_context, instances):
+    now = datetime.utcnow()
+    changed = [obj for obj in session.new if isinstance(obj, Order)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, Order) and db.inspect(obj).attrs.status.history.has_changes()]
+    if changed:
+        session.info.setdefault('order_status_changes', []).extend((order, now) for order in changed)
+
+
+@event.listens_for(db.session, 'after_flush')
+def resolve_order_status_events(session, flush_context):
+    # Dopiero po flushu nowe zamówienia mają id
+    changes = session.info.pop('order_status_changes', None)
+    if changes:
+        session.info.setdefault('order_status_events', []).extend(
+            {'order_id': order.id, 'status': order.status or 'Pending', 'created_at': created_at}
+            for order, created_at in changes
+        )
+
+
+@event.listens_for(db.session, 'after_commit')
+def queue_order_status_events(session):
+    events = session.info.pop('order_status_events', None)
+    if events:
+        kitchen_eta.apply_events(events)
+        order_event_writer.add(events)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_order_status_events(session):
+    session.info.pop('order_status_changes', None)
+    session.info.pop('order_status_events', None)
+
+
+# Prognoza czasu realizacji zamówień na podstawie kolejki kuchni i historycznych czasów dań.
+# Czas dania to wygładzony (EWMA) czas od "In Preparation" do "Ready"; dania jednego zamówienia
+# przygotowywane są równolegle, więc zamówienie trwa tyle, co jego najwolniejsze danie.
+# Kolejka i czasy dań są aktualizowane przyrostowo po każdym commicie zmiany statusu,
+# a co ORDER_ETA_QUEUE_RESYNC sekund kolejka jest odczytywana z bazy (zmiany z innych workerów).
+KitchenQueueEntry = namedtuple('KitchenQueueEntry', ['status', 'items', 'started_at'])
+
+
+class KitchenEtaEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item_prep = {}
+        self._fallback_prep = None
+        self._queue = OrderedDict()
+        self._queue_loaded_at = None
+        self._history_loaded_at = None
+
+    def apply_events(self, events):
+        with self._lock:
+            for event in events:
+                order_id, status = event['order_id'], event['status']
+                entry = self._queue.get(order_id)
+                if status == 'Accepted':
+                    self._queue[order_id] = KitchenQueueEntry(status, None, None)
+                elif status == 'In Preparation':
+                    items = entry.items if entry else None
+                    self._queue[order_id] = KitchenQueueEntry(status, items, event['created_at'])
+                else:
+                    self._queue.pop(order_id, None)
+                    if status == 'Ready' and entry and entry.started_at and entry.items:
+                        self._learn(entry.items, (event['created_at'] - entry.started_at).total_seconds())
+
+    def suggest_minutes(self, order):
+        # Propozycja czasu realizacji dla kelnera przyjmującego zamówienie
+        seconds = self._predict_seconds(order.id, [item.menu_item_id for item in order.order_items])
+        return max(math.ceil(seconds / 60), 1)
+
+    def predicted_completion(self, order):
+        if order.status not in ['Pending'] + KITCHEN_ORDER_STATUSES:
+            return None
+        items = [item.menu_item_id for item in order.order_items] if order.status == 'Pending' else None
+        return datetime.utcnow() + timedelta(seconds=self._predict_seconds(order.id, items))
+
+    def _predict_seconds(self, order_id, items):
+        self._refresh()
+        now = datetime.utcnow()
+        with self._lock:
+            work_ahead = 0.0
+            for queued_id, entry in self._queue.items():
+                remaining = self._remaining(entry, now)
+                if queued_id == order_id:
+                    if entry.status == 'In Preparation':
+                        return remaining
+                    return work_ahead / app.config['KITCHEN_PARALLEL_ORDERS'] + remaining
+                work_ahead += remaining
+            return work_ahead / app.config['KITCHEN_PARALLEL_ORDERS'] + self._order_prep(items)
+
+    def _remaining(self, entry, now):
+        prep = self._order_prep(entry.items)
+        if entry.started_at:
+            return max(prep - (now - entry.started_at).total_seconds(), 0)
+        return prep
+
+    def _order_prep(self, items):
+        default = self._fallback_prep or app.config['ORDER_ETA_DEFAULT_PREP_MINUTES'] * 60
+        if not items:
+            return default
+        return max(self._item_prep.get(item, default) for item in items)
+
+    def _learn(self, items, duration):
+        # Przy kilku daniach czas zamówienia przypisujemy najwolniejszemu z nich
+        default = self._fallback_prep or app.config['ORDER_ETA_DEFAULT_PREP_MINUTES'] * 60
+        bottleneck = max(set(items), key=lambda item: self._item_prep.get(item, default))
+        current = self._item_prep.get(bottleneck, default)
+        self._item_prep[bottleneck] = current + app.config['ORDER_ETA_SMOOTHING'] * (duration - current)
+
+    def _refresh(self):
+        with primary_reads():
+            self._refresh_stale()
+
+    def _refresh_stale(self):
+        now = time.monotonic()
+        if self._history_loaded_at is None or now - self._history_loaded_at > app.config['ORDER_ETA_HISTORY_REFRESH']:
+            self._load_history()
+            self._history_loaded_at = now
+        if self._queue_loaded_at is None or now - self._queue_loaded_at > app.config['ORDER_ETA_QUEUE_RESYNC']:
+            self._load_queue()
+            self._queue_loaded_at = now
+        elif any(entry.items is None for entry in self._queue.values()):
+            self._load_queue_items()
+
+    def _load_history(self):
+        # Mediana czasu przygotowania każdego dania z ostatnich dni (najpierw z zamówień z jednym daniem)
+        events = OrderStatusEvent.__table__
+        stages = db.select(
+            events.c.order_id,
+            events.c.status,
+            events.c.created_at.label('started_at'),
+            func.lead(events.c.created_at, type_=db.DateTime).over(
+                partition_by=events.c.order_id, order_by=(events.c.created_at, events.c.id)).label('ended_at'),
+            func.lead(events.c.status).over(
+                partition_by=events.c.order_id, order_by=(events.c.created_at, events.c.id)).label('next_status'),
+        ).where(events.c.created_at >= datetime.utcnow() - timedelta(days=app.config['ORDER_ETA_HISTORY_DAYS'])).subquery()
+        stmt = db.select(stages.c.order_id, stages.c.started_at, stages.c.ended_at, OrderItem.menu_item_id)\
+            .join(OrderItem, OrderItem.order_id == stages.c.order_id)\
+            .where(stages.c.status == 'In Preparation', stages.c.next_status == 'Ready')\
+            .order_by(stages.c.order_id)
+
+        single, mixed, everything = {}, {}, []
+        for _, lines in groupby(db.session.execute(stmt), key=attrgetter('order_id')):
+            lines = list(lines)
+            duration = (lines[0].ended_at - lines[0].started_at).total_seconds()
+            items = {line.menu_item_id for line in lines}
+            everything.append(duration)
+            target = single if len(items) == 1 else mixed
+            for item in items:
+                target.setdefault(item, []).append(duration)
+
+        item_prep = {item: percentile(sorted(values), 50) for item, values in mixed.items()}
+        item_prep.update({item: percentile(sorted(values), 50) for item, values in single.items()})
+        with self._lock:
+            self._item_prep = item_prep
+            self._fallback_prep = percentile(sorted(everything), 50) if everything else None
+
+    def _load_queue(self):
+        orders = db.session.execute(
+            db.select(Order.id, Order.status).where(Order.status.in_(KITCHEN_ORDER_STATUSES)).order_by(Order.id)
+        ).all()
+        order_ids = [order.id for order in orders]
+        items = self._fetch_items(order_ids)
+        started = dict(db.session.execute(
+            db.select(OrderStatusEvent.order_id, func.max(OrderStatusEvent.created_at))
+            .where(OrderStatusEvent.order_id.in_(order_ids), OrderStatusEvent.status == 'In Preparation')
+            .group_by(OrderStatusEvent.order_id)
+        ).all()) if order_ids else {}
+
+        with self._lock:
+            queue = OrderedDict()
+            for order in orders:
+                previous = self._queue.get(order.id)
+                started_at = None
+                if order.status == 'In Preparation':
+                    # Zdarzenie może jeszcze czekać w buforze OrderEventWriter
+                    started_at = started.get(order.id) or (previous.started_at if previous else None) or datetime.utcnow()
+                queue[order.id] = KitchenQueueEntry(order.status, items.get(order.id, []), started_at)
+            self._queue = queue
+
+    def _load_queue_items(self):
+        with self._lock:
+            missing = [order_id for order_id, entry in self._queue.items() if entry.items is None]
+        items = self._fetch_items(missing)
+        with self._lock:
+            for order_id in missing:
+                entry = self._queue.get(order_id)
+                if entry and entry.items is None:
+                    self._queue[order_id] = entry._replace(items=items.get(order_id, []))
+
+    def _fetch_items(self, order_ids):
+        items = {}
+        if order_ids:
+            for order_id, menu_item_id in db.session.execute(
+                db.select(OrderItem.order_id, OrderItem.menu_item_id).where(OrderItem.order_id.in_(order_ids))
+            ):
+                items.setdefault(order_id, []).append(menu_item_id)
+        return items
+
+
+kitchen_eta = KitchenEtaEngine()
+
+
+# Wspólna serializacja zamówień dla tablic kelnera i kuchni
+WARSAW_TZ = pytz.timezone('Europe/Warsaw')
+ACTIVE_ORDER_STATUSES = ["Pending", "Accepted", "In Preparation", "Ready"]
+KITCHEN_ORDER_STATUSES = ["Accepted", "In Preparation"]
+
+
+def to_warsaw_time(value, fmt="%H:%M"):
+    # Daty w bazie są zapisywane w UTC bez strefy czasowej
+    if value is None:
+        return None
+    return value.replace(tzinfo=pytz.utc).astimezone(WARSAW_TZ).strftime(fmt)
+
+
+def load_board_orders(statuses, since=None):
+    # Dwa zapytania niezależnie od liczby zamówień: zamówienia oraz pozycje z daniami (JOIN).
+    # Z `since` zwracamy wszystkie zamówienia zmienione po tej wersji, także te, które opuściły tablicę.
+    query = Order.query.options(selectinload(Order.order_items).joinedload(OrderItem.menu_item))
+    if since is None:
+        query = query.filter(Order.status.in_(statuses))
+    else:
+        query = query.filter(Order.version > since)
+    return query.order_by(Order.id).all()
+
+
+def serialize_board_order(order):
+    return {
+        "order_id": order.id,
+        "order_number": order.order_number,
+        "table_id": order.table_id,
+        "status": order.status,
+        "total_price": order.total_price,
+        "order_time": to_warsaw_time(order.created_at),
+        "delivery_name": order.delivery_name,
+        "delivery_phone": order.delivery_phone,
+        "delivery_address": order.delivery_address,
+        "delivery_postal": order.delivery_postal,
+        "delivery_comments": order.delivery_comments,
+        "items": [
+            {
+                "name": item.menu_item.name,
+                "quantity": item.quantity,
+                "price": item.menu_item.price,
+                "customization": item.customization,
+                "takeaway": item.takeaway,
+                "prepared": item.prepared_at is not None
+            }
+            for item in order.order_items
+        ]
+    }
+
+
+def serialize_order_calls(order):
+    calls = []
+    if order.call_waiter:
+        calls.append({
+            "order_id": order.id,
+            "order_number": order.order_number,
+            "table_id": order.table_id,
+            "call_type": "Wezwanie kelnera",
+            "call_time": to_warsaw_time(order.last_call_time, "%H:%M:%S"),
+            "payment_method": None,
+            "tip": None,
+            "nip": None
+        })
+    if order.request_bill:
+        calls.append({
+            "order_id": order.id,
+            "order_number": order.order_number,
+            "table_id": order.table_id,
+            "call_type": "Prośba o rachunek",
+            "call_time": to_warsaw_time(order.last_call_time, "%H:%M:%S"),
+            "payment_method": order.bill_payment_method,
+            "tip": order.tip,
+            "nip": order.nip
+        })
+    return calls
+
+
+# Katalog menu w pamięci procesu
+# (etykieta na stronie, kategoria w bazie) - w kolejności wyświetlania
+MENU_CATEGORIES = [
+    ("Lunch Dnia", "Lunch dnia"),
+    ("Deser Dnia", "Deser dnia"),
+    ("Przystawki", "Przystawki"),
+    ("Śniadania", "Śniadania"),
+    ("Kanapki", "Kanapki"),
+    ("Zupy", "Zupy"),
+    ("Bowle", "Bowle"),
+    ("Dania główne", "Dania główne"),
+    ("Dania dla dzieci", "Dania dla dzieci"),
+    ("Sałatki", "Sałatki"),
+    ("Desery", "Desery"),
+    ("Napoje Ciepłe", "Napoje ciepłe"),
+    ("Napoje Zimne", "Napoje zimne"),
+    ("Napoje Specjalne", "Napoje specjalne"),
+    ("Alkohole", "Alkohole"),
+]
+
+# Niezmienna kopia wiersza MenuItem - bezpieczna do współdzielenia między requestami
+MenuEntry = namedtuple('MenuEntry', [
+    'id', 'name', 'description', 'price', 'customizable', 'contains_alcohol',
+    'category', 'image_filename', 'display_date', 'available'
+])
+
+
+# Odczyty z replik. Widok oznaczony @read_replica czyta z losowej repliki (jednej na całe żądanie),
+# chyba że klient niedawno coś zapisał - wtedy ciasteczko kieruje go do bazy głównej.
+READ_REPLICA_COOKIE = 'db_primary_until'
+
+
+def read_replica(f):
+    f.read_replica = True
+    return f
+
+
+@contextmanager
+def primary_reads():
+    # Dane do cache całego procesu czytamy z bazy głównej - odczyt z opóźnionej repliki
+    # zostałby zapamiętany pod nowszą wersją licznika zmian i nie odświeżył się aż do kolejnej zmiany
+    session = db.session()
+    replica = session.info.pop('db_replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None and 'db_replica' not in session.info and not session.info.get('db_wrote'):
+            session.info['db_replica'] = replica
+
+
+@app.before_request
+def route_reads_to_replica():
+    if not app.config['READ_REPLICA_KEYS'] or request.endpoint is None:
+        return
+    if not getattr(app.view_functions.get(request.endpoint), 'read_replica', False):
+        return
+    try:
+        primary_until = float(request.cookies.get(READ_REPLICA_COOKIE, 0))
+    except ValueError:
+        primary_until = 0
+    if primary_until > time.time():
+        return
+    db.session().info['db_replica'] = random.choice(app.config['READ_REPLICA_KEYS'])
+
+
+@event.listens_for(db.session, 'after_flush')
+def remember_flush_write(session, flush_context):
+    session.info['db_wrote'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def remember_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['db_wrote'] = True
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_rolled_back_write(session):
+    session.info.pop('db_wrote', None)
+
+
+@app.after_request
+def stick_to_primary_after_write(response):
+    if app.config['READ_REPLICA_KEYS'] and db.session().info.get('db_wrote'):
+        sticky_seconds = app.config['READ_REPLICA_STICKY_SECONDS']
+        response.set_cookie(READ_REPLICA_COOKIE, str(int(time.time()) + sticky_seconds),
+                            max_age=sticky_seconds, httponly=True, samesite='Lax')
+    return response
+
+
+# Wersje liczników zmian odczytywane jednym zapytaniem najwyżej raz na CACHE_VERSION_CHECK_INTERVAL
+class ChangeVersionMonitor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._checked_at = None
+
+    def expire(self):
+        self._checked_at = None
+
+    def get(self, name):
+        return self.versions().get(name, 0)
+
+    def versions(self):
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is None or now - checked_at >= app.config['CACHE_VERSION_CHECK_INTERVAL']:
+            with self._lock, primary_reads():
+                if self._checked_at == checked_at:
+                    self._versions = dict(db.session.query(ChangeCounter.name, ChangeCounter.value).all())
+                    self._checked_at = now
+        return self._versions
+
+
+change_versions = ChangeVersionMonitor()
+
+
+class MenuCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_category = {}
+        self._by_id = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def _ensure_fresh(self):
+        version = change_versions.get('menu')
+        if version == self._version:
+            return
+        with self._lock, primary_reads():
+            if version != self._version:
+                # Jedno zapytanie dla całego menu, grupowanie po kategorii w Pythonie
+                by_category = {}
+                by_id = {}
+                for item in MenuItem.query.order_by(MenuItem.id).all():
+                    entry = MenuEntry(
+                        id=item.id,
+                        name=item.name,
+                        description=item.description,
+                        price=item.price,
+                        customizable=item.customizable,
+                        contains_alcohol=item.contains_alcohol,
+                        category=item.category,
+                        image_filename=item.image_filename,
+                        display_date=item.display_date,
+                        available=item.available,
+                    )
+                    by_category.setdefault(item.category, []).append(entry)
+                    by_id[item.id] = entry
+                self._by_category = by_category
+                self._by_id = by_id
+                self._version = version
+
+    def categories(self):
+        self._ensure_fresh()
+        return {label: self._by_category.get(category, []) for label, category in MENU_CATEGORIES}
+
+    def items(self, category, available_only=False):
+        self._ensure_fresh()
+        items = self._by_category.get(category, [])
+        if available_only:
+            return [item for item in items if item.available]
+        return items
+
+    def get(self, item_id):
+        self._ensure_fresh()
+        return self._by_id.get(item_id)
+
+
+menu_catalog = MenuCatalog()
+
+
+# Cache wyrenderowanych stron publicznych z ETag/Last-Modified
+CachedPage = namedtuple('CachedPage', ['body', 'mimetype', 'etag', 'last_modified', 'expires_at'])
+
+
+class PageCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > app.config['PAGE_CACHE_MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache()
+
+
+class TableRegistry:
+    # Numery aktywnych stolików w pamięci procesu - walidacja w menu() bez zapytań do bazy
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._ids = ()
+        self._valid = frozenset()
+
+    def ids(self):
+        version = change_versions.get('tables')
+        if version != self._version:
+            with self._lock, primary_reads():
+                if version != self._version:
+                    self._ids = tuple(
+                        table_id for (table_id,) in
+                        db.session.query(Table.id).filter(Table.active == True).order_by(Table.id)
+                    )
+                    self._valid = frozenset(self._ids)
+                    self._version = version
+        return self._ids
+
+    def __contains__(self, table_id):
+        self.ids()
+        return table_id in self._valid
+
+
+table_registry = TableRegistry()
+
+
+# Lokale i strefy dostaw w pamięci procesu, z siatką komórek o boku LOCATION_GRID_CELL_DEG.
+# Każda komórka zna lokale i strefy, których obszar (prostokąt otaczający) na nią zachodzi,
+# więc dla punktu sprawdzamy tylko kilka wielokątów zamiast wszystkich.
+VenueEntry = namedtuple('VenueEntry', ['id', 'name', 'latitude', 'longitude', 'onsite_radius_m'])
+ZoneEntry = namedtuple('ZoneEntry', ['id', 'name', 'venue', 'fee', 'priority', 'rings', 'bbox'])
+LocationSnapshot = namedtuple('LocationSnapshot', ['cell', 'venues', 'venue_cells', 'zones', 'zone_cells', 'postal'])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))  # promień Ziemi w km
+
+
+def point_in_ring(lon, lat, ring):
+    # Ray casting - nieparzysta liczba przecięć półprostej z krawędziami oznacza punkt wewnątrz
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > lat) != (y2 > lat) and lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def normalize_postal_code(value):
+    # "42-600", "42600" i "42 600" to ten sam kod
+    return ''.join(ch for ch in str(value or '') if ch.isdigit())
+
+
+class LocationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = None
+
+    def _fresh(self):
+        version = change_versions.get('locations')
+        if version != self._version:
+            with self._lock, primary_reads():
+                if version != self._version:
+                    self._snapshot = self._build()
+                    self._version = version
+        return self._snapshot
+
+    @staticmethod
+    def _cells(cell, min_lat, min_lon, max_lat, max_lon):
+        for row in range(math.floor(min_lat / cell), math.floor(max_lat / cell) + 1):
+            for column in range(math.floor(min_lon / cell), math.floor(max_lon / cell) + 1):
+                yield row, column
+
+    def _build(self):
+        cell = app.config['LOCATION_GRID_CELL_DEG']
+        venues = {}
+        venue_cells = {}
+        for venue in Venue.query.filter_by(active=True).order_by(Venue.id):
+            entry = VenueEntry(venue.id, venue.name, venue.latitude, venue.longitude, venue.onsite_radius_m)
+            venues[venue.id] = entry
+            dlat = venue.onsite_radius_m / 111320
+            dlon = dlat / max(math.cos(math.radians(venue.latitude)), 0.01)
+            for key in self._cells(cell, venue.latitude - dlat, venue.longitude - dlon,
+                                   venue.latitude + dlat, venue.longitude + dlon):
+                venue_cells.setdefault(key, []).append(entry)
+
+        zones = []
+        zone_cells = {}
+        postal = {}
+        zone_rows = DeliveryZone.query\
+            .filter(DeliveryZone.active == True, DeliveryZone.venue_id.in_(list(venues)))\
+            .order_by(DeliveryZone.priority, DeliveryZone.id)
+        for zone in zone_rows:
+            rings = tuple(tuple(tuple(point) for point in ring) for ring in json.loads(zone.polygon)) if zone.polygon else ()
+            bbox = None
+            if rings:
+                lons = [lon for lon, _ in rings[0]]
+                lats = [lat for _, lat in rings[0]]
+                bbox = (min(lats), min(lons), max(lats), max(lons))
+            entry = ZoneEntry(zone.id, zone.name, venues[zone.venue_id], to_money(zone.fee), zone.priority, rings, bbox)
+            zones.append(entry)
+            if bbox:
+                for key in self._cells(cell, *bbox):
+                    zone_cells.setdefault(key, []).append(entry)
+            for code in (zone.postal_codes or '').split(','):
+                if normalize_postal_code(code):
+                    postal.setdefault(normalize_postal_code(code), []).append(entry)
+        return LocationSnapshot(cell, venues, venue_cells, zones, zone_cells, postal)
+
+    def has_venues(self):
+        return bool(self._fresh().venues)
+
+    def has_delivery_zones(self):
+        return bool(self._fresh().zones)
+
+    def onsite_venue(self, lat, lon):
+        snapshot = self._fresh()
+        key = (math.floor(lat / snapshot.cell), math.floor(lon / snapshot.cell))
+        for venue in snapshot.venue_cells.get(key, ()):
+            if haversine_km(lat, lon, venue.latitude, venue.longitude) * 1000 <= venue.onsite_radius_m:
+                return venue
+        return None
+
+    def delivery_zone(self, lat=None, lon=None, postal_code=None):
+        # Najpierw wielokąty (gdy znamy współrzędne), potem kod pocztowy; kandydaci są posortowani po priorytecie
+        snapshot = self._fresh()
+        if lat is not None and lon is not None:
+            key = (math.floor(lat / snapshot.cell), math.floor(lon / snapshot.cell))
+            for zone in snapshot.zone_cells.get(key, ()):
+                min_lat, min_lon, max_lat, max_lon = zone.bbox
+                if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                    continue
+                if point_in_ring(lon, lat, zone.rings[0]) \
+                        and not any(point_in_ring(lon, lat, hole) for hole in zone.rings[1:]):
+                    return zone
+        if postal_code:
+            zones = snapshot.postal.get(normalize_postal_code(postal_code))
+            if zones:
+                return zones[0]
+        return None
+
+
+location_index = LocationIndex()
+
+DeliveryQuote = namedtuple('DeliveryQuote', ['deliverable', 'zone', 'fee'])
+
+
+def quote_delivery(delivery_info):
+    # Strefa i opłata za dostawę pod adres z delivery_info ("latitude"/"longitude" i/lub "postal").
+    # Bez skonfigurowanych stref dowozimy wszędzie bez opłaty.
+    if not location_index.has_delivery_zones():
+        return DeliveryQuote(True, None, Decimal('0.00'))
+    try:
+        lat, lon = float(delivery_info['latitude']), float(delivery_info['longitude'])
+    except (KeyError, TypeError, ValueError):
+        lat = lon = None
+    zone = location_index.delivery_zone(lat, lon, delivery_info.get('postal'))
+    if zone is None:
+        return DeliveryQuote(False, None, None)
+    return DeliveryQuote(True, zone, zone.fee)
+
+
+def active_tables():
+    return Table.query.filter_by(active=True).order_by(Table.id).all()
+
+
+def cached_page(depends_on=()):
+    # Strony dla zalogowanych (panel, nawigacja z "Wyloguj") nie trafiają do cache
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            ttl = app.config['PAGE_CACHE_TTL']
+            if ttl <= 0 or current_user.is_authenticated:
+                return f(*args, **kwargs)
+
+            versions = tuple(change_versions.get(name) for name in depends_on)
+            key = (request.full_path, versions, datetime.now().date())
+            entry = page_cache.get(key)
+            if entry is None:
+                with primary_reads():
+                    response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = CachedPage(
+                    body=body,
+                    mimetype=response.mimetype,
+                    etag=hashlib.sha1(body).hexdigest(),
+                    last_modified=datetime.utcnow().replace(microsecond=0),
+                    expires_at=time.monotonic() + ttl,
+                )
+                page_cache.set(key, entry)
+
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            response.last_modified = entry.last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config['PAGE_CACHE_MAX_AGE']
+            return response.make_conditional(request)
+        return decorated_function
+    return decorator
+
+
+# Modele, których zmiana unieważnia cache treści (nazwa licznika zmian)
+CACHED_CONTENT_COUNTERS = {
+    Table: 'tables',
+    MenuItem: 'menu',
+    Event: 'events',
+    Popup: 'popup',
+    ImageVariant: 'images',
+    Venue: 'locations',
+    DeliveryZone: 'locations',
+}
+
+
+@event.listens_for(db.session, 'before_flush')
+def bump_content_versions(session, flush_context, instances):
+    touched = session.new | session.dirty | session.deleted
+    names = {CACHED_CONTENT_COUNTERS[type(obj)] for obj in touched if type(obj) in CACHED_CONTENT_COUNTERS}
+    for name in sorted(names):
+        next_change_version(session.connection(), name)
+    if names:
+        session.info.setdefault('changed_content', set()).update(names)
+
+
+def mark_content_changed(name):
+    # Dla masowych UPDATE/DELETE, które omijają before_flush
+    next_change_version(db.session.connection(), name)
+    db.session.info.setdefault('changed_content', set()).add(name)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_content_caches(session):
+    names = session.info.pop('changed_content', None)
+    if names:
+        change_versions.expire()
+        if 'menu' in names:
+            menu_catalog.invalidate()
+        page_cache.clear()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_content_changes(session):
+    session.info.pop('changed_content', None)
+
+
+# Przetwarzanie wgranych zdjęć: warianty WebP/JPEG w kilku szerokościach, bez metadanych EXIF
+IMAGE_VARIANT_FORMATS = (
+    ('webp', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+def process_uploaded_image(filename):
+    source_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    variant_folder = app.config['IMAGE_VARIANT_FOLDER']
+    os.makedirs(variant_folder, exist_ok=True)
+
+    widths = sorted(app.config['IMAGE_VARIANT_WIDTHS'])
+    with Image.open(source_path) as source:
+        # Dekoder JPEG może od razu zmniejszyć zdjęcie z aparatu do największej potrzebnej szerokości
+        source.draft('RGB', (widths[-1], widths[-1]))
+        # Obracamy zgodnie z orientacją z EXIF, bo same metadane nie trafią do wariantów
+        image = ImageOps.exif_transpose(source).convert('RGB')
+
+    # Nie powiększamy zdjęć - mniejsze od najmniejszej szerokości dostają jeden wariant
+    target_widths = [width for width in widths if width < image.width] or [image.width]
+    if image.width <= widths[-1] and image.width not in target_widths:
+        target_widths.append(image.width)
+
+    variants = []
+    for width in target_widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for image_format, extension, options in IMAGE_VARIANT_FORMATS:
+            variant_filename = f"{filename}.{width}.{extension}"
+            variant_path = os.path.join(variant_folder, variant_filename)
+            # Zapis bez exif= usuwa metadane (GPS, model aparatu)
+            resized.save(variant_path, format=image_format.upper(), **options)
+            variants.append(ImageVariant(
+                source_filename=filename,
+                filename=variant_filename,
+                format=image_format,
+                width=width,
+                height=height,
+                size_bytes=os.path.getsize(variant_path),
+            ))
+
+    ImageVariant.query.filter_by(source_filename=filename).delete()
+    db.session.add_all(variants)
+    db.session.commit()
+
+
+@job_handler('image_variants', max_attempts=3)
+def image_variants_job(payload):
+    if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], payload['filename'])):
+        raise PermanentJobError(f"Brak pliku {payload['filename']}")
+    process_uploaded_image(payload['filename'])
+
+
+def schedule_image_variants(filename):
+    # Przetwarzanie w kolejce zadań - do czasu zakończenia serwujemy oryginał.
+    # Zadanie zapisuje się razem z transakcją requestu (commit wywołuje handler).
+    enqueue_job('image_variants', {'filename': filename})
+
+
+def remove_image_variants(filename):
+    for variant in ImageVariant.query.filter_by(source_filename=filename).all():
+        variant_path = os.path.join(app.config['IMAGE_VARIANT_FOLDER'], variant.filename)
+        if os.path.exists(variant_path):
+            os.remove(variant_path)
+        db.session.delete(variant)
+
+
+class ImageVariantIndex:
+    # Wszystkie warianty w pamięci procesu, odświeżane po zmianie licznika "images"
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_source = {}
+
+    def get(self, filename):
+        version = change_versions.get('images')
+        if version != self._version:
+            with self._lock, primary_reads():
+                if version != self._version:
+                    by_source = {}
+                    for variant in ImageVariant.query.order_by(ImageVariant.width).all():
+                        by_source.setdefault(variant.source_filename, []).append(
+                            (variant.format, variant.width, variant.filename)
+                        )
+                    self._by_source = by_source
+                    self._version = version
+        return self._by_source.get(filename, [])
+
+
+image_variant_index = ImageVariantIndex()
+
+
+def choose_image_variant(filename, width, accepts_webp):
+    # Najmniejszy wariant nie węższy niż `width`; bez `width` - największy
+    image_format = 'webp' if accepts_webp else 'jpeg'
+    candidates = [v for v in image_variant_index.get(filename) if v[0] == image_format]
+    if not candidates:
+        return None
+    if width:
+        for candidate in candidates:
+            if candidate[1] >= width:
+                return candidate[2]
+    return candidates[-1][2]
+
+
+@app.template_global()
+def image_srcset(filename):
+    widths = sorted({v[1] for v in image_variant_index.get(filename)})
+    return ", ".join(f"{url_for('uploaded_file', filename=filename, w=width)} {width}w" for width in widths)
+
+
+def versioned_board_response(name, build):
+    # ETag odpowiada wersji zmian zamówień - przy braku zmian odpowiadamy 304 bez pobierania zamówień.
+    # `?since=<wersja>` zwraca tylko zamówienia zmienione/usunięte po tej wersji.
+    version = current_change_version('orders')
+    etag = f"{name}-{version}"
+    since = request.args.get('since', type=int)
+
+    if etag in request.if_none_match or (since is not None and since >= version):
+        response = Response(status=304)
+    else:
+        response = build(since)
+        if since is not None:
+            response = jsonify({"version": version, **response})
+        else:
+            response = jsonify(response)
+
+    response.set_etag(etag)
+    response.headers['X-Change-Version'] = str(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def board_orders_payload(statuses, since):
+    orders = load_board_orders(statuses, since)
+    if since is None:
+        return [serialize_board_order(order) for order in orders]
+    return {
+        "changed": [serialize_board_order(order) for order in orders if order.status in statuses],
+        "removed": [order.id for order in orders if order.status not in statuses]
+    }
+
 # @app.route("/")
 # def index():
 #     return "Hello, Vercel!"
 
 @app.route('/check_location', methods=['POST'])
+@rate_limit('check_location:ip', client_ip)
+@rate_limit('check_location:all', all_clients)
 def check_location():
-    data = request.json
-    user_lat = data.get("latitude")
-    user_lon = data.get("longitude")
-
-
-    #dom wir
-    # RESTAURANT_LAT = 50.7576195578944
-    # RESTAURANT_LON = 19.10046215844812
-
-    #dom ngw
-    # RESTAURANT_LAT = 50.05538783157192
-    # RESTAURANT_LON = 21.467076217640532
-    # Współrzędne restauracji
-    RESTAURANT_LAT = 50.83174207392536
-    RESTAURANT_LON = 19.08261400134686
-    MAX_DISTANCE_KM = 0.1  # 100 metrów od restauracji
-
-    def haversine(lat1, lon1, lat2, lon2):
-        from math import radians, sin, cos, sqrt, atan2
-        R = 6371  # promień Ziemi w km
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat/2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        return R * c
-
-    distance = haversine(user_lat, user_lon, RESTAURANT_LAT, RESTAURANT_LON)
-    return jsonify({"allowed": distance < MAX_DISTANCE_KM})
+    # Czy gość przy stoliku jest w którymś z lokali (w promieniu onsite_radius_m)
+    data = request.json or {}
+    try:
+        user_lat = float(data.get("latitude"))
+        user_lon = float(data.get("longitude"))
+    except (TypeError, ValueError):
+        return jsonify({"allowed": False, "venue_id": None}), 400
+
+    if not location_index.has_venues():
+        # Bez skonfigurowanych lokali nie ograniczamy zamawiania przy stoliku
+        return jsonify({"allowed": True, "venue_id": None})
+    venue = location_index.onsite_venue(user_lat, user_lon)
+    return jsonify({"allowed": venue is not None, "venue_id": venue.id if venue else None})
+
+
+def serialize_delivery_quote(quote):
+    zone = quote.zone
+    return {
+        "deliverable": quote.deliverable,
+        "venue": {"id": zone.venue.id, "name": zone.venue.name} if zone else None,
+        "zone": {"id": zone.id, "name": zone.name} if zone else None,
+        "fee": str(quote.fee) if quote.fee is not None else None,
+    }
+
+
+@app.route('/delivery_zone', methods=['GET'])
+@rate_limit('delivery_zone:ip', client_ip)
+@rate_limit('delivery_zone:all', all_clients)
+def delivery_zone_lookup():
+    # ?lat=..&lon=.. i/lub ?postal=42-600 - który lokal i strefa obsłużą dostawę i za jaką opłatą
+    delivery_info = {
+        'latitude': request.args.get('lat'),
+        'longitude': request.args.get('lon'),
+        'postal': request.args.get('postal'),
+    }
+    if not delivery_info['postal'] and (delivery_info['latitude'] is None or delivery_info['longitude'] is None):
+        return jsonify({"error": "Podaj współrzędne (lat, lon) albo kod pocztowy (postal)"}), 400
+    return jsonify(serialize_delivery_quote(quote_delivery(delivery_info)))
+
+
+def load_geojson_polygon(fh):
+    # Przyjmuje geometrię Polygon, Feature albo FeatureCollection (pierwszy obiekt), np. wyrysowaną w geojson.io
+    data = json.load(fh)
+    if data.get('type') == 'FeatureCollection':
+        data = data['features'][0] if data.get('features') else {}
+    if data.get('type') == 'Feature':
+        data = data.get('geometry') or {}
+    if data.get('type') != 'Polygon':
+        raise click.BadParameter("Oczekiwano geometrii typu Polygon.")
+    rings = [[[float(lon), float(lat)] for lon, lat, *_ in ring] for ring in data['coordinates']]
+    if not rings or any(len(ring) < 4 for ring in rings):
+        raise click.BadParameter("Każdy pierścień wielokąta musi mieć co najmniej 4 punkty.")
+    return rings
+
+
+@app.cli.command('add-venue', help='Dodaje lokal (współrzędne do sprawdzania, czy gość jest na miejscu).')
+@click.argument('name')
+@click.option('--lat', type=float, required=True)
+@click.option('--lon', type=float, required=True)
+@click.option('--radius', type=float, default=100, show_default=True, help='Promień lokalu w metrach.')
+def add_venue_command(name, lat, lon, radius):
+    venue = Venue(name=name, latitude=lat, longitude=lon, onsite_radius_m=radius)
+    db.session.add(venue)
+    db.session.commit()
+    click.echo(f"Dodano lokal #{venue.id} {venue.name}")
+
+
+@app.cli.command('add-delivery-zone', help='Dodaje strefę dostaw lokalu (wielokąt z pliku GeoJSON i/lub kody pocztowe).')
+@click.argument('venue_id', type=int)
+@click.argument('name')
+@click.option('--fee', type=float, default=0, show_default=True, help='Opłata za dostawę w PLN.')
+@click.option('--geojson', type=click.File('r', encoding='utf-8'), help='Plik z wielokątem strefy.')
+@click.option('--postal-codes', help='Kody pocztowe oddzielone przecinkami, np. "42-600,42-605".')
+@click.option('--priority', type=int, default=0, show_default=True, help='Przy nakładających się strefach wygrywa niższy.')
+def add_delivery_zone_command(venue_id, name, fee, geojson, postal_codes, priority):
+    if db.session.get(Venue, venue_id) is None:
+        raise click.BadParameter(f"Brak lokalu #{venue_id}")
+    if geojson is None and not postal_codes:
+        raise click.UsageError("Podaj --geojson i/lub --postal-codes.")
+    zone = DeliveryZone(
+        venue_id=venue_id,
+        name=name,
+        fee=fee,
+        polygon=json.dumps(load_geojson_polygon(geojson)) if geojson else None,
+        postal_codes=postal_codes,
+        priority=priority,
+    )
+    db.session.add(zone)
+    db.session.commit()
+    click.echo(f"Dodano strefę #{zone.id} {zone.name}")
+
+
+@app.cli.command('list-locations', help='Wypisuje lokale i ich strefy dostaw.')
+def list_locations_command():
+    for venue in Venue.query.order_by(Venue.id):
+        click.echo(f"#{venue.id} {venue.name} ({venue.latitude}, {venue.longitude}), promień {venue.onsite_radius_m:g} m"
+                   f"{'' if venue.active else ' [nieaktywny]'}")
+        for zone in sorted(venue.delivery_zones, key=attrgetter('priority', 'id')):
+            area = []
+            if zone.polygon:
+                area.append(f"wielokąt {len(json.loads(zone.polygon)[0])} pkt")
+            if zone.postal_codes:
+                area.append(f"kody: {zone.postal_codes}")
+            click.echo(f"    strefa #{zone.id} {zone.name}: {to_money(zone.fee)} PLN, priorytet {zone.priority}, "
+                       f"{'; '.join(area)}{'' if zone.active else ' [nieaktywna]'}")
+
 
 @app.route('/create-checkout-session', methods=['POST'])
+@active_table_required
+@rate_limit('checkout:ip', client_ip)
+@rate_limit('checkout:table', order_table_id)
+@rate_limit('checkout:delivery', delivery_order_key)
 def create_checkout_session():
+    # Koszyk w tym samym formacie co POST /order. Sesję Stripe tworzy kolejka zadań -
+    # klient odpytuje status_url i w "result" dostaje adres strony płatności.
+    data = request.json or {}
+    item_rows, rejected, total_price = build_order_items(data.get('items', []))
+    if not item_rows or rejected:
+        # Klient płaci z góry, więc nie przyjmujemy koszyka, który różni się od tego, co widzi
+        return jsonify({'error': 'Część pozycji jest niedostępna', 'rejected': rejected}), 400
+
+    delivery_info = data.get('delivery_info') or {}
+    delivery_zone_id = delivery_fee = None
+    if data.get('table_id') is None:
+        quote = quote_delivery(delivery_info)
+        if not quote.deliverable:
+            return jsonify({'error': 'Nie dowozimy pod ten adres', 'rejected': []}), 400
+        delivery_zone_id = quote.zone.id if quote.zone else None
+        delivery_fee = float(quote.fee)
+        total_price += quote.fee
+
+    checkout = CheckoutSession(
+        cart=json.dumps({
+            'table_id': data.get('table_id'),
+            'items': item_rows,
+            'delivery_info': {key: delivery_info.get(key) for key in ('name', 'phone', 'address', 'postal', 'comments')},
+            'delivery_zone_id': delivery_zone_id,
+            'delivery_fee': delivery_fee,
+        }),
+        amount_cents=int(total_price * 100),
+    )
+    db.session.add(checkout)
+    db.session.flush()
+    job = enqueue_job('stripe_checkout_session', {
+        'checkout_id': checkout.public_id,
+        # {CHECKOUT_SESSION_ID} podstawia Stripe, więc nie może przejść przez url_for (kodowanie nawiasów)
+        'success_url': url_for('payment_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
+        'cancel_url': url_for('payment_cancel', _external=True),
+    })
+    db.session.commit()
+    return jsonify({'job_id': job.public_id, 'status_url': url_for('job_status', public_id=job.public_id)}), 202
+
+
+@job_handler('stripe_checkout_session')
+def stripe_checkout_session_job(payload):
+    checkout = CheckoutSession.query.filter_by(public_id=payload['checkout_id']).first()
+    if checkout is None:
+        raise PermanentJobError(f"Brak płatności {payload['checkout_id']}")
+
     try:
-        data = request.json
-        order_id = data.get('order_id')
-        order = Order.query.get_or_404(order_id)
-        
-        # Konwersja kwoty na centy (Stripe wymaga kwot w centach)
-        amount_cents = int(order.total_price * 100)
-        
-        # Tworzenie sesji Stripe
         session = stripe.checkout.Session.create(
             payment_method_types=['card'],
             line_items=[{
                 'price_data': {
                     'currency': 'pln',
                     'product_data': {
-                        'name': f'Zamówienie #{order.order_number}',
+                        'name': 'Zamówienie online',
                     },
-                    'unit_amount': amount_cents,
+                    'unit_amount': checkout.amount_cents,  # Stripe wymaga kwot w groszach
                 },
                 'quantity': 1,
             }],
             mode='payment',
-            success_url=url_for('payment_success', order_id=order_id, _external=True),
-            cancel_url=url_for('payment_cancel', order_id=order_id, _external=True),
+            client_reference_id=checkout.public_id,
+            metadata={'checkout_id': checkout.public_id},
+            success_url=payload['success_url'],
+            cancel_url=payload['cancel_url'],
+            # Ponowione zadanie dostaje z powrotem tę samą sesję zamiast tworzyć drugą
+            idempotency_key=f'checkout-session-{checkout.public_id}',
         )
-        
-        return jsonify({'id': session.id})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+    except stripe.error.InvalidRequestError as e:
+        # Błędne dane nie naprawią się same - nie ponawiamy
+        raise PermanentJobError(str(e))
+
+    if checkout.status == 'creating':
+        checkout.stripe_session_id = session.id
+        checkout.status = 'open'
+    return {'id': session.id, 'url': session.url}
+
+
+def fulfil_checkout_session(stripe_session):
+    # Tworzy zamówienie z opłaconej sesji Stripe (słownik jak w webhooku). Webhook, jego powtórki
+    # i zadanie kontrolne mogą przyjść równolegle - zamówienie powstaje tylko w tym wywołaniu,
+    # które przestawi status sesji, w jednej transakcji razem z pozycjami.
+    checkout_id = (stripe_session.get('metadata') or {}).get('checkout_id') or stripe_session.get('client_reference_id')
+    checkout = CheckoutSession.query.filter_by(public_id=checkout_id).first() if checkout_id else None
+    if checkout is None:
+        return None
+
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        db.update(CheckoutSession)
+        .where(CheckoutSession.id == checkout.id, CheckoutSession.order_id.is_(None))
+        .values(status='paid', stripe_session_id=stripe_session['id'], completed_at=now)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return db.session.scalar(db.select(CheckoutSession.order_id).where(CheckoutSession.id == checkout.id))
+
+    cart = json.loads(checkout.cart)
+    delivery_info = cart['delivery_info']
+    amount_cents = stripe_session.get('amount_total') or checkout.amount_cents
+    order = Order(
+        table_id=cart['table_id'],
+        status='Pending',
+        total_price=float(Decimal(amount_cents) / 100),  # Kwota faktycznie zapłacona
+        delivery_name=delivery_info.get('name'),
+        delivery_phone=delivery_info.get('phone'),
+        delivery_address=delivery_info.get('address'),
+        delivery_postal=delivery_info.get('postal'),
+        delivery_comments=delivery_info.get('comments'),
+        delivery_zone_id=cart.get('delivery_zone_id'),
+        delivery_fee=cart.get('delivery_fee')
+    )
+    db.session.add(order)
+    db.session.flush()
+    insert_order_items(order, cart['items'])
+    db.session.execute(
+        db.update(CheckoutSession).where(CheckoutSession.id == checkout.id).values(order_id=order.id)
+    )
+    db.session.commit()
+    publish_board_event('order_created', order)
+    return order.id
+
+
+def close_checkout_session(stripe_session, status):
+    db.session.execute(
+        db.update(CheckoutSession)
+        .where(CheckoutSession.stripe_session_id == stripe_session['id'], CheckoutSession.order_id.is_(None))
+        .values(status=status, completed_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+@app.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    secret = app.config['STRIPE_WEBHOOK_SECRET']
+    if not secret:
+        abort(404)
+    payload = request.get_data(as_text=True)
+    try:
+        # Z tolerancją czasu podpisu - bez niej przechwycone zdarzenie dałoby się odtworzyć w dowolnym momencie
+        stripe.WebhookSignature.verify_header(payload, request.headers.get('Stripe-Signature', ''), secret,
+                                              tolerance=stripe.Webhook.DEFAULT_TOLERANCE)
+    except stripe.error.SignatureVerificationError:
+        return jsonify({'error': 'Nieprawidłowy podpis'}), 400
+
+    stripe_event = json.loads(payload)
+    stripe_session = stripe_event['data']['object']
+    if stripe_event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+        # Przy płatnościach odroczonych "completed" przychodzi z payment_status "unpaid" - czekamy na kolejne zdarzenie
+        if stripe_session.get('payment_status') in ('paid', 'no_payment_required'):
+            fulfil_checkout_session(stripe_session)
+    elif stripe_event['type'] == 'checkout.session.expired':
+        close_checkout_session(stripe_session, 'expired')
+    elif stripe_event['type'] == 'checkout.session.async_payment_failed':
+        close_checkout_session(stripe_session, 'failed')
+    # Pozostałe zdarzenia potwierdzamy, żeby Stripe nie ponawiał ich w nieskończoność
+    return jsonify({'received': True})
 
 @app.route('/payment-cancel')
 def payment_cancel():
@@ -314,60 +2591,55 @@ def payment_cancel():
 
 @app.route('/payment-success')
 def payment_success():
-    try:
-        session_id = request.args.get('session_id')
-        session = stripe.checkout.Session.retrieve(session_id)
-
-        if session.payment_status == 'paid':
-            table_id = session.metadata.get('table_id')
-            total_price = float(session.metadata.get('total_price'))
-            order_items = eval(session.metadata.get('order_items'))
-
-            # Pobieramy dane dostawy
-            delivery_name = session.metadata.get('delivery_name', None)
-            delivery_phone = session.metadata.get('delivery_phone', None)
-            delivery_address = session.metadata.get('delivery_address', None)
-            delivery_postal = session.metadata.get('delivery_postal', None)
-            delivery_comments = session.metadata.get('delivery_comments', None)
-
-            # Tworzymy zamówienie w bazie
-            new_order = Order(
-                table_id=int(table_id) if table_id != "None" else None,
-                status="Pending",
-                total_price=total_price,
-                delivery_name=delivery_name,
-                delivery_phone=delivery_phone,
-                delivery_address=delivery_address,
-                delivery_postal=delivery_postal,
-                delivery_comments=delivery_comments
-            )
-            db.session.add(new_order)
-            db.session.commit()
+    # Zamówienie tworzy webhook - tu tylko sprawdzamy lokalną bazę. Jeśli webhook jeszcze
+    # nie dotarł, strona czeka na niego odpytując /checkout_status.
+    checkout = CheckoutSession.query.filter_by(stripe_session_id=request.args.get('session_id')).first()
+    if checkout is None:
+        return "Błąd płatności", 400
+    if checkout.order_id:
+        return redirect(url_for('order_status', order_id=checkout.order_id))
+    if checkout.status == 'open':
+        # Zabezpieczenie na wypadek zgubionego webhooka (albo środowiska bez webhooków)
+        enqueue_job('stripe_checkout_reconcile', {'checkout_id': checkout.public_id},
+                    dedupe_key=f'stripe_checkout_reconcile:{checkout.public_id}',
+                    run_at=datetime.utcnow() + timedelta(seconds=app.config['STRIPE_RECONCILE_DELAY']))
+        db.session.commit()
+    return render_template('payment_processing.html', checkout_id=checkout.public_id)
 
-            for item in order_items:
-                order_item = OrderItem(
-                    order_id=new_order.id,
-                    menu_item_id=item['menu_item_id'],
-                    quantity=item['quantity']
-                )
-                db.session.add(order_item)
 
-            db.session.commit()
+@app.route('/checkout_status/<public_id>')
+def checkout_status(public_id):
+    checkout = CheckoutSession.query.filter_by(public_id=public_id).first_or_404()
+    return jsonify({'status': checkout.status, 'order_id': checkout.order_id})
 
-            return redirect(url_for('order_status', order_id=new_order.id))
 
-        return "Błąd płatności", 400
+@job_handler('stripe_checkout_reconcile', max_attempts=8)
+def stripe_checkout_reconcile_job(payload):
+    checkout = CheckoutSession.query.filter_by(public_id=payload['checkout_id']).first()
+    if checkout is None or checkout.status != 'open':
+        return {'order_id': checkout.order_id if checkout else None}
 
-    except Exception as e:
-        print("Błąd w payment_success:", str(e))
-        return "Wystąpił błąd.", 500
+    try:
+        session = stripe.checkout.Session.retrieve(checkout.stripe_session_id).to_dict()
+    except stripe.error.InvalidRequestError as e:
+        raise PermanentJobError(str(e))
+
+    if session.get('payment_status') in ('paid', 'no_payment_required'):
+        return {'order_id': fulfil_checkout_session(session)}
+    if session.get('status') == 'expired':
+        close_checkout_session(session, 'expired')
+        return {'order_id': None}
+    # Sesja wciąż otwarta - ponowienie z rosnącym opóźnieniem
+    raise RuntimeError("Płatność jeszcze niepotwierdzona")
 
 @app.route('/choose_order_type')
 def choose_order_type():
-    tables = Table.query.all()
+    tables = active_tables()
     return render_template('choose_order_type.html', tables=tables)
 
 @app.route('/')
+@read_replica
+@cached_page(depends_on=('events',))
 def home():
     today = datetime.now().date()
 
@@ -401,6 +2673,7 @@ def add_popup():
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
+        schedule_image_variants(filename)
         
         # Usuń istniejący pop-up, jeśli jest
         Popup.query.delete()
@@ -416,13 +2689,14 @@ def add_popup():
 @admin_required
 def admin_add_popup():
     popup = Popup.query.first()
-    tables = Table.query.all()
+    tables = active_tables()
     return render_template('admin_popups.html', 
                            popup_image=popup.image_filename if popup else None, 
                            is_active=popup.is_active if popup else False,
                            tables=tables)
 
 @app.route('/popup_image')
+@cached_page(depends_on=('popup',))
 def popup_image():
     popup = Popup.query.first()
     if popup:
@@ -449,12 +2723,10 @@ def toggle_popup():
 
 # Widok głównego menu dla klientów
 @app.route('/menu/<int:table_id>')
+@read_replica
 def menu(table_id):
-    # Pobierz liczbę stolików w bazie danych
-    total_tables = Table.query.count()
-
-    # Sprawdź, czy numer stolika mieści się w aktualnym zakresie
-    if table_id < 1 or table_id > total_tables:
+    # Sprawdź, czy stolik istnieje (zbiór numerów stolików jest trzymany w pamięci)
+    if table_id not in table_registry:
         abort(404)  # Zwraca stronę błędu 404, gdy stolik nie istnieje
 
 
@@ -462,84 +2734,30 @@ def menu(table_id):
     timezone = pytz.timezone('Europe/Warsaw')
     current_time = datetime.now(timezone)
 
-    categories = {
-        "Lunch Dnia": MenuItem.query.filter_by(category="Lunch dnia").all(),
-        "Deser Dnia": MenuItem.query.filter_by(category="Deser dnia").all(),
-        "Przystawki": MenuItem.query.filter_by(category="Przystawki").all(),
-        "Śniadania": MenuItem.query.filter_by(category="Śniadania").all(),
-        "Kanapki": MenuItem.query.filter_by(category="Kanapki").all(),
-        "Zupy": MenuItem.query.filter_by(category="Zupy").all(),
-        "Bowle": MenuItem.query.filter_by(category="Bowle").all(),
-        "Dania główne": MenuItem.query.filter_by(category="Dania główne").all(),
-        "Dania dla dzieci": MenuItem.query.filter_by(category="Dania dla dzieci").all(),
-        "Sałatki": MenuItem.query.filter_by(category="Sałatki").all(),
-        "Desery": MenuItem.query.filter_by(category="Desery").all(),
-        "Napoje Ciepłe": MenuItem.query.filter_by(category="Napoje ciepłe").all(),
-        "Napoje Zimne": MenuItem.query.filter_by(category="Napoje zimne").all(),
-        "Napoje Specjalne": MenuItem.query.filter_by(category="Napoje specjalne").all(),
-        "Alkohole": MenuItem.query.filter_by(category="Alkohole").all()
-    }
+    categories = menu_catalog.categories()
     return render_template('menu.html', categories=categories, table_id=table_id, current_time=current_time)
 
 @app.route('/menu_online_order')
+@read_replica
 def menu_online_order():
     # Aktualna godzina w strefie czasowej UTC+1
     timezone = pytz.timezone('Europe/Warsaw')
     current_time = datetime.now(timezone)
 
-    # Pobranie kategorii menu z bazy danych
-    categories = {
-        "Lunch Dnia": MenuItem.query.filter_by(category="Lunch dnia").all(),
-        "Deser Dnia": MenuItem.query.filter_by(category="Deser dnia").all(),
-        "Przystawki": MenuItem.query.filter_by(category="Przystawki").all(),
-        "Śniadania": MenuItem.query.filter_by(category="Śniadania").all(),
-        "Kanapki": MenuItem.query.filter_by(category="Kanapki").all(),
-        "Zupy": MenuItem.query.filter_by(category="Zupy").all(),
-        "Bowle": MenuItem.query.filter_by(category="Bowle").all(),
-        "Dania główne": MenuItem.query.filter_by(category="Dania główne").all(),
-        "Dania dla dzieci": MenuItem.query.filter_by(category="Dania dla dzieci").all(),
-        "Sałatki": MenuItem.query.filter_by(category="Sałatki").all(),
-        "Desery": MenuItem.query.filter_by(category="Desery").all(),
-        "Napoje Ciepłe": MenuItem.query.filter_by(category="Napoje ciepłe").all(),
-        "Napoje Zimne": MenuItem.query.filter_by(category="Napoje zimne").all(),
-        "Napoje Specjalne": MenuItem.query.filter_by(category="Napoje specjalne").all(),
-        "Alkohole": MenuItem.query.filter_by(category="Alkohole").all()
-    }
+    # Kategorie menu z katalogu w pamięci
+    categories = menu_catalog.categories()
     
     return render_template('menu_online.html', categories=categories, table_id=None, current_time=current_time)
 
 @app.route('/check_new_orders', methods=['GET'])
+@read_replica
 @login_required
 @employee_required
 def check_new_orders():
     try:
-        timezone = pytz.timezone('Europe/Warsaw')
-        active_statuses = ["Pending", "Accepted", "In Preparation", "Ready"]
-        active_orders = Order.query.filter(Order.status.in_(active_statuses)).all()
-        
-        orders = [
-            {
-                "order_id": order.id,
-                "order_number": order.order_number,
-                "table_id": order.table_id,
-                "status": order.status,
-                "total_price": order.total_price,
-                "order_time": order.created_at.replace(tzinfo=pytz.utc).astimezone(timezone).strftime("%H:%M"),
-                "items": [
-                    {
-                        "name": item.menu_item.name,
-                        "quantity": item.quantity,
-                        "price": item.menu_item.price,
-                        "customization": item.customization,
-                        "takeaway": item.takeaway
-                    }
-                    for item in order.order_items
-                ]
-            }
-            for order in active_orders
-        ]
-        
-        return jsonify(orders)
+        return versioned_board_response(
+            'new-orders', lambda since: board_orders_payload(ACTIVE_ORDER_STATUSES, since)
+        )
 
     except Exception as e:
         print(f"Błąd podczas pobierania zamówień: {e}")
@@ -554,38 +2772,15 @@ def kitchen_view():
 
 
 @app.route('/check_accepted_orders', methods=['GET'])
+@read_replica
 @login_required
 @employee_required
 def check_accepted_orders():
     try:
-        timezone = pytz.timezone('Europe/Warsaw')
-
         # Pobieramy zamówienia zarówno w statusie "Accepted", jak i "In Preparation"
-        accepted_orders = Order.query.filter(Order.status.in_(["Accepted", "In Preparation"])).all()
-
-        orders = [
-            {
-                "order_id": order.id,
-                "order_number": order.order_number,
-                "table_id": order.table_id,
-                "status": order.status,
-                "total_price": order.total_price,
-                "order_time": order.created_at.replace(tzinfo=pytz.utc).astimezone(timezone).strftime("%H:%M"),
-                "items": [
-                    {
-                        "name": item.menu_item.name,
-                        "quantity": item.quantity,
-                        "price": item.menu_item.price,
-                        "customization": item.customization,
-                        "takeaway": item.takeaway
-                    }
-                    for item in order.order_items
-                ]
-            }
-            for order in accepted_orders
-        ]
-
-        return jsonify(orders)
+        return versioned_board_response(
+            'accepted-orders', lambda since: board_orders_payload(KITCHEN_ORDER_STATUSES, since)
+        )
 
     except Exception as e:
         print(f"Błąd podczas pobierania zamówień: {e}")
@@ -593,6 +2788,8 @@ def check_accepted_orders():
 
 
 @app.route('/request_bill/<int:order_id>', methods=['POST'])
+@rate_limit('request_bill:ip', client_ip)
+@rate_limit('request_bill:order', lambda: request.view_args['order_id'])
 def request_bill(order_id):
     data = request.json
     payment_method = data.get('payment_method')
@@ -603,60 +2800,128 @@ def request_bill(order_id):
     order = Order.query.get_or_404(order_id)
     order.request_bill = True
     order.bill_payment_method = payment_method
-    order.tip = float(tip) if tip else 0.0
+    new_tip = float(tip) if tip else 0.0
+    if order.status == 'Completed' and new_tip != (order.tip or 0):
+        record_tip_change(db.session.connection(), order, to_money(new_tip) - to_money(order.tip or 0))
+    order.tip = new_tip
     order.nip = nip
     order.last_call_time = datetime.utcnow()  # Ustawienie czasu wezwania rachunku
     db.session.commit()
+    publish_board_event('bill_request', order)
 
     return jsonify({"status": "success", "message": "Poproszono o rachunek"})
 
 @app.route('/call_waiter/<int:order_id>', methods=['POST'])
+@rate_limit('call_waiter:ip', client_ip)
 def call_waiter(order_id):
-    order = Order.query.get_or_404(order_id)
+    # Blokada wiersza - dwa równoczesne wezwania (także z różnych workerów) nie przejdą obu sprawdzeń.
+    # Licznik zmian "orders" blokujemy przed zamówieniem, jak flush i kitchen_batch_done.
+    next_change_version(db.session.connection(), 'orders')
+    order = Order.query.filter_by(id=order_id).with_for_update().first_or_404()
 
     # Sprawdzenie, czy minęły 3 minuty od ostatniego wezwania
     if order.last_call_time and datetime.utcnow() - order.last_call_time < timedelta(minutes=3):
+        db.session.rollback()
         return jsonify({"status": "error", "message": "Musisz poczekać zanim ponownie wezwiesz kelnera"}), 403
 
     # Aktualizacja wezwania kelnera
     order.call_waiter = True
     order.last_call_time = datetime.utcnow()  # Ustawienie czasu ostatniego wezwania
     db.session.commit()
+    publish_board_event('waiter_call', order)
     return jsonify({"status": "success", "message": "Kelner został powiadomiony."})
 
 @app.route('/check_waiter_calls', methods=['GET'])
+@read_replica
 def check_waiter_calls():
-    # Pobieramy zamówienia z aktywnym wezwaniem kelnera lub prośbą o rachunek
-    orders_with_calls = Order.query.filter((Order.call_waiter == True) | (Order.request_bill == True)).all()
-    
-    timezone = pytz.timezone('Europe/Warsaw')
+    def build(since):
+        if since is None:
+            # Pobieramy zamówienia z aktywnym wezwaniem kelnera lub prośbą o rachunek
+            orders_with_calls = Order.query.filter((Order.call_waiter == True) | (Order.request_bill == True)).all()
+            return [call for order in orders_with_calls for call in serialize_order_calls(order)]
 
-    calls = []
-    for order in orders_with_calls:
-        if order.call_waiter:
-            calls.append({
-                "order_id": order.id,
-                "order_number": order.order_number,
-                "table_id": order.table_id,
-                "call_type": "Wezwanie kelnera",
-                "call_time": order.last_call_time.replace(tzinfo=pytz.utc).astimezone(timezone).strftime("%H:%M:%S"),
-                "payment_method": None,
-                "tip": None,
-                "nip": None
-            })
-        if order.request_bill:
-            calls.append({
-                "order_id": order.id,
-                "order_number": order.order_number,
-                "table_id": order.table_id,
-                "call_type": "Prośba o rachunek",
-                "call_time": order.last_call_time.replace(tzinfo=pytz.utc).astimezone(timezone).strftime("%H:%M:%S") if order.last_call_time else None,
-                "payment_method": order.bill_payment_method,
-                "tip": getattr(order, "tip", 0),  # Pobierz napiwek
-                "nip": getattr(order, "nip", None)  # Pobierz NIP
-            })
+        # Klient usuwa wszystkie powiadomienia zamówień z `changed` i `removed`, a potem dodaje `changed`
+        changed_orders = Order.query.filter(Order.version > since).order_by(Order.id).all()
+        return {
+            "changed": [call for order in changed_orders for call in serialize_order_calls(order)],
+            "removed": [order.id for order in changed_orders if not (order.call_waiter or order.request_bill)]
+        }
+
+    return versioned_board_response('waiter-calls', build)
+
+
+# Strumień zdarzeń dla widoku kelnera i kuchni (Server-Sent Events)
+@app.route('/board_events')
+@admission_exempt
+@login_required
+@employee_required
+def board_events():
+    if not board_stream_slot():
+        # 204 kończy EventSource bez ponownych prób - board_events.js przechodzi na odpytywanie
+        return Response(status=204)
+
+    last_id = _requested_last_event_id()
+    if last_id is None:
+        last_id = board_events_broker.last_id
+    stream_timeout = app.config['BOARD_STREAM_TIMEOUT']
+    heartbeat_interval = app.config['BOARD_HEARTBEAT_INTERVAL']
+
+    def stream(last_id):
+        deadline = time.monotonic() + stream_timeout
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            events, resync = board_events_broker.wait(last_id, heartbeat_interval)
+            if resync:
+                last_id = board_events_broker.last_id
+                yield f"id: {last_id}\nevent: resync\ndata: {{}}\n\n"
+            elif events:
+                for board_event in events:
+                    last_id = board_event["id"]
+                    yield _format_sse(board_event)
+            else:
+                # Komentarz SSE utrzymuje połączenie przy życiu przez proxy
+                yield ": heartbeat\n\n"
+
+    response = Response(stream(last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Serwer WSGI zamyka odpowiedź także po rozłączeniu klienta
+    response.call_on_close(board_events_broker.detach_listener)
+    return response
 
-    return jsonify(calls)
+
+# Long-poll dla przeglądarek/proxy bez obsługi SSE
+@app.route('/board_events/poll', methods=['GET'])
+@admission_exempt
+@login_required
+@employee_required
+def board_events_poll():
+    last_id = _requested_last_event_id()
+    if last_id is None:
+        return jsonify({"last_id": board_events_broker.last_id, "events": [], "resync": True})
+
+    if board_stream_slot():
+        timeout = max(0, min(request.args.get('timeout', 25, type=int), 55))
+        try:
+            events, resync = board_events_broker.wait(last_id, timeout)
+        finally:
+            board_events_broker.detach_listener()
+        retry_in = 0
+    else:
+        # Bez wolnego wątku nie czekamy - klient zapyta ponownie za retry_in sekund
+        events, resync = board_events_broker.events_after(last_id)
+        retry_in = app.config['BOARD_SHORT_POLL_INTERVAL']
+    if resync:
+        return jsonify({"last_id": board_events_broker.last_id, "events": [], "resync": True,
+                        "retry_in": retry_in})
+
+    return jsonify({
+        "last_id": events[-1]["id"] if events else last_id,
+        "events": events,
+        "resync": False,
+        "retry_in": retry_in
+    })
 
 
 @app.route('/dismiss_call/<int:order_id>', methods=['POST'])
@@ -664,6 +2929,7 @@ def dismiss_call(order_id):
     order = Order.query.get_or_404(order_id)
     order.call_waiter = False
     db.session.commit()
+    publish_board_event('call_dismissed', order)
     return jsonify({"status": "success", "message": "Powiadomienie o wezwaniu kelnera zamknięte."})
 
 @app.route('/dismiss_bill/<int:order_id>', methods=['POST'])
@@ -672,9 +2938,89 @@ def dismiss_bill(order_id):
     order.request_bill = False
     order.bill_payment_method = None  # Resetujemy metodę płatności
     db.session.commit()
+    publish_board_event('call_dismissed', order)
     return jsonify({"status": "success", "message": "Powiadomienie o prośbie o rachunek zamknięte."})
 
+def to_money(value):
+    # Ceny w bazie są typu Float - przez str() unikamy artefaktów binarnych (np. 2.35 -> 2.3500000000000000888)
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def build_order_items(lines):
+    # Zwraca (wiersze order_item, odrzucone linie, suma). Wszystkie dania pobieramy jednym zapytaniem.
+    requested_ids = set()
+    for line in lines:
+        try:
+            requested_ids.add(int(line.get('id')))
+        except (TypeError, ValueError):
+            pass
+    menu_items = {}
+    if requested_ids:
+        menu_items = {item.id: item for item in MenuItem.query.filter(MenuItem.id.in_(requested_ids)).all()}
+
+    fees = app.config['ORDER_FEES']
+    item_rows = []
+    rejected = []
+    total = Decimal('0.00')
+    for index, line in enumerate(lines):
+        try:
+            menu_item = menu_items.get(int(line.get('id')))
+        except (TypeError, ValueError):
+            menu_item = None
+        quantity = line.get('quantity')
+
+        if menu_item is None:
+            reason = 'not_found'
+        elif not menu_item.available:
+            reason = 'unavailable'
+        elif not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            reason = 'invalid_quantity'
+        else:
+            reason = None
+
+        if reason:
+            rejected.append({
+                'index': index,
+                'id': line.get('id'),
+                'name': menu_item.name if menu_item else None,
+                'reason': reason
+            })
+            continue
+
+        takeaway = bool(line.get('takeaway', False))
+        unit_price = to_money(menu_item.price)
+        total += unit_price * quantity
+        if takeaway:
+            total += fees['takeaway']  # Dodajemy opłatę za wynos
+
+        item_rows.append({
+            'menu_item_id': menu_item.id,
+            'quantity': quantity,
+            'customization': line.get('customization', ''),
+            'takeaway': takeaway,
+            # Tekst, bo wiersze trafiają też do koszyka płatności (JSON)
+            'unit_price': str(unit_price)
+        })
+
+    return item_rows, rejected, total.quantize(Decimal('0.01'))
+
+
+def insert_order_items(order, item_rows):
+    # Jeden wielowierszowy INSERT (executemany) zamiast osobnego INSERT dla każdej pozycji
+    if item_rows:
+        db.session.execute(
+            db.insert(OrderItem),
+            [dict(row, order_id=order.id,
+                  unit_price=to_money(row['unit_price']) if row.get('unit_price') is not None else None)
+             for row in item_rows]
+        )
+
+
 @app.route('/order', methods=['POST'])
+@active_table_required
+@rate_limit('order:ip', client_ip)
+@rate_limit('order:table', order_table_id)
+@rate_limit('order:delivery', delivery_order_key)
 def place_order():
     try:
         data = request.json
@@ -694,29 +3040,33 @@ def place_order():
             delivery_comments=delivery_info.get('comments')
         )
         
-        total_price = 0
-        for item in items:
-            menu_item = MenuItem.query.get(item['id'])
-            if menu_item and menu_item.available:
-                order_item = OrderItem(
-                    menu_item=menu_item,
-                    quantity=item['quantity'],
-                    customization=item.get('customization', ''),
-                    takeaway=item.get('takeaway', False)
-                )
-                order.order_items.append(order_item)
-                total_price += menu_item.price * item['quantity']
-                if item.get('takeaway', False):
-                    total_price += 2.35  # Dodajemy opłatę za wynos
-        
-        order.total_price = total_price
+        item_rows, rejected, total_price = build_order_items(items)
+        if not item_rows:
+            return jsonify({'error': 'Żadna z pozycji nie jest dostępna', 'rejected': rejected}), 400
+
+        if table_id is None:
+            # Zamówienie z dostawą - strefa decyduje, czy dowozimy i za jaką opłatą
+            quote = quote_delivery(delivery_info)
+            if not quote.deliverable:
+                return jsonify({'error': 'Nie dowozimy pod ten adres', 'rejected': []}), 400
+            order.delivery_zone_id = quote.zone.id if quote.zone else None
+            order.delivery_fee = float(quote.fee)
+            total_price += quote.fee
+
+        order.total_price = float(total_price)
         db.session.add(order)
+        db.session.flush()
+        insert_order_items(order, item_rows)
         db.session.commit()
+        publish_board_event('order_created', order)
         
         return jsonify({
             'status': 'success',
             'order_id': order.id,
-            'order_number': order.order_number
+            'order_number': order.order_number,
+            'total_price': str(total_price),
+            'delivery_fee': str(to_money(order.delivery_fee)) if order.delivery_fee is not None else None,
+            'rejected': rejected
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -761,7 +3111,10 @@ def order_status(order_id):
 @employee_required
 def waiter_view():
     # Pobieranie tylko zamówień oczekujących
-    active_orders = Order.query.filter(Order.status != 'Completed').all()
+    active_orders = Order.query\
+        .options(selectinload(Order.order_items).joinedload(OrderItem.menu_item))\
+        .filter(Order.status != 'Completed')\
+        .all()
     
     # Strefa czasowa UTC+1 (Europe/Warsaw)
     timezone = pytz.timezone('Europe/Warsaw')
@@ -773,23 +3126,92 @@ def waiter_view():
     
     return render_template('waiter_view.html', orders=active_orders)
 
+# Kursor historii to "<created_at ISO>_<id>" ostatniego/pierwszego zamówienia na stronie
+def encode_history_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.id}"
+
+
+def decode_history_cursor(value):
+    if not value:
+        return None
+    created_at, _, order_id = value.rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        return None
+
+
+class CompletedOrderCount:
+    # Liczba zrealizowanych zamówień tylko do informacji - wystarczy przybliżenie,
+    # więc nie liczymy COUNT(*) po całej tabeli przy każdym wejściu na stronę
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0
+
+    def get(self):
+        with self._lock:
+            if self._value is not None and self._expires_at > time.monotonic():
+                return self._value
+        value = self._estimate()
+        with self._lock:
+            self._value = value
+            self._expires_at = time.monotonic() + app.config['ORDER_HISTORY_COUNT_TTL']
+        return value
+
+    def _estimate(self):
+        if db.engine.dialect.name == 'postgresql':
+            # Szacunek planera ze statystyk tabeli - bez skanowania wierszy
+            plan = db.session.execute(
+                db.text("EXPLAIN (FORMAT JSON) SELECT 1 FROM \"order\" WHERE status = 'Completed'")
+            ).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        return db.session.scalar(
+            db.select(func.count()).select_from(Order).where(Order.status == 'Completed')
+        )
+
+
+completed_order_count = CompletedOrderCount()
+
+
 @app.route('/order_history')
+@read_replica
 @login_required
 @employee_required
 def order_history():
-    page = request.args.get('page', 1, type=int)
-    per_page = 50  # Liczba zamówień na stronę
-    
-    # Pobieranie zrealizowanych zamówień z paginacją
-    pagination = Order.query.filter_by(status='Completed')\
-        .order_by(Order.created_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
-    
-    orders = pagination.items
-    
-    return render_template('order_history.html', 
+    per_page = app.config['ORDER_HISTORY_PER_PAGE']  # Liczba zamówień na stronę
+    older_than = decode_history_cursor(request.args.get('before'))
+    newer_than = decode_history_cursor(request.args.get('after'))
+
+    # Stronicowanie kluczem (created_at, id) zamiast OFFSET - każda strona to zakres indeksu
+    position = db.tuple_(Order.created_at, Order.id)
+    query = Order.query.filter(Order.status == 'Completed')\
+        .options(selectinload(Order.order_items).joinedload(OrderItem.menu_item))
+
+    if newer_than:
+        # Cofamy się do nowszych zamówień - czytamy rosnąco i odwracamy
+        rows = query.filter(position > newer_than)\
+            .order_by(Order.created_at.asc(), Order.id.asc())\
+            .limit(per_page + 1).all()
+        has_newer = len(rows) > per_page
+        orders = list(reversed(rows[:per_page]))
+        has_older = True
+    else:
+        if older_than:
+            query = query.filter(position < older_than)
+        rows = query.order_by(Order.created_at.desc(), Order.id.desc())\
+            .limit(per_page + 1).all()
+        has_older = len(rows) > per_page
+        orders = rows[:per_page]
+        has_newer = older_than is not None
+
+    return render_template('order_history.html',
                          orders=orders,
-                         pagination=pagination)
+                         newer_cursor=encode_history_cursor(orders[0]) if orders and has_newer else None,
+                         older_cursor=encode_history_cursor(orders[-1]) if orders and has_older else None,
+                         approximate_total=completed_order_count.get())
 
 
 @app.route('/accept_order/<int:order_id>', methods=['POST'])
@@ -797,13 +3219,17 @@ def accept_order(order_id):
     data = request.json
     realization_time = data.get('realization_time')
 
+    order = Order.query.get_or_404(order_id)
+    if realization_time is None:
+        # Kelner nie podał czasu - przyjmujemy prognozę na podstawie kolejki kuchni
+        realization_time = kitchen_eta.suggest_minutes(order)
     if not realization_time or realization_time <= 0:
         return jsonify({"status": "error", "message": "Niepoprawny czas realizacji."}), 400
 
-    order = Order.query.get_or_404(order_id)
     order.status = 'Accepted'
     order.estimated_completion_time = datetime.utcnow() + timedelta(minutes=realization_time)
     db.session.commit()
+    publish_board_event('order_status', order)
 
     return jsonify({"status": "success", "message": "Zamówienie przyjęte do realizacji."})
 
@@ -811,8 +3237,27 @@ def accept_order(order_id):
 @app.route('/update_order_status/<int:order_id>', methods=['POST'])
 def update_order_status(order_id):
     order = Order.query.get_or_404(order_id)
-    order.status = 'Completed'
-    db.session.commit()
+    # Najpierw licznik zmian "orders", potem wiersz zamówienia - w tej samej kolejności co flush
+    # i kitchen_batch_done, inaczej równoczesne oznaczenie partii w kuchni może dać zakleszczenie.
+    # Wersję i tak ustawi flush; przy wycofaniu zwiększenie licznika też się wycofuje.
+    next_change_version(db.session.connection(), 'orders')
+    # Warunkowy UPDATE: przy podwójnym wysłaniu formularza lub dwóch równoczesnych żądaniach tylko
+    # jedno zmienia status i dolicza zamówienie do zestawień sprzedaży (drugie czeka na blokadę wiersza
+    # i nie znajduje już zamówienia w innym statusie)
+    completed = db.session.execute(
+        db.update(Order)
+        .where(Order.id == order_id, Order.status != 'Completed')
+        .values(status='Completed'),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if completed == 1:
+        # Zmiana także w ORM - wersja zamówienia i dziennik statusów liczone są przy flushu
+        order.status = 'Completed'
+        record_completed_order_sales(db.session.connection(), order)
+        db.session.commit()
+        publish_board_event('order_status', order)
+    else:
+        db.session.rollback()
     flash("Status zamówienia został zaktualizowany.")
     return redirect(url_for('waiter_view'))
 
@@ -823,10 +3268,412 @@ def update_order_status(order_id):
 @admin_required
 def admin_panel():
     menu_items = MenuItem.query.all()
-    tables = Table.query.all()
+    tables = active_tables()
     return render_template('admin_panel.html', menu_items=menu_items, tables=tables)
 
 
+# Eksport zamówień dla księgowości - jeden wiersz CSV na pozycję zamówienia
+ORDER_EXPORT_FORMATS = ('csv', 'ndjson')
+ORDER_EXPORT_COLUMNS = [
+    'order_id', 'order_number', 'created_at', 'status', 'order_type', 'table_id',
+    'total_price', 'tip', 'nip', 'bill_payment_method',
+    'item_id', 'item_name', 'category', 'quantity', 'unit_price', 'takeaway', 'customization',
+]
+
+
+def warsaw_day_start(day):
+    # Początek dnia w Warszawie jako naiwna data UTC (tak jak created_at w bazie)
+    local_start = WARSAW_TZ.localize(datetime(day.year, day.month, day.day))
+    return local_start.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def parse_report_dates(date_from, date_to):
+    # Zakres dni (włącznie) w czasie Warszawy - domyślnie od początku bieżącego miesiąca do dzisiaj
+    today = datetime.now(WARSAW_TZ).date()
+    try:
+        first_day = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else today.replace(day=1)
+        last_day = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else today
+    except ValueError:
+        raise ValueError('Nieprawidłowy format daty (oczekiwano RRRR-MM-DD).')
+    if last_day < first_day:
+        raise ValueError('Data końcowa nie może być wcześniejsza niż początkowa.')
+    return first_day, last_day
+
+
+def parse_order_export_filters(date_from, date_to, statuses):
+    first_day, last_day = parse_report_dates(date_from, date_to)
+    statuses = [status for status in statuses if status] or ['Completed']
+    return first_day, last_day, statuses
+
+
+def order_channel(table_id, delivery_address):
+    if table_id:
+        return 'table'
+    return 'delivery' if delivery_address else 'online'
+
+
+def iter_export_orders(first_day, last_day, statuses):
+    # Jedno zapytanie z kursorem po stronie serwera - w pamięci trzymamy tylko bieżącą paczkę wierszy,
+    # a pozycje łączymy z zamówieniem w locie (wiersze jednego zamówienia przychodzą po kolei)
+    stmt = db.select(
+        Order.id, Order.order_number, Order.created_at, Order.status, Order.table_id,
+        Order.delivery_address, Order.total_price, Order.tip, Order.nip, Order.bill_payment_method,
+        OrderItem.id.label('item_id'), MenuItem.name.label('item_name'), MenuItem.category,
+        OrderItem.quantity, MenuItem.price.label('unit_price'), OrderItem.takeaway, OrderItem.customization,
+    ).outerjoin(OrderItem, OrderItem.order_id == Order.id)\
+        .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)\
+        .where(Order.status.in_(statuses),
+               Order.created_at >= warsaw_day_start(first_day),
+               Order.created_at < warsaw_day_start(last_day + timedelta(days=1)))\
+        .order_by(Order.created_at, Order.id, OrderItem.id)\
+        .execution_options(stream_results=True, yield_per=app.config['ORDER_EXPORT_BATCH_SIZE'])
+
+    for _, lines in groupby(db.session.execute(stmt), key=attrgetter('id')):
+        lines = list(lines)
+        first = lines[0]
+        order = {
+            'order_id': first.id,
+            'order_number': first.order_number,
+            'created_at': to_warsaw_time(first.created_at, '%Y-%m-%d %H:%M:%S'),
+            'status': first.status,
+            'order_type': order_channel(first.table_id, first.delivery_address),
+            'table_id': first.table_id,
+            'total_price': first.total_price,
+            'tip': first.tip,
+            'nip': first.nip,
+            'bill_payment_method': first.bill_payment_method,
+        }
+        items = [{
+            'item_id': line.item_id,
+            'item_name': line.item_name,
+            'category': line.category,
+            'quantity': line.quantity,
+            'unit_price': line.unit_price,
+            'takeaway': bool(line.takeaway),
+            'customization': line.customization,
+        } for line in lines if line.item_id is not None]
+        yield order, items
+
+
+def stream_orders_csv(orders):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ORDER_EXPORT_COLUMNS)
+    writer.writeheader()
+    for order, items in orders:
+        for item in items or [{}]:
+            writer.writerow({**order, **item})
+        if buffer.tell() >= app.config['ORDER_EXPORT_CHUNK_SIZE']:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_orders_ndjson(orders):
+    chunk = []
+    size = 0
+    for order, items in orders:
+        line = json.dumps({**order, 'items': items}, ensure_ascii=False) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= app.config['ORDER_EXPORT_CHUNK_SIZE']:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    yield ''.join(chunk)
+
+
+ORDER_EXPORT_WRITERS = {
+    'csv': (stream_orders_csv, 'text/csv'),
+    'ndjson': (stream_orders_ndjson, 'application/x-ndjson'),
+}
+
+
+@app.route('/admin/export_orders')
+@login_required
+@admin_required
+def export_orders_form():
+    today = datetime.now(WARSAW_TZ).date()
+    return render_template('admin_export_orders.html',
+                           date_from=today.replace(day=1).isoformat(),
+                           date_to=today.isoformat(),
+                           statuses=ACTIVE_ORDER_STATUSES + ['Completed'])
+
+
+@app.route('/admin/export_orders/download')
+@login_required
+@admin_required
+def export_orders():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ORDER_EXPORT_FORMATS:
+        flash('Nieobsługiwany format eksportu.', 'error')
+        return redirect(url_for('export_orders_form'))
+    try:
+        first_day, last_day, statuses = parse_order_export_filters(
+            request.args.get('date_from'), request.args.get('date_to'), request.args.getlist('status'))
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('export_orders_form'))
+
+    writer, mimetype = ORDER_EXPORT_WRITERS[export_format]
+    filename = f"zamowienia_{first_day.isoformat()}_{last_day.isoformat()}.{export_format}"
+    response = Response(stream_with_context(writer(iter_export_orders(first_day, last_day, statuses))),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Wyłączamy buforowanie w nginx, żeby eksport płynął do klienta na bieżąco
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.cli.command('export-orders', help='Eksportuje zamówienia z pozycjami do CSV lub NDJSON.')
+@click.option('--from', 'date_from', help='Pierwszy dzień (RRRR-MM-DD), domyślnie początek bieżącego miesiąca.')
+@click.option('--to', 'date_to', help='Ostatni dzień (RRRR-MM-DD), domyślnie dzisiaj.')
+@click.option('--status', 'statuses', multiple=True, help='Status zamówień (można podać kilka), domyślnie Completed.')
+@click.option('--format', 'export_format', type=click.Choice(ORDER_EXPORT_FORMATS), default='csv')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Plik wynikowy, domyślnie stdout.')
+def export_orders_command(date_from, date_to, statuses, export_format, output):
+    try:
+        first_day, last_day, statuses = parse_order_export_filters(date_from, date_to, list(statuses))
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    writer, _ = ORDER_EXPORT_WRITERS[export_format]
+    for chunk in writer(iter_export_orders(first_day, last_day, statuses)):
+        output.write(chunk)
+
+
+# Raporty sprzedaży - agregaty aktualizowane przyrostowo przy zakończeniu zamówienia
+SALES_ROLLUP_PERIODS = ('hour', 'day')
+
+
+def report_buckets(created_at):
+    local_time = created_at.replace(tzinfo=pytz.utc).astimezone(WARSAW_TZ).replace(tzinfo=None)
+    hour = local_time.replace(minute=0, second=0, microsecond=0)
+    return {'hour': hour, 'day': hour.replace(hour=0)}
+
+
+def increment_rollup(connection, table, key, amounts):
+    if connection.dialect.name == 'postgresql':
+        statement = postgresql_insert(table).values(**key, **amounts)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c[column] for column in key],
+            set_={column: table.c[column] + statement.excluded[column] for column in amounts}
+        )
+        connection.execute(statement)
+        return
+
+    # SQLite i inne bazy: UPDATE bierze blokadę zapisu, INSERT tylko dla pierwszego wpisu w przedziale
+    updated = connection.execute(
+        table.update()
+        .where(*(table.c[column] == value for column, value in key.items()))
+        .values({column: table.c[column] + amount for column, amount in amounts.items()})
+    )
+    if updated.rowcount == 0:
+        connection.execute(table.insert().values(**key, **amounts))
+
+
+def order_item_revenue():
+    # Wartość pozycji po cenie z chwili zamówienia; pozycje sprzed zapisywania ceny - po cenie z menu
+    return func.coalesce(OrderItem.unit_price, MenuItem.price) * OrderItem.quantity
+
+
+def record_completed_order_sales(connection, order):
+    # Wywoływane w tej samej transakcji, w której zamówienie dostaje status Completed.
+    # Pozycje sumujemy jednym zapytaniem z grupowaniem po kategorii.
+    channel = order_channel(order.table_id, order.delivery_address)
+    categories = connection.execute(
+        db.select(MenuItem.category, func.sum(OrderItem.quantity), func.sum(order_item_revenue()))
+        .select_from(OrderItem)
+        .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+        .where(OrderItem.order_id == order.id, OrderItem.quantity.is_not(None))
+        .group_by(MenuItem.category)
+    ).all()
+
+    for period, bucket_start in report_buckets(order.created_at).items():
+        key = {'period': period, 'bucket_start': bucket_start, 'channel': channel}
+        increment_rollup(connection, SalesRollup.__table__, key,
+                         {'order_count': 1, 'revenue': to_money(order.total_price or 0),
+                          'tips': to_money(order.tip or 0)})
+        for category, count, revenue in categories:
+            increment_rollup(connection, CategorySalesRollup.__table__, {**key, 'category': category or ''},
+                             {'item_count': count, 'revenue': to_money(revenue or 0)})
+
+
+def record_tip_change(connection, order, tip_delta):
+    # Napiwek podany przy rachunku już po zakończeniu zamówienia
+    channel = order_channel(order.table_id, order.delivery_address)
+    for period, bucket_start in report_buckets(order.created_at).items():
+        increment_rollup(connection, SalesRollup.__table__,
+                         {'period': period, 'bucket_start': bucket_start, 'channel': channel},
+                         {'tips': tip_delta})
+
+
+@app.route('/admin/sales_report')
+@login_required
+@admin_required
+def sales_report():
+    period = request.args.get('period', 'day')
+    if period not in SALES_ROLLUP_PERIODS:
+        return jsonify({"status": "error", "message": "Nieobsługiwany okres raportu."}), 400
+    try:
+        first_day, last_day = parse_report_dates(request.args.get('date_from'), request.args.get('date_to'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    start = datetime(first_day.year, first_day.month, first_day.day)
+    end = datetime(last_day.year, last_day.month, last_day.day) + timedelta(days=1)
+
+    sales = SalesRollup.query.filter(SalesRollup.period == period,
+                                     SalesRollup.bucket_start >= start,
+                                     SalesRollup.bucket_start < end)\
+        .order_by(SalesRollup.bucket_start, SalesRollup.channel).all()
+    categories = CategorySalesRollup.query.filter(CategorySalesRollup.period == period,
+                                                  CategorySalesRollup.bucket_start >= start,
+                                                  CategorySalesRollup.bucket_start < end)\
+        .order_by(CategorySalesRollup.bucket_start, CategorySalesRollup.channel, CategorySalesRollup.category).all()
+
+    totals = {}
+    for row in sales:
+        channel_totals = totals.setdefault(row.channel, {"order_count": 0, "revenue": Decimal('0.00'),
+                                                         "tips": Decimal('0.00')})
+        channel_totals["order_count"] += row.order_count
+        channel_totals["revenue"] += row.revenue
+        channel_totals["tips"] += row.tips
+
+    return jsonify({
+        "period": period,
+        "date_from": first_day.isoformat(),
+        "date_to": last_day.isoformat(),
+        "totals": {channel: {**values, "revenue": str(to_money(values["revenue"])), "tips": str(to_money(values["tips"]))}
+                   for channel, values in totals.items()},
+        "sales": [{
+            "bucket_start": row.bucket_start.isoformat(),
+            "channel": row.channel,
+            "order_count": row.order_count,
+            "revenue": str(to_money(row.revenue)),
+            "tips": str(to_money(row.tips)),
+        } for row in sales],
+        "categories": [{
+            "bucket_start": row.bucket_start.isoformat(),
+            "channel": row.channel,
+            "category": row.category,
+            "item_count": row.item_count,
+            "revenue": str(to_money(row.revenue)),
+        } for row in categories],
+    })
+
+
+def percentile(sorted_values, percent):
+    # Metoda najbliższej rangi - wynik jest zawsze jedną z rzeczywistych wartości
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+@app.route('/admin/order_lead_times')
+@login_required
+@admin_required
+def order_lead_times():
+    period = request.args.get('period', 'hour')
+    if period not in SALES_ROLLUP_PERIODS:
+        return jsonify({"status": "error", "message": "Nieobsługiwany okres raportu."}), 400
+    try:
+        first_day, last_day = parse_report_dates(request.args.get('date_from'), request.args.get('date_to'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Zdarzenia z bufora tego procesu zapisujemy od razu, żeby raport obejmował ostatnie zmiany
+    order_event_writer.flush()
+
+    # Czas etapu = od wejścia w status do następnego zdarzenia tego samego zamówienia (LEAD).
+    # Podzapytanie nie ma górnej granicy, żeby etapy rozpoczęte w zakresie miały swój koniec.
+    events = OrderStatusEvent.__table__
+    stages = db.select(
+        events.c.status,
+        events.c.created_at.label('started_at'),
+        func.lead(events.c.created_at, type_=db.DateTime).over(
+            partition_by=events.c.order_id, order_by=(events.c.created_at, events.c.id)
+        ).label('ended_at'),
+    ).where(events.c.created_at >= warsaw_day_start(first_day)).subquery()
+    stmt = db.select(stages.c.status, stages.c.started_at, stages.c.ended_at)\
+        .where(stages.c.started_at < warsaw_day_start(last_day + timedelta(days=1)),
+               stages.c.ended_at.isnot(None))\
+        .execution_options(yield_per=app.config['ORDER_EXPORT_BATCH_SIZE'])
+
+    durations = {}
+    for status, started_at, ended_at in db.session.execute(stmt):
+        bucket_start = report_buckets(started_at)[period]
+        durations.setdefault((bucket_start, status), []).append((ended_at - started_at).total_seconds())
+
+    stage_order = {status: index for index, status in enumerate(ACTIVE_ORDER_STATUSES)}
+    stages_report = []
+    for (bucket_start, status), values in sorted(durations.items(),
+                                                 key=lambda entry: (entry[0][0], stage_order.get(entry[0][1], len(stage_order)))):
+        values.sort()
+        stages_report.append({
+            "bucket_start": bucket_start.isoformat(),
+            "status": status,
+            "count": len(values),
+            "p50_seconds": round(percentile(values, 50), 1),
+            "p90_seconds": round(percentile(values, 90), 1),
+            "p99_seconds": round(percentile(values, 99), 1),
+        })
+
+    return jsonify({
+        "period": period,
+        "date_from": first_day.isoformat(),
+        "date_to": last_day.isoformat(),
+        "stages": stages_report,
+    })
+
+
+@app.cli.command('rebuild-sales-rollups', help='Przelicza raporty sprzedaży od zera na podstawie zakończonych zamówień.')
+def rebuild_sales_rollups_command():
+    # Agregujemy w pamięci (przedziałów jest niewiele), zamówienia czytamy kursorem po stronie serwera.
+    # Zamówienia zakończone w trakcie przeliczania mogą się nie policzyć - uruchamiać poza godzinami pracy.
+    sales = {}
+    categories = {}
+    stmt = db.select(
+        Order.id, Order.created_at, Order.table_id, Order.delivery_address, Order.total_price, Order.tip,
+        MenuItem.category, OrderItem.quantity, order_item_revenue().label('revenue'),
+    ).outerjoin(OrderItem, OrderItem.order_id == Order.id)\
+        .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)\
+        .where(Order.status == 'Completed')\
+        .order_by(Order.id)\
+        .execution_options(stream_results=True, yield_per=app.config['ORDER_EXPORT_BATCH_SIZE'])
+
+    for _, lines in groupby(db.session.execute(stmt), key=attrgetter('id')):
+        lines = list(lines)
+        first = lines[0]
+        channel = order_channel(first.table_id, first.delivery_address)
+        for period, bucket_start in report_buckets(first.created_at).items():
+            key = (period, bucket_start, channel)
+            order_count, revenue, tips = sales.get(key, (0, Decimal('0.00'), Decimal('0.00')))
+            sales[key] = (order_count + 1, revenue + to_money(first.total_price or 0), tips + to_money(first.tip or 0))
+            for line in lines:
+                if line.quantity is None or line.revenue is None:
+                    continue
+                category_key = key + (line.category or '',)
+                item_count, item_revenue = categories.get(category_key, (0, Decimal('0.00')))
+                categories[category_key] = (item_count + line.quantity, item_revenue + to_money(line.revenue))
+
+    db.session.execute(db.delete(CategorySalesRollup))
+    db.session.execute(db.delete(SalesRollup))
+    if sales:
+        db.session.execute(db.insert(SalesRollup), [
+            {'period': period, 'bucket_start': bucket_start, 'channel': channel,
+             'order_count': order_count, 'revenue': revenue, 'tips': tips}
+            for (period, bucket_start, channel), (order_count, revenue, tips) in sales.items()
+        ])
+    if categories:
+        db.session.execute(db.insert(CategorySalesRollup), [
+            {'period': period, 'bucket_start': bucket_start, 'channel': channel, 'category': category,
+             'item_count': item_count, 'revenue': revenue}
+            for (period, bucket_start, channel, category), (item_count, revenue) in categories.items()
+        ])
+    db.session.commit()
+    click.echo(f"Przeliczono raporty: {len(sales)} przedziałów sprzedaży, {len(categories)} przedziałów kategorii.")
+
+
 # Dodawanie nowego dania
 @app.route('/add_menu_item', methods=['POST'])
 @login_required
@@ -848,6 +3695,7 @@ def add_menu_item():
     if image and image.filename != '':
         filename = secure_filename(image.filename)
         image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        schedule_image_variants(filename)
         image_filename = filename
     else:
         image_filename = None  # Brak zdjęcia
@@ -874,6 +3722,158 @@ def add_menu_item():
 def health_check():
     return "OK", 200
 
+
+# Metryki w formacie Prometheusa - czas odpowiedzi, liczba zapytań SQL i czas bazy per endpoint.
+# Liczniki są w pamięci procesu: przy kilku workerach gunicorna każdy worker raportuje swoje.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._queries = {}
+        self._db_seconds = {}
+        self._responses = {}
+        self._rate_limits = {}
+        self._shed = {}
+
+    def observe(self, endpoint, method, status, duration, queries, db_seconds):
+        key = (endpoint, method)
+        with self._lock:
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self._queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(queries)
+            self._db_seconds[key] = self._db_seconds.get(key, 0.0) + db_seconds
+            self._responses[key + (status,)] = self._responses.get(key + (status,), 0) + 1
+
+    def observe_rate_limit(self, name, allowed):
+        key = (name, 'allowed' if allowed else 'limited')
+        with self._lock:
+            self._rate_limits[key] = self._rate_limits.get(key, 0) + 1
+
+    def observe_shed(self, endpoint):
+        with self._lock:
+            self._shed[endpoint] = self._shed.get(endpoint, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, 'http_request_duration_seconds',
+                                    'Czas obsługi żądania w sekundach.', self._latency)
+            self._render_histograms(lines, 'http_request_sql_queries',
+                                    'Liczba zapytań SQL na żądanie.', self._queries)
+            lines.append('# HELP http_request_db_seconds_total Łączny czas zapytań SQL w sekundach.')
+            lines.append('# TYPE http_request_db_seconds_total counter')
+            for (endpoint, method), value in sorted(self._db_seconds.items()):
+                lines.append(f'http_request_db_seconds_total{_metric_labels(endpoint=endpoint, method=method)} {value}')
+            lines.append('# HELP http_requests_total Liczba obsłużonych żądań.')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), value in sorted(self._responses.items()):
+                lines.append(f'http_requests_total{_metric_labels(endpoint=endpoint, method=method, status=status)} {value}')
+            lines.append('# HELP rate_limit_decisions_total Decyzje limitów żądań (allowed/limited).')
+            lines.append('# TYPE rate_limit_decisions_total counter')
+            for (name, outcome), value in sorted(self._rate_limits.items()):
+                lines.append(f'rate_limit_decisions_total{_metric_labels(limit=name, outcome=outcome)} {value}')
+            lines.append('# HELP http_requests_shed_total Żądania odrzucone przez limit równoczesnych żądań.')
+            lines.append('# TYPE http_requests_shed_total counter')
+            for endpoint, value in sorted(self._shed.items()):
+                lines.append(f'http_requests_shed_total{_metric_labels(endpoint=endpoint)} {value}')
+        lines.append('# HELP http_requests_in_flight Żądania obsługiwane w tej chwili przez proces.')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        lines.append(f'http_requests_in_flight {admission_control.in_flight}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines, name, description, histograms):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for (endpoint, method), histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_metric_labels(endpoint=endpoint, method=method, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_metric_labels(endpoint=endpoint, method=method)} {histogram.sum}')
+            lines.append(f'{name}_count{_metric_labels(endpoint=endpoint, method=method)} {histogram.count}')
+
+
+def _metric_labels(**labels):
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+request_metrics = RequestMetrics()
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_started_at = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+    g.sql_statements = [] if app.config['SLOW_REQUEST_THRESHOLD'] is not None else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+    # Zapytania z wątków w tle (np. OrderEventWriter) nie należą do żadnego żądania
+    if not has_request_context() or 'metrics_started_at' not in g:
+        return
+    g.sql_queries += 1
+    g.sql_seconds += elapsed
+    if g.sql_statements is not None and len(g.sql_statements) < app.config['SLOW_REQUEST_MAX_STATEMENTS']:
+        g.sql_statements.append((elapsed, statement))
+
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.pop('metrics_started_at', None)
+    if started_at is None:
+        return response
+    duration = time.perf_counter() - started_at
+    # Nazwa endpointu zamiast ścieżki, żeby id w adresach nie mnożyły serii
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.observe(endpoint, request.method, response.status_code, duration, g.sql_queries, g.sql_seconds)
+
+    threshold = app.config['SLOW_REQUEST_THRESHOLD']
+    if threshold is not None and duration >= threshold:
+        statements = '\n'.join(f"  [{elapsed * 1000:.1f} ms] {' '.join(statement.split())}"
+                               for elapsed, statement in g.sql_statements)
+        app.logger.warning(
+            f"Wolne żądanie {request.method} {request.path} ({endpoint}): {duration * 1000:.0f} ms, "
+            f"{g.sql_queries} zapytań SQL, {g.sql_seconds * 1000:.0f} ms w bazie\n{statements}"
+        )
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Edycja pozycji menu
 @app.route('/edit_menu_item/<int:item_id>', methods=['POST'])
 def edit_menu_item(item_id):
@@ -895,9 +3895,11 @@ def edit_menu_item(item_id):
                 old_image_path = os.path.join(app.config['UPLOAD_FOLDER'], item.image_filename)
                 if os.path.exists(old_image_path):
                     os.remove(old_image_path)
+                remove_image_variants(item.image_filename)
             # Zapis nowego zdjęcia
             filename = secure_filename(image.filename)
             image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            schedule_image_variants(filename)
             item.image_filename = filename
 
     db.session.commit()
@@ -911,6 +3913,8 @@ def delete_menu_item(item_id):
     item = MenuItem.query.get_or_404(item_id)
     # Usunięcie wszystkich powiązanych `OrderItem`
     OrderItem.query.filter_by(menu_item_id=item_id).delete()
+    if item.image_filename:
+        remove_image_variants(item.image_filename)
     db.session.delete(item)
     db.session.commit()
     flash('Pozycja menu została usunięta.') 
@@ -923,27 +3927,47 @@ def add_tables():
     if request.method == 'POST':
         try:
             table_count = int(request.form['table_count'])
-            
-            # Pobierz aktualną liczbę stolików
-            current_tables = Table.query.count()
-            
-            if table_count > current_tables:
-                # Dodaj tylko nowe stoliki
-                for i in range(current_tables + 1, table_count + 1):
-                    new_table = Table(
-                        id=i,
-                        qr_code=f"table_{i}",
-                    )
-                    db.session.add(new_table)
-                    # Commit po każdym dodanym stoliku
-                    db.session.commit()
-            elif table_count < current_tables:
-                # Usuń nadmiarowe stoliki
-                tables_to_remove = Table.query.filter(Table.id > table_count).all()
-                for table in tables_to_remove:
-                    db.session.delete(table)
-                    # Commit po każdym usuniętym stoliku
-                    db.session.commit()
+            if table_count < 1:
+                flash('Liczba stolików musi być większa od zera.', 'error')
+                return redirect(url_for('add_tables'))
+
+            # Stan wszystkich stolików jednym zapytaniem; zmiany w jednej transakcji
+            existing = dict(db.session.query(Table.id, Table.active).all())
+            new_ids = [i for i in range(1, table_count + 1) if i not in existing]
+
+            if any(table_id > table_count for table_id in existing):
+                # Nie usuwamy stolików z niezakończonymi zamówieniami
+                busy_tables = [table_id for (table_id,) in db.session.query(Order.table_id)
+                               .filter(Order.table_id > table_count, Order.status != 'Completed')
+                               .distinct().order_by(Order.table_id)]
+                if busy_tables:
+                    flash(f'Nie można usunąć stolików z aktywnymi zamówieniami: {", ".join(map(str, busy_tables))}.', 'error')
+                    return redirect(url_for('add_tables'))
+
+                # Stoliki z historią zamówień zostają jako nieaktywne (klucz obcy w order), reszta jest usuwana
+                referenced = db.select(Order.table_id).where(Order.table_id > table_count).distinct()
+                db.session.execute(
+                    db.update(Table).where(Table.id > table_count, Table.id.in_(referenced)).values(active=False)
+                )
+                db.session.execute(
+                    db.delete(Table).where(Table.id > table_count, Table.id.not_in(referenced))
+                )
+
+            # Przywrócenie wcześniej wyłączonych stolików z zakresu
+            db.session.execute(
+                db.update(Table).where(Table.id <= table_count, Table.active == False).values(active=True)
+            )
+            if new_ids:
+                db.session.execute(
+                    db.insert(Table),
+                    [{'id': i, 'qr_code': f"table_{i}", 'active': True} for i in new_ids]
+                )
+
+            mark_content_changed('tables')
+            # Kody QR renderujemy w kolejce zadań - istniejące pliki nie są renderowane ponownie
+            enqueue_job('render_qr_codes', {'table_ids': list(range(1, table_count + 1)),
+                                            'base_url': request.host_url})
+            db.session.commit()
 
             flash(f'Zaktualizowano liczbę stolików na {table_count}.', 'success')
             return redirect(url_for('add_tables'))
@@ -953,15 +3977,15 @@ def add_tables():
             flash(f'Wystąpił błąd podczas aktualizacji stolików: {str(e)}', 'error')
             return redirect(url_for('add_tables'))
 
-    # Pobierz wszystkie istniejące stoliki z bazy
-    tables = Table.query.all()
+    # Pobierz wszystkie aktywne stoliki z bazy
+    tables = active_tables()
     return render_template('admin_add_tables.html', tables=tables)
 
 @app.route('/admin/add_events', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def add_events():
-    tables = Table.query.all()
+    tables = active_tables()
     if request.method == 'POST':
         title = request.form['title']
         description = request.form['description']
@@ -977,6 +4001,7 @@ def add_events():
         if image:
             filename = secure_filename(image.filename)
             image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            schedule_image_variants(filename)
             image_filename = filename
 
         new_event = Event(
@@ -1005,6 +4030,7 @@ def delete_event(event_id):
         image_path = os.path.join(app.config['UPLOAD_FOLDER'], event.image)
         if os.path.exists(image_path):
             os.remove(image_path)
+        remove_image_variants(event.image)
     db.session.delete(event)
     db.session.commit()
     flash("Wydarzenie zostało usunięte.")
@@ -1034,6 +4060,7 @@ def edit_event(event_id):
             filename = secure_filename(file.filename)
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
+            schedule_image_variants(filename)
             event.image = filename  # Aktualizacja nazwy pliku w bazie
 
     db.session.commit()
@@ -1041,62 +4068,75 @@ def edit_event(event_id):
     return redirect(url_for('add_events'))
 
 @app.route('/o-nas')
+@cached_page()
 def o_nas():
     return render_template('cards/o-nas.html')
 
 @app.route('/imprezy-okolicznosciowe')
+@cached_page()
 def imprezy_okolicznosciowe():
     return render_template('cards/imprezy-okolicznosciowe.html')
 
 @app.route('/catering')
+@cached_page()
 def catering():
     return render_template('cards/catering.html')
 
 @app.route('/wydarzenia', methods=['GET'])
+@cached_page(depends_on=('events',))
 def view_events():
     events = Event.query.all()
     return render_template('cards/wydarzenia.html', events=events)
 
 @app.route('/godziny-otwarcia')
+@cached_page()
 def godziny_otwarcia():
     return render_template('cards/godziny-otwarcia.html')
 
 @app.route('/praca')
+@cached_page()
 def praca():
     return render_template('cards/praca.html')
 
 @app.route('/kontakt')
+@cached_page()
 def kontakt():
     return render_template('cards/kontakt.html')
 
 @app.route('/regulamin')
+@cached_page()
 def regulamin():
     return render_template('cards/regulamin.html')
 
 @app.route('/polityka-prywatnosci')
+@cached_page()
 def polityka_prywatnosci():
     return render_template('cards/polityka-prywatnosci.html')
 
 @app.route('/kategoria/sniadania')
+@cached_page(depends_on=('menu', 'images'))
 def sniadania():
-    sniadania_items = MenuItem.query.filter_by(category="Śniadania", available=True).all()
-    kanapki_items = MenuItem.query.filter_by(category="Kanapki", available=True).all()
+    sniadania_items = menu_catalog.items("Śniadania", available_only=True)
+    kanapki_items = menu_catalog.items("Kanapki", available_only=True)
     return render_template('kategoria/sniadania.html', menu_items=sniadania_items, kanapki_items=kanapki_items)
 
 @app.route('/kategoria/bowle')
+@cached_page(depends_on=('menu', 'images'))
 def bowle():
-    bowle_items = MenuItem.query.filter_by(category="Bowle", available=True).all()
+    bowle_items = menu_catalog.items("Bowle", available_only=True)
     return render_template('kategoria/bowle.html', menu_items=bowle_items)
 
 @app.route('/kategoria/salatki')
+@cached_page(depends_on=('menu', 'images'))
 def salatki():
-    salatki_items = MenuItem.query.filter_by(category="Sałatki", available=True).all()
+    salatki_items = menu_catalog.items("Sałatki", available_only=True)
     return render_template('kategoria/salatki.html', menu_items=salatki_items)
 
 @app.route('/kategoria/dania-gorace')
+@cached_page(depends_on=('menu', 'images'))
 def dania_gorace():
-    dania_gorace_items = MenuItem.query.filter_by(category="Dania główne", available=True).all()
-    dania_dla_dzieci_items = MenuItem.query.filter_by(category="Dania dla dzieci", available=True).all()
+    dania_gorace_items = menu_catalog.items("Dania główne", available_only=True)
+    dania_dla_dzieci_items = menu_catalog.items("Dania dla dzieci", available_only=True)
     return render_template(
         'kategoria/dania-gorace.html', 
         menu_items=dania_gorace_items, 
@@ -1104,10 +4144,11 @@ def dania_gorace():
     )
 
 @app.route('/kategoria/zupy-desery-przystawki')
+@cached_page(depends_on=('menu', 'images'))
 def zupy_desery_przystawki():
-    zupy_items = MenuItem.query.filter_by(category="Zupy", available=True).all()
-    desery_items = MenuItem.query.filter_by(category="Desery", available=True).all()
-    przystawki_items = MenuItem.query.filter_by(category="Przystawki", available=True).all()
+    zupy_items = menu_catalog.items("Zupy", available_only=True)
+    desery_items = menu_catalog.items("Desery", available_only=True)
+    przystawki_items = menu_catalog.items("Przystawki", available_only=True)
     return render_template(
         'kategoria/zupy-desery-przystawki.html',
         zupy_items=zupy_items,
@@ -1117,11 +4158,12 @@ def zupy_desery_przystawki():
 
 
 @app.route('/kategoria/napoje')
+@cached_page(depends_on=('menu', 'images'))
 def napoje():
-    napoje_cieple_items = MenuItem.query.filter_by(category="Napoje ciepłe", available=True).all()
-    napoje_zimne_items = MenuItem.query.filter_by(category="Napoje zimne", available=True).all()
-    napoje_specjalne_items = MenuItem.query.filter_by(category="Napoje specjalne", available=True).all()
-    alkohole_items = MenuItem.query.filter_by(category="Alkohole", available=True).all()
+    napoje_cieple_items = menu_catalog.items("Napoje ciepłe", available_only=True)
+    napoje_zimne_items = menu_catalog.items("Napoje zimne", available_only=True)
+    napoje_specjalne_items = menu_catalog.items("Napoje specjalne", available_only=True)
+    alkohole_items = menu_catalog.items("Alkohole", available_only=True)
     return render_template(
         'kategoria/napoje.html',
         napoje_cieple_items=napoje_cieple_items,
@@ -1135,9 +4177,60 @@ def zamow_online():
     return render_template('kategoria/zamow.html')
 
 
+def send_upload(path, immutable):
+    # Wysyłka pliku z UPLOAD_FOLDER: warunkowe GET/Range obsługuje Flask albo serwer przed aplikacją
+    etag = file_version_token(path)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    offload = app.config['UPLOAD_OFFLOAD']
+
+    if offload in ('x-accel-redirect', 'x-sendfile'):
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(mimetype=mimetype)
+            if offload == 'x-accel-redirect':
+                relative_path = os.path.relpath(path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + relative_path
+            else:
+                response.headers['X-Sendfile'] = path
+        response.set_etag(etag)
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag)
+
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = app.config['UPLOAD_MAX_AGE']
+    return response
+
+
 @app.route('/images/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    original_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if original_path is None or not os.path.isfile(original_path):
+        abort(404)
+    # ?v= pochodzi z url_for i zmienia się razem z plikiem, więc taki adres można cache'ować na stałe
+    immutable = request.args.get('v') == file_version_token(original_path)
+
+    # Domyślnie serwujemy przeskalowany wariant (WebP, gdy przeglądarka go akceptuje); ?original=1 - oryginał
+    path = original_path
+    if 'original' not in request.args:
+        accepts_webp = any(mimetype == 'image/webp' for mimetype in request.accept_mimetypes.values())
+        variant_filename = choose_image_variant(filename, request.args.get('w', type=int), accepts_webp)
+        variant_path = safe_join(app.config['IMAGE_VARIANT_FOLDER'], variant_filename) if variant_filename else None
+        if variant_path and os.path.isfile(variant_path):
+            path = variant_path
+        else:
+            # Wariantu jeszcze nie ma (powstaje w tle) - oryginał pod tym adresem cache'ujemy krótko,
+            # żeby przeglądarki i CDN pobrały wariant, gdy się pojawi
+            immutable = False
+    response = send_upload(path, immutable)
+    # Treść pod tym samym adresem zależy od Accept (WebP/JPEG) - także przy oryginale i 304
+    response.vary.add('Accept')
+    return response
 
 @app.route('/download_qr')
 @login_required
@@ -1150,6 +4243,133 @@ def download_qr():
         flash('Kod QR nie istnieje', 'error')
         return redirect(url_for('add_tables'))
 
+@app.route('/admin/qr_codes/<int:table_id>.png')
+@login_required
+@admin_required
+def table_qr_code(table_id):
+    if table_id not in table_registry:
+        abort(404)
+    path = render_table_qr_codes([table_id])[table_id]
+    return send_file(path, mimetype='image/png',
+                     as_attachment='download' in request.args,
+                     download_name=f"table_{table_id}.png")
+
+@app.route('/admin/qr_codes.zip')
+@login_required
+@admin_required
+def table_qr_codes_zip():
+    paths = render_table_qr_codes(table_registry.ids())
+
+    buffer = io.BytesIO()
+    # PNG są już skompresowane - ZIP_STORED oszczędza CPU
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for table_id, path in paths.items():
+            archive.write(path, f"table_{table_id}.png")
+    buffer.seek(0)
+    return send_file(buffer, mimetype='application/zip', as_attachment=True, download_name="qr_codes.zip")
+
+# Tablica produkcji: te same dania (z tą samą personalizacją) ze wszystkich zamówień w kuchni
+def kitchen_batches_payload(since=None):
+    customization = func.coalesce(OrderItem.customization, '')
+    batches = db.session.execute(
+        db.select(
+            OrderItem.menu_item_id,
+            MenuItem.name,
+            customization.label('customization'),
+            func.sum(OrderItem.quantity).label('quantity'),
+            func.count(func.distinct(OrderItem.order_id)).label('order_count'),
+            func.min(Order.created_at).label('oldest_order_at'),
+            func.max(OrderItem.id).label('last_item_id'),
+        ).join(Order, Order.id == OrderItem.order_id)
+        .join(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+        .where(Order.status.in_(KITCHEN_ORDER_STATUSES), OrderItem.prepared_at.is_(None))
+        .group_by(OrderItem.menu_item_id, MenuItem.name, customization)
+        .order_by(func.min(Order.created_at), OrderItem.menu_item_id)
+    ).all()
+    return {
+        "batches": [{
+            "menu_item_id": batch.menu_item_id,
+            "name": batch.name,
+            "customization": batch.customization,
+            "quantity": batch.quantity,
+            "order_count": batch.order_count,
+            "oldest_order_time": to_warsaw_time(batch.oldest_order_at),
+            "last_item_id": batch.last_item_id,
+        } for batch in batches]
+    }
+
+
+@app.route('/kitchen/production')
+@login_required
+@employee_required
+def kitchen_production_view():
+    return render_template('kitchen_production.html')
+
+
+@app.route('/kitchen/batches', methods=['GET'])
+@read_replica
+@login_required
+@employee_required
+def kitchen_batches():
+    return versioned_board_response('kitchen-batches', kitchen_batches_payload)
+
+
+@app.route('/kitchen/batches/done', methods=['POST'])
+@login_required
+@employee_required
+def kitchen_batch_done():
+    data = request.json or {}
+    try:
+        menu_item_id = int(data['menu_item_id'])
+        # Pozycje dodane po odświeżeniu tablicy nie wchodzą do oznaczanej partii
+        last_item_id = int(data['last_item_id'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Niepoprawne dane partii'}), 400
+    customization = data.get('customization') or ''
+
+    # Jedna transakcja: pozycje partii, zmiany statusów zamówień i wersja dla tablic
+    lines = db.select(OrderItem.id)\
+        .join(Order, Order.id == OrderItem.order_id)\
+        .where(Order.status.in_(KITCHEN_ORDER_STATUSES),
+               OrderItem.prepared_at.is_(None),
+               OrderItem.menu_item_id == menu_item_id,
+               func.coalesce(OrderItem.customization, '') == customization,
+               OrderItem.id <= last_item_id)
+    order_ids = set(db.session.execute(
+        db.update(OrderItem)
+        .where(OrderItem.id.in_(lines))
+        .values(prepared_at=datetime.utcnow())
+        .returning(OrderItem.order_id),
+        execution_options={'synchronize_session': False}
+    ).scalars())
+    if not order_ids:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Partia została już oznaczona jako gotowa'}), 409
+
+    orders = Order.query.options(selectinload(Order.order_items))\
+        .filter(Order.id.in_(order_ids)).order_by(Order.id).all()
+    for order in orders:
+        if all(item.prepared_at is not None for item in order.order_items):
+            # Zamówienie przyjęte, ale nierozpoczęte przechodzi od razu do Ready - nie znamy
+            # początku przygotowania, więc nie zapisujemy sztucznego etapu "In Preparation"
+            order.status = 'Ready'
+        elif order.status == 'Accepted':
+            order.status = 'In Preparation'
+    version = next_change_version(db.session.connection(), 'orders')
+    for order in orders:
+        order.version = version
+    db.session.commit()
+
+    for order in orders:
+        publish_board_event('order_status', order)
+    return jsonify({
+        'success': True,
+        'message': 'Partia oznaczona jako gotowa',
+        'orders': [order.id for order in orders],
+        'ready_orders': [order.id for order in orders if order.status == 'Ready'],
+    })
+
+
 @app.route('/kitchen/accept_order/<int:order_id>', methods=['POST'])
 @login_required
 @employee_required
@@ -1159,6 +4379,7 @@ def kitchen_accept_order(order_id):
         if order and order.status == 'Accepted':
             order.status = 'In Preparation'
             db.session.commit()
+            publish_board_event('order_status', order)
             return jsonify({'success': True, 'message': 'Order marked as In Preparation'})
         else:
             return jsonify({'success': False, 'message': 'Order not found or invalid status'}), 404
@@ -1175,6 +4396,7 @@ def kitchen_complete_order(order_id):
         if order and order.status == 'In Preparation':
             order.status = 'Ready'
             db.session.commit()
+            publish_board_event('order_status', order)
             return jsonify({'success': True, 'message': 'Order marked as Ready'})
         else:
             return jsonify({'success': False, 'message': 'Order not found or invalid status'}), 404
@@ -1185,11 +4407,21 @@ def kitchen_complete_order(order_id):
 @app.route('/check_order_status/<int:order_id>', methods=['GET'])
 def check_order_status(order_id):
     order = Order.query.get_or_404(order_id)
+    predicted_completion_time = kitchen_eta.predicted_completion(order)
     return jsonify({
         'status': order.status,
-        'estimated_completion_time': order.estimated_completion_time.isoformat() if order.estimated_completion_time else None
+        'estimated_completion_time': order.estimated_completion_time.isoformat() if order.estimated_completion_time else None,
+        'predicted_completion_time': predicted_completion_time.isoformat() if predicted_completion_time else None
     })
 
+
+@app.route('/order_eta/<int:order_id>', methods=['GET'])
+@login_required
+@employee_required
+def order_eta(order_id):
+    order = Order.query.get_or_404(order_id)
+    return jsonify({'realization_time': kitchen_eta.suggest_minutes(order)})
+
 # Inicjalizacja bazy danych i uruchomienie aplikacji
 if __name__ == '__main__':
     with app.app_context():
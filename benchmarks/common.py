@@ -0,0 +1,22 @@
+# Wspólne ustawienia benchmarków.
+# Baza z BENCH_DATABASE_URL (np. postgresql://.../ordering_bench) - domyślnie SQLite w katalogu tymczasowym.
+# UWAGA: seed.py czyści wskazaną bazę, nigdy nie wskazuj bazy produkcyjnej.
+import os
+import tempfile
+
+WORK_DIR = os.path.join(tempfile.gettempdir(), 'ordering-bench')
+os.makedirs(WORK_DIR, exist_ok=True)
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(WORK_DIR, 'bench.sqlite'))
+
+from app import app, db  # noqa: E402
+
+app.config['UPLOAD_FOLDER'] = os.path.join(WORK_DIR, 'images')
+app.config['QR_CODE_FOLDER'] = os.path.join(WORK_DIR, 'images', 'qr_codes')
+app.config['IMAGE_VARIANT_FOLDER'] = os.path.join(WORK_DIR, 'images', 'variants')
+# Cały ruch benchmarku pochodzi z jednego adresu - limity żądań zafałszowałyby pomiar
+app.config['RATE_LIMIT_ENABLED'] = False
+
+# Konto pracownika zakładane przez seed.py i używane przez micro.py / load.py
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench'
+
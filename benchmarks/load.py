@@ -0,0 +1,167 @@
+# Wieloprocesowy test obciążenia działającego serwera: tablety kelnerów/kuchni odpytujące tablice
+# oraz klienci przeglądający menu, składający zamówienia i sprawdzający ich status.
+#
+#   BENCH_DATABASE_URL=... python -m benchmarks.seed
+#   DATABASE_URL=sqlite:////tmp/ordering-bench/bench.sqlite RATE_LIMIT_ENABLED=0 gunicorn -w 4 -b 127.0.0.1:5000 app:app
+#   python -m benchmarks.load --url http://127.0.0.1:5000 --tablets 20 --customers 10 --duration 60
+#
+# Skrypt nie importuje aplikacji - może działać na innej maszynie niż serwer. Id stolików i dań
+# zakłada takie, jak tworzy seed.py (1..N). Na końcu drukuje przepustowość i percentyle dla każdego typu żądania.
+# Wszyscy klienci mają ten sam adres IP, dlatego serwer uruchamiamy z wyłączonymi limitami żądań.
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import time
+from urllib.parse import urlsplit, urlencode
+
+from benchmarks.stats import summarize, print_table
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench'
+
+
+class Client:
+    # Jedno połączenie keep-alive na proces, ciasteczko sesji trzymane ręcznie
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._connect = lambda: connection_class(parts.hostname, parts.port, timeout=timeout)
+        self._connection = self._connect()
+        self._cookie = None
+        self.samples = []
+
+    def request(self, label, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self._cookie:
+            headers['Cookie'] = self._cookie
+        started = time.perf_counter()
+        try:
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            self._connection = self._connect()
+            self.samples.append((label, time.perf_counter() - started, 0))
+            return None, None, b''
+        self.samples.append((label, time.perf_counter() - started, response.status))
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self._cookie = cookie.split(';', 1)[0]
+        return response.status, response, data
+
+    def login(self):
+        body = urlencode({'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+        self.request('login', 'POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+
+def tablet(base_url, deadline, poll_interval, seed, results):
+    # Tablet kelnera lub kuchni: odpytywanie z If-None-Match (304, gdy nic się nie zmieniło)
+    rng = random.Random(seed)
+    client = Client(base_url, timeout=10)
+    client.login()
+    boards = ['/check_new_orders', '/check_waiter_calls'] if seed % 2 else ['/check_accepted_orders']
+    etags = {}
+    time.sleep(rng.uniform(0, poll_interval))
+    while time.time() < deadline:
+        for path in boards:
+            headers = {'If-None-Match': etags[path]} if path in etags else {}
+            status, response, _ = client.request(path, 'GET', path, headers=headers)
+            if status == 200 and response.getheader('ETag'):
+                etags[path] = response.getheader('ETag')
+        time.sleep(poll_interval)
+    results.put(client.samples)
+
+
+def customer(base_url, deadline, think_time, tables, menu_items, seed, results):
+    # Klient przy stoliku: menu, zamówienie, kilka sprawdzeń statusu
+    rng = random.Random(seed)
+    client = Client(base_url, timeout=10)
+    while time.time() < deadline:
+        table_id = rng.randint(1, tables)
+        client.request('/menu/<table_id>', 'GET', f'/menu/{table_id}')
+        time.sleep(rng.uniform(0, think_time))
+        items = [{'id': item_id, 'quantity': rng.randint(1, 3)}
+                 for item_id in rng.sample(range(1, menu_items + 1), rng.randint(1, 4))]
+        status, _, data = client.request('/order', 'POST', '/order',
+                                         json.dumps({'table_id': table_id, 'items': items}),
+                                         {'Content-Type': 'application/json'})
+        if status == 200:
+            order_id = json.loads(data)['order_id']
+            for _ in range(3):
+                time.sleep(rng.uniform(0, think_time))
+                client.request('/check_order_status/<order_id>', 'GET', f'/check_order_status/{order_id}')
+        time.sleep(rng.uniform(0, think_time))
+    results.put(client.samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test obciążenia działającego serwera.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--tablets', type=int, default=20, help='Liczba procesów-tabletów odpytujących tablice')
+    parser.add_argument('--customers', type=int, default=10, help='Liczba procesów-klientów składających zamówienia')
+    parser.add_argument('--duration', type=float, default=60, help='Czas testu w sekundach')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Co ile sekund tablet odpytuje tablice')
+    parser.add_argument('--think-time', type=float, default=0.5, help='Maksymalna przerwa klienta między krokami')
+    parser.add_argument('--tables', type=int, default=30)
+    parser.add_argument('--menu-items', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    started = time.time()
+    deadline = started + args.duration
+    processes = [
+        multiprocessing.Process(target=tablet, args=(args.url, deadline, args.poll_interval, args.seed + i, results))
+        for i in range(args.tablets)
+    ] + [
+        multiprocessing.Process(target=customer, args=(args.url, deadline, args.think_time, args.tables,
+                                                       args.menu_items, args.seed + 1000 + i, results))
+        for i in range(args.customers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [sample for _ in processes for sample in results.get()]
+    for process in processes:
+        process.join()
+    elapsed = time.time() - started
+
+    by_label = {}
+    for label, latency, status in samples:
+        by_label.setdefault(label, []).append((latency, status))
+    rows = []
+    for label, entries in sorted(by_label.items()):
+        statuses = [status for _, status in entries]
+        rows.append({
+            'name': label,
+            **summarize([latency for latency, _ in entries]),
+            'rps': len(entries) / elapsed,
+            'not_modified': statuses.count(304) / len(entries) * 100,
+            'errors': sum(1 for status in statuses if not status or status >= 500),
+        })
+    rows.append({
+        'name': 'RAZEM',
+        **summarize([latency for _, latency, _ in samples]),
+        'rps': len(samples) / elapsed,
+        'not_modified': sum(1 for *_, status in samples if status == 304) / max(len(samples), 1) * 100,
+        'errors': sum(1 for *_, status in samples if not status or status >= 500),
+    })
+
+    print(f"{args.tablets} tabletów, {args.customers} klientów, {elapsed:.0f} s")
+    print_table(rows, [
+        ('name', 'żądanie', ''),
+        ('count', 'liczba', 'd'),
+        ('rps', 'żądań/s', '.1f'),
+        ('mean', 'średnia ms', '.1f'),
+        ('p50', 'p50 ms', '.1f'),
+        ('p90', 'p90 ms', '.1f'),
+        ('p99', 'p99 ms', '.1f'),
+        ('not_modified', '304 %', '.0f'),
+        ('errors', 'błędy', 'd'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
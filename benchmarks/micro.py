@@ -0,0 +1,131 @@
+# Mikrobenchmarki najczęściej wywoływanych endpointów przez klienta testowego Flaska (bez sieci i serwera).
+#
+#   python -m benchmarks.seed                    # raz, przed pierwszym pomiarem
+#   python -m benchmarks.micro                   # wszystkie scenariusze
+#   python -m benchmarks.micro --only menu --only check_new_orders -n 500
+#
+# Dla każdego scenariusza: czasy odpowiedzi (średnia, p50/p90/p99), przepustowość w jednym wątku
+# i średnia liczba zapytań SQL na żądanie (wzrost zwykle oznacza N+1).
+import argparse
+import random
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.common import app, db, BENCH_USERNAME, BENCH_PASSWORD
+from benchmarks.stats import summarize, print_table
+from app import Table, MenuItem, Order, ACTIVE_ORDER_STATUSES
+
+query_count = [0]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    query_count[0] += 1
+
+
+class Scenario:
+    def __init__(self, name, request, login=False):
+        self.name = name
+        self.request = request
+        self.login = login
+
+
+def build_scenarios(rng):
+    with app.app_context():
+        table_ids = db.session.scalars(db.select(Table.id).where(Table.active.is_(True))).all()
+        menu_ids = db.session.scalars(db.select(MenuItem.id).where(MenuItem.available.is_(True))).all()
+        active_ids = db.session.scalars(db.select(Order.id).where(Order.status.in_(ACTIVE_ORDER_STATUSES))).all()
+    if not table_ids or not menu_ids:
+        raise SystemExit("Baza benchmarków jest pusta - uruchom najpierw: python -m benchmarks.seed")
+
+    def place_order(client):
+        items = [{'id': item_id, 'quantity': rng.randint(1, 3)} for item_id in rng.sample(menu_ids, rng.randint(1, 4))]
+        return client.post('/order', json={'table_id': rng.choice(table_ids), 'items': items})
+
+    etags = {}
+
+    def conditional(url):
+        # Tablica odpytująca z ETagiem - tak działają widoki kelnera i kuchni
+        def run(client):
+            headers = {'If-None-Match': etags[url]} if url in etags else {}
+            response = client.get(url, headers=headers)
+            if response.headers.get('ETag'):
+                etags[url] = response.headers['ETag']
+            return response
+        return run
+
+    return [
+        Scenario('place_order', place_order),
+        Scenario('menu', lambda client: client.get(f'/menu/{rng.choice(table_ids)}')),
+        Scenario('menu_online_order', lambda client: client.get('/menu_online_order')),
+        Scenario('check_order_status', lambda client: client.get(f'/check_order_status/{rng.choice(active_ids)}')),
+        Scenario('check_new_orders', lambda client: client.get('/check_new_orders'), login=True),
+        Scenario('check_new_orders (ETag)', conditional('/check_new_orders'), login=True),
+        Scenario('check_accepted_orders', lambda client: client.get('/check_accepted_orders'), login=True),
+        Scenario('check_waiter_calls', lambda client: client.get('/check_waiter_calls'), login=True),
+        Scenario('kitchen_batches', lambda client: client.get('/kitchen/batches'), login=True),
+        Scenario('order_history', lambda client: client.get('/order_history'), login=True),
+        Scenario('sales_report', lambda client: client.get('/admin/sales_report?period=day'), login=True),
+    ]
+
+
+def run_scenario(scenario, iterations, warmup):
+    client = app.test_client()
+    if scenario.login:
+        client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+
+    for _ in range(warmup):
+        scenario.request(client)
+
+    latencies = []
+    queries = 0
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        query_count[0] = 0
+        request_started = time.perf_counter()
+        response = scenario.request(client)
+        latencies.append(time.perf_counter() - request_started)
+        queries += query_count[0]
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        'name': scenario.name,
+        **summarize(latencies),
+        'rps': iterations / elapsed,
+        'queries': queries / iterations,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mikrobenchmarki endpointów przez klienta testowego Flaska.')
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', action='append', help='Nazwa scenariusza (można podać kilka razy)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(random.Random(args.seed))
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.only]
+
+    results = [run_scenario(scenario, args.iterations, args.warmup) for scenario in scenarios]
+    print_table(results, [
+        ('name', 'scenariusz', ''),
+        ('mean', 'średnia ms', '.2f'),
+        ('p50', 'p50 ms', '.2f'),
+        ('p90', 'p90 ms', '.2f'),
+        ('p99', 'p99 ms', '.2f'),
+        ('rps', 'żądań/s', '.0f'),
+        ('queries', 'SQL/żądanie', '.1f'),
+        ('errors', 'błędy', 'd'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+# Generator danych do benchmarków: menu, stoliki, historia zamówień i bieżąca zmiana.
+#
+#   python -m benchmarks.seed                     # 300 dań, 100 000 zamówień historycznych, 50 aktywnych
+#   python -m benchmarks.seed --orders 20000      # mniejsza baza do szybkich porównań
+#
+# Dane są deterministyczne dla danego --seed, więc wyniki kolejnych przebiegów są porównywalne.
+# Wstawiamy je masowo (INSERT z listą wierszy) z jawnymi id - bez zdarzeń ORM, dlatego numery
+# zamówień, wersje i liczniki zmian ustawiamy tutaj ręcznie.
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from werkzeug.security import generate_password_hash
+
+from benchmarks.common import app, db, BENCH_USERNAME, BENCH_PASSWORD
+from app import (
+    User, Table, MenuItem, Order, OrderItem, OrderStatusEvent, ChangeCounter, DailyOrderCounter,
+    ACTIVE_ORDER_STATUSES,
+)
+
+CATEGORIES = [
+    'Przystawki', 'Śniadania', 'Kanapki', 'Zupy', 'Bowle', 'Dania główne', 'Dania dla dzieci', 'Sałatki',
+    'Desery', 'Napoje ciepłe', 'Napoje zimne', 'Napoje specjalne', 'Alkohole',
+]
+CHANGE_COUNTERS = ('orders', 'menu', 'events', 'popup', 'images', 'tables', 'locations')
+PAYMENT_METHODS = ('card', 'cash', 'blik')
+CUSTOMIZATIONS = (None, None, None, None, 'bez cebuli', 'bez glutenu', 'extra ostre', 'sos osobno')
+BATCH_SIZE = 5000
+# Historia statusów zapisujemy tylko dla ostatnich dni - tyle czyta prognoza czasu realizacji
+STATUS_HISTORY_DAYS = 14
+
+
+def insert_rows(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(model), rows[start:start + BATCH_SIZE])
+
+
+def reset_sequences():
+    # Przy jawnych id sekwencje PostgreSQL trzeba przestawić ręcznie
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in ('user', 'table', 'menu_item', 'order', 'order_item', 'order_status_event'):
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE((SELECT MAX(id) FROM \"{table}\"), 1))"
+        ))
+
+
+def make_order_lines(rng, menu, order_id, next_item_id):
+    lines = []
+    total = 0.0
+    for menu_item in rng.sample(menu, rng.randint(1, 5)):
+        quantity = rng.choice((1, 1, 1, 2, 2, 3))
+        lines.append({
+            'id': next_item_id + len(lines),
+            'order_id': order_id,
+            'menu_item_id': menu_item['id'],
+            'quantity': quantity,
+            'customization': rng.choice(CUSTOMIZATIONS) if menu_item['customizable'] else None,
+            'takeaway': rng.random() < 0.1,
+        })
+        total += menu_item['price'] * quantity
+    return lines, round(total, 2)
+
+
+def order_channel_fields(rng, table_count):
+    # 80% zamówień przy stoliku, reszta online z dostawą
+    if rng.random() < 0.8:
+        return {'table_id': rng.randint(1, table_count)}
+    return {
+        'table_id': None,
+        'delivery_name': 'Jan Testowy',
+        'delivery_phone': '500600700',
+        'delivery_address': f'ul. Testowa {rng.randint(1, 200)}',
+        'delivery_postal': '00-001',
+    }
+
+
+def status_events(rng, order_id, created_at, final_status):
+    # Realistyczne odstępy między etapami: akceptacja, oczekiwanie na kuchnię, gotowanie, wydanie
+    events = [{'order_id': order_id, 'status': 'Pending', 'created_at': created_at}]
+    moment = created_at
+    for status, low, high in (('Accepted', 30, 240), ('In Preparation', 60, 600),
+                              ('Ready', 300, 1500), ('Completed', 60, 600)):
+        moment += timedelta(seconds=rng.randint(low, high))
+        events.append({'order_id': order_id, 'status': status, 'created_at': moment})
+        if status == final_status:
+            break
+    return events
+
+
+def seed(menu_items, historical_orders, active_orders, tables, random_seed):
+    rng = random.Random(random_seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    started = time.perf_counter()
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(db.insert(User), [{
+        'username': BENCH_USERNAME, 'password': generate_password_hash(BENCH_PASSWORD),
+        'is_admin': True, 'is_employee': True,
+    }])
+    insert_rows(Table, [{'id': i, 'qr_code': f'table_{i}', 'active': True} for i in range(1, tables + 1)])
+
+    menu = [{
+        'id': i,
+        'name': f'Danie {i}',
+        'description': f'Opis dania {i}',
+        'price': round(rng.uniform(8, 60), 2),
+        'customizable': rng.random() < 0.3,
+        'contains_alcohol': False,
+        'category': rng.choice(CATEGORIES),
+        'image_filename': None,
+        'available': rng.random() > 0.05,
+    } for i in range(1, menu_items + 1)]
+    insert_rows(MenuItem, menu)
+    orderable = [item for item in menu if item['available']]
+
+    # Historia: zamówienia zakończone, rozłożone równomiernie na ostatni rok
+    orders, items, events = [], [], []
+    next_item_id = 1
+    history_cutoff = now - timedelta(days=STATUS_HISTORY_DAYS)
+    for order_id in range(1, historical_orders + 1):
+        created_at = now - timedelta(seconds=rng.randint(3600, 365 * 24 * 3600))
+        lines, total = make_order_lines(rng, orderable, order_id, next_item_id)
+        next_item_id += len(lines)
+        items.extend(lines)
+        orders.append({
+            'id': order_id,
+            'status': 'Completed',
+            'total_price': total,
+            'created_at': created_at,
+            'order_number': rng.randint(1, 300),
+            'version': 0,
+            'tip': rng.choice((0.0, 0.0, 5.0, 10.0)),
+            'nip': '5260001246' if rng.random() < 0.05 else None,
+            'bill_payment_method': rng.choice(PAYMENT_METHODS),
+            **order_channel_fields(rng, tables),
+        })
+        if created_at >= history_cutoff:
+            events.extend(status_events(rng, order_id, created_at, 'Completed'))
+        if len(orders) >= BATCH_SIZE:
+            insert_rows(Order, orders)
+            insert_rows(OrderItem, items)
+            orders, items = [], []
+
+    # Bieżąca zmiana: aktywne zamówienia z dzisiejszymi numerami, część z wezwaniem kelnera lub rachunkiem
+    for number in range(1, active_orders + 1):
+        order_id = historical_orders + number
+        created_at = now - timedelta(minutes=rng.randint(1, 90))
+        status = rng.choice(ACTIVE_ORDER_STATUSES)
+        lines, total = make_order_lines(rng, orderable, order_id, next_item_id)
+        next_item_id += len(lines)
+        items.extend(lines)
+        orders.append({
+            'id': order_id,
+            'status': status,
+            'total_price': total,
+            'created_at': created_at,
+            'order_number': number,
+            'version': 1,
+            'call_waiter': rng.random() < 0.1,
+            'request_bill': rng.random() < 0.1,
+            'estimated_completion_time': created_at + timedelta(minutes=20) if status != 'Pending' else None,
+            **order_channel_fields(rng, tables),
+        })
+        events.extend(status_events(rng, order_id, created_at, status))
+
+    insert_rows(Order, orders)
+    insert_rows(OrderItem, items)
+    insert_rows(OrderStatusEvent, events)
+
+    business_day = datetime.now(pytz.timezone('Europe/Warsaw')).date()
+    db.session.execute(db.insert(DailyOrderCounter), [{'business_day': business_day, 'last_number': active_orders}])
+    db.session.execute(db.insert(ChangeCounter), [{'name': name, 'value': 1} for name in CHANGE_COUNTERS])
+    reset_sequences()
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['rebuild-sales-rollups'])
+    if result.exit_code != 0:
+        raise SystemExit(f"Nie udało się przeliczyć raportów: {result.output}")
+
+    print(f"Baza: {db.engine.url.render_as_string(hide_password=True)}")
+    print(f"Dania: {menu_items}, stoliki: {tables}, zamówienia: {historical_orders} + {active_orders} aktywnych, "
+          f"pozycje: {next_item_id - 1}, zdarzenia statusów: {len(events)}")
+    print(f"Czas: {time.perf_counter() - started:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wypełnia bazę benchmarków realistycznymi danymi.')
+    parser.add_argument('--menu-items', type=int, default=300)
+    parser.add_argument('--orders', type=int, default=100000, help='Liczba zakończonych zamówień historycznych')
+    parser.add_argument('--active', type=int, default=50, help='Liczba aktywnych zamówień bieżącej zmiany')
+    parser.add_argument('--tables', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    with app.app_context():
+        seed(args.menu_items, args.orders, args.active, args.tables, args.seed)
+
+
+if __name__ == '__main__':
+    main()
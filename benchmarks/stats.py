@@ -0,0 +1,33 @@
+# Statystyki czasów odpowiedzi - bez importu aplikacji, żeby load.py mógł działać na osobnej maszynie
+import math
+
+
+def percentile(sorted_values, percent):
+    # Metoda najbliższej rangi (tak jak raporty w aplikacji)
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies):
+    # Czasy w sekundach -> statystyki w milisekundach
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) * 1000,
+        'p50': percentile(values, 50) * 1000,
+        'p90': percentile(values, 90) * 1000,
+        'p99': percentile(values, 99) * 1000,
+    }
+
+
+def print_table(rows, columns):
+    # rows: lista słowników, columns: lista (klucz, nagłówek, format)
+    header = ' '.join(f"{title:>{max(len(title), 10)}}" if index else f"{title:<34}"
+                      for index, (_, title, _) in enumerate(columns))
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(' '.join(f"{format(row[key], fmt):>{max(len(title), 10)}}" if index else f"{row[key]:<34}"
+                       for index, (key, title, fmt) in enumerate(columns)))
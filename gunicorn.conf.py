@@ -0,0 +1,11 @@
+# Konfiguracja gunicorna - wczytywana automatycznie, gdy gunicorn startuje z katalogu aplikacji.
+# Tablice kelnera i kuchni trzymają otwarte połączenia SSE/long-poll (/board_events). Na workerach
+# "sync" każde takie połączenie blokowałoby cały proces, dlatego używamy workerów wątkowych.
+# Aplikacja trzyma najwyżej BOARD_MAX_STREAMS (16) takich połączeń na proces i wpuszcza najwyżej
+# MAX_CONCURRENT_REQUESTS (32) zwykłych żądań, stąd domyślnie 48 wątków.
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "5000"))
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 48))
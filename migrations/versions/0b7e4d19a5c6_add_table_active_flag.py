@@ -0,0 +1,30 @@
+"""Add active flag to tables
+
+Revision ID: 0b7e4d19a5c6
+Revises: f3a6c81d2e90
+Create Date: 2026-10-18 15:10:52.309117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e4d19a5c6'
+down_revision = 'f3a6c81d2e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('active', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('tables', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM change_counter WHERE name = 'tables'")
+
+    with op.batch_alter_table('table', schema=None) as batch_op:
+        batch_op.drop_column('active')
@@ -0,0 +1,26 @@
+"""Add composite index for keyset-paginated order history
+
+Revision ID: 1c8f5a3e7d20
+Revises: 0b7e4d19a5c6
+Create Date: 2026-10-18 16:02:37.548211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c8f5a3e7d20'
+down_revision = '0b7e4d19a5c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_status_created_at_id', ['status', sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_status_created_at_id')
@@ -0,0 +1,46 @@
+"""Add sales rollup tables
+
+Revision ID: 2d9b6e0f4a18
+Revises: 1c8f5a3e7d20
+Create Date: 2026-10-18 16:41:09.117354
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d9b6e0f4a18'
+down_revision = '1c8f5a3e7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sales_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=4), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('channel', sa.String(length=10), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('tips', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('period', 'bucket_start', 'channel', name='uq_sales_rollup_bucket')
+    )
+    op.create_table('category_sales_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=4), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('channel', sa.String(length=10), nullable=False),
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('item_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('period', 'bucket_start', 'channel', 'category', name='uq_category_sales_rollup_bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('category_sales_rollup')
+    op.drop_table('sales_rollup')
@@ -0,0 +1,38 @@
+"""Add order status event log
+
+Revision ID: 3a7c2f9d5e61
+Revises: 2d9b6e0f4a18
+Create Date: 2026-10-18 17:12:45.902316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c2f9d5e61'
+down_revision = '2d9b6e0f4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('order_status_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('order_status_event', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_status_event_created_at'), ['created_at'], unique=False)
+        batch_op.create_index('ix_order_status_event_order_id_created_at', ['order_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_status_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_status_event_order_id_created_at')
+        batch_op.drop_index(batch_op.f('ix_order_status_event_created_at'))
+
+    op.drop_table('order_status_event')
@@ -0,0 +1,26 @@
+"""Add prepared_at to order items
+
+Revision ID: 4e1d8b2c6f93
+Revises: 3a7c2f9d5e61
+Create Date: 2026-10-18 17:48:21.660437
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e1d8b2c6f93'
+down_revision = '3a7c2f9d5e61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('prepared_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('prepared_at')
@@ -0,0 +1,39 @@
+"""Add Stripe checkout sessions
+
+Revision ID: 6c4a0d8b2e35
+Revises: 5b3f9e7a1c24
+Create Date: 2026-10-18 19:52:40.118306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c4a0d8b2e35'
+down_revision = '5b3f9e7a1c24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('checkout_session',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('public_id', sa.String(length=32), nullable=False),
+    sa.Column('stripe_session_id', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('cart', sa.Text(), nullable=False),
+    sa.Column('amount_cents', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('order_id'),
+    sa.UniqueConstraint('public_id'),
+    sa.UniqueConstraint('stripe_session_id')
+    )
+
+
+def downgrade():
+    op.drop_table('checkout_session')
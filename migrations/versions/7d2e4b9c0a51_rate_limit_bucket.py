@@ -0,0 +1,34 @@
+"""Add shared rate limit buckets
+
+Revision ID: 7d2e4b9c0a51
+Revises: 6c4a0d8b2e35
+Create Date: 2026-10-18 21:04:17.553920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e4b9c0a51'
+down_revision = '6c4a0d8b2e35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_bucket',
+    sa.Column('key', sa.String(length=200), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('rate_limit_bucket', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_rate_limit_bucket_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('rate_limit_bucket', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_rate_limit_bucket_updated_at'))
+
+    op.drop_table('rate_limit_bucket')
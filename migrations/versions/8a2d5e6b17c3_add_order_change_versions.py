@@ -0,0 +1,37 @@
+"""Add order change versions
+
+Revision ID: 8a2d5e6b17c3
+Revises: 3f1c9a7d2e41
+Create Date: 2026-10-18 11:02:47.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a2d5e6b17c3'
+down_revision = '3f1c9a7d2e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_counter',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('orders', 0)")
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.BigInteger(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_order_version'), ['version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_version'))
+        batch_op.drop_column('version')
+
+    op.drop_table('change_counter')
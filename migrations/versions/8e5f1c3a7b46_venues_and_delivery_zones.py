@@ -0,0 +1,65 @@
+"""Add venues and delivery zones
+
+Revision ID: 8e5f1c3a7b46
+Revises: 7d2e4b9c0a51
+Create Date: 2026-10-18 22:16:43.302871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e5f1c3a7b46'
+down_revision = '7d2e4b9c0a51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    venue = op.create_table('venue',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.Column('onsite_radius_m', sa.Float(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('delivery_zone',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('fee', sa.Float(), nullable=False),
+    sa.Column('polygon', sa.Text(), nullable=True),
+    sa.Column('postal_codes', sa.Text(), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('delivery_zone_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('delivery_fee', sa.Float(), nullable=True))
+        batch_op.create_foreign_key('fk_order_delivery_zone_id', 'delivery_zone', ['delivery_zone_id'], ['id'])
+
+    # Dotychczasowa lokalizacja restauracji zapisana na stałe w check_location
+    op.bulk_insert(venue, [{
+        'name': 'Restauracja',
+        'latitude': 50.83174207392536,
+        'longitude': 19.08261400134686,
+        'onsite_radius_m': 100,
+        'active': True,
+    }])
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('locations', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM change_counter WHERE name = 'locations'")
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_order_delivery_zone_id', type_='foreignkey')
+        batch_op.drop_column('delivery_fee')
+        batch_op.drop_column('delivery_zone_id')
+
+    op.drop_table('delivery_zone')
+    op.drop_table('venue')
@@ -0,0 +1,52 @@
+"""Add order item unit price, store sales rollup amounts as Numeric
+
+Revision ID: 9c4e2a7f1b83
+Revises: 8e5f1c3a7b46
+Create Date: 2026-10-18 23:05:27.614093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e2a7f1b83'
+down_revision = '8e5f1c3a7b46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    # Dla starszych pozycji nie znamy ceny z chwili zamówienia - przyjmujemy obecną cenę dania
+    op.execute(
+        "UPDATE order_item SET unit_price = "
+        "(SELECT ROUND(CAST(menu_item.price AS NUMERIC), 2) FROM menu_item WHERE menu_item.id = order_item.menu_item_id)"
+    )
+
+    with op.batch_alter_table('sales_rollup', schema=None) as batch_op:
+        batch_op.alter_column('revenue', existing_type=sa.Float(), type_=sa.Numeric(precision=10, scale=2),
+                              existing_nullable=False)
+        batch_op.alter_column('tips', existing_type=sa.Float(), type_=sa.Numeric(precision=10, scale=2),
+                              existing_nullable=False)
+
+    with op.batch_alter_table('category_sales_rollup', schema=None) as batch_op:
+        batch_op.alter_column('revenue', existing_type=sa.Float(), type_=sa.Numeric(precision=10, scale=2),
+                              existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('category_sales_rollup', schema=None) as batch_op:
+        batch_op.alter_column('revenue', existing_type=sa.Numeric(precision=10, scale=2), type_=sa.Float(),
+                              existing_nullable=False)
+
+    with op.batch_alter_table('sales_rollup', schema=None) as batch_op:
+        batch_op.alter_column('tips', existing_type=sa.Numeric(precision=10, scale=2), type_=sa.Float(),
+                              existing_nullable=False)
+        batch_op.alter_column('revenue', existing_type=sa.Numeric(precision=10, scale=2), type_=sa.Float(),
+                              existing_nullable=False)
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('unit_price')
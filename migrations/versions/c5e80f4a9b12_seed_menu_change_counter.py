@@ -0,0 +1,24 @@
+"""Seed the menu change counter
+
+Revision ID: c5e80f4a9b12
+Revises: 8a2d5e6b17c3
+Create Date: 2026-10-18 11:48:15.207644
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e80f4a9b12'
+down_revision = '8a2d5e6b17c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('menu', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM change_counter WHERE name = 'menu'")
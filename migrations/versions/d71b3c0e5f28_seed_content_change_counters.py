@@ -0,0 +1,25 @@
+"""Seed event and popup change counters
+
+Revision ID: d71b3c0e5f28
+Revises: c5e80f4a9b12
+Create Date: 2026-10-18 12:31:09.884120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd71b3c0e5f28'
+down_revision = 'c5e80f4a9b12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('events', 0)")
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('popup', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM change_counter WHERE name IN ('events', 'popup')")
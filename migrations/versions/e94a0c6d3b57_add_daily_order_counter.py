@@ -0,0 +1,56 @@
+"""Add daily order number counter
+
+Revision ID: e94a0c6d3b57
+Revises: d71b3c0e5f28
+Create Date: 2026-10-18 13:20:41.602335
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import pytz
+
+
+# revision identifiers, used by Alembic.
+revision = 'e94a0c6d3b57'
+down_revision = 'd71b3c0e5f28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_order_counter',
+    sa.Column('business_day', sa.Date(), nullable=False),
+    sa.Column('last_number', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('business_day')
+    )
+
+    # Kontynuujemy numerację z istniejących zamówień (dzień w strefie Europe/Warsaw)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("""
+            INSERT INTO daily_order_counter (business_day, last_number)
+            SELECT (created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Warsaw')::date, max(order_number)
+            FROM "order"
+            WHERE order_number IS NOT NULL
+            GROUP BY 1
+        """)
+    else:
+        # SQLite nie zna stref czasowych - dzień roboczy liczymy w Pythonie, tak jak aplikacja
+        # (zamówienia z 00:00-02:00 czasu polskiego mają w UTC jeszcze poprzednią datę)
+        timezone = pytz.timezone('Europe/Warsaw')
+        orders = sa.table('order', sa.column('created_at', sa.DateTime), sa.column('order_number', sa.Integer))
+        last_numbers = {}
+        rows = op.get_bind().execute(
+            sa.select(orders.c.created_at, orders.c.order_number).where(orders.c.order_number.isnot(None))
+        )
+        for created_at, order_number in rows:
+            business_day = created_at.replace(tzinfo=pytz.utc).astimezone(timezone).date()
+            last_numbers[business_day] = max(last_numbers.get(business_day, 0), order_number)
+        if last_numbers:
+            counters = sa.table('daily_order_counter', sa.column('business_day', sa.Date),
+                                sa.column('last_number', sa.Integer))
+            op.bulk_insert(counters, [{'business_day': day, 'last_number': number}
+                                      for day, number in sorted(last_numbers.items())])
+
+
+def downgrade():
+    op.drop_table('daily_order_counter')
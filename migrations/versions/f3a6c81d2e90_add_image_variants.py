@@ -0,0 +1,42 @@
+"""Add image variants
+
+Revision ID: f3a6c81d2e90
+Revises: e94a0c6d3b57
+Create Date: 2026-10-18 14:05:33.471920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a6c81d2e90'
+down_revision = 'e94a0c6d3b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_variant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source_filename', sa.String(length=500), nullable=False),
+    sa.Column('filename', sa.String(length=600), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('size_bytes', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('image_variant', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_variant_source_filename'), ['source_filename'], unique=False)
+
+    op.execute("INSERT INTO change_counter (name, value) VALUES ('images', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM change_counter WHERE name = 'images'")
+
+    with op.batch_alter_table('image_variant', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_variant_source_filename'))
+
+    op.drop_table('image_variant')
@@ -0,0 +1,87 @@
+// Subskrypcja zdarzeń tablic kelnera i kuchni.
+// Najpierw próbujemy SSE (/board_events), a gdy przeglądarka go nie obsługuje
+// lub połączenie stale się zrywa - przechodzimy na long-poll (/board_events/poll).
+// Gdy serwer nie może trzymać połączenia (204 na SSE, retry_in w odpowiedzi long-poll),
+// odpytujemy go co retry_in sekund.
+function subscribeBoardEvents(onEvent) {
+    const eventTypes = ['order_created', 'order_status', 'waiter_call', 'bill_request', 'call_dismissed', 'orders_changed', 'resync'];
+    let lastEventId = null;
+    let sseFailures = 0;
+
+    function longPoll() {
+        const params = lastEventId === null ? '' : `?after=${lastEventId}`;
+        fetch(`/board_events/poll${params}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Błąd serwera: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                const wasInitialized = lastEventId !== null;
+                lastEventId = data.last_id;
+                if (data.resync) {
+                    if (wasInitialized) {
+                        onEvent('resync', {});
+                    }
+                } else {
+                    data.events.forEach(event => onEvent(event.type, event.data));
+                }
+                setTimeout(longPoll, (data.retry_in || 0) * 1000);
+            })
+            .catch(error => {
+                console.error("Błąd long-poll:", error);
+                setTimeout(longPoll, 5000);
+            });
+    }
+
+    if (!window.EventSource) {
+        longPoll();
+        return;
+    }
+
+    const source = new EventSource('/board_events');
+    eventTypes.forEach(type => {
+        source.addEventListener(type, event => {
+            sseFailures = 0;
+            lastEventId = parseInt(event.lastEventId);
+            onEvent(type, JSON.parse(event.data));
+        });
+    });
+    source.onopen = () => { sseFailures = 0; };
+    source.onerror = () => {
+        sseFailures += 1;
+        if (source.readyState === EventSource.CLOSED || sseFailures >= 3) {
+            // Proxy buforuje lub blokuje strumień - przechodzimy na long-poll
+            source.close();
+            longPoll();
+        }
+    };
+}
+
+// Przyrostowe pobieranie listy tablicy. Pierwsze zapytanie zwraca pełną listę, kolejne
+// (?since=<wersja>) tylko elementy zamówień zmienionych od tej wersji oraz id zamówień,
+// które z listy zniknęły. Zwraca null, gdy nic się nie zmieniło (304).
+function fetchBoardDelta(url, state) {
+    const requestUrl = state.version === null ? url : `${url}?since=${state.version}`;
+    return fetch(requestUrl)
+        .then(response => {
+            if (response.status === 304) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`Błąd serwera: ${response.status} - ${response.statusText}`);
+            }
+            const version = parseInt(response.headers.get('X-Change-Version'));
+            return response.json().then(data => {
+                if (state.version !== null && version < state.version) {
+                    // Starsza odpowiedź, która przyszła po nowszej
+                    return null;
+                }
+                state.version = version;
+                return Array.isArray(data)
+                    ? { full: true, changed: data, removed: [] }
+                    : { full: false, changed: data.changed, removed: data.removed };
+            });
+        });
+}
@@ -105,11 +105,68 @@ function submitOrder() {
         })
         .then(response => response.json())
         .then(data => {
+            if (data.status !== 'success') {
+                alert(data.error || "Nie udało się złożyć zamówienia.");
+                return;
+            }
+            if (data.rejected && data.rejected.length > 0) {
+                const names = data.rejected.map(line => line.name || `#${line.id}`).join(", ");
+                alert(`Niektóre pozycje są niedostępne i nie zostały zamówione: ${names}`);
+            }
             window.location.href = `/order_status/${data.order_id}`;
         });
     }
 }
 
+function checkout() {
+    if (cart.length === 0) {
+        alert("Koszyk jest pusty! Dodaj produkty przed złożeniem zamówienia.");
+        return;
+    }
+
+    const deliveryForm = document.getElementById("delivery-details");
+    if (deliveryForm && !deliveryForm.reportValidity()) {
+        return;
+    }
+    const deliveryInfo = deliveryForm ? {
+        name: document.getElementById("name").value,
+        phone: document.getElementById("phone").value,
+        address: document.getElementById("address").value,
+        postal: document.getElementById("postal_code").value,
+        comments: document.getElementById("comments").value
+    } : {};
+
+    fetch('/create-checkout-session', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ items: cart, delivery_info: deliveryInfo })
+    })
+    .then(response => response.json().then(data => ({ ok: response.ok, data })))
+    .then(({ ok, data }) => {
+        if (!ok) {
+            const names = (data.rejected || []).map(line => line.name || `#${line.id}`).join(", ");
+            alert(names ? `Niektóre pozycje są niedostępne: ${names}` : (data.error || "Nie udało się rozpocząć płatności."));
+            return;
+        }
+        waitForCheckout(data.status_url);
+    });
+}
+
+function waitForCheckout(statusUrl) {
+    // Sesję płatności tworzy kolejka zadań - po jej utworzeniu przechodzimy do Stripe
+    fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'succeeded') {
+                window.location.href = job.result.url;
+            } else if (job.status === 'failed') {
+                alert("Nie udało się rozpocząć płatności. Spróbuj ponownie za chwilę.");
+            } else {
+                setTimeout(() => waitForCheckout(statusUrl), 500);
+            }
+        });
+}
+
 function toggleCart() {
     const cart = document.getElementById("cart");
     cart.classList.toggle("show");
@@ -0,0 +1,65 @@
+# Testy: python -m pytest (z katalogu aplikacji)
+# Aplikacja czyta konfigurację przy imporcie, dlatego zmienne środowiskowe ustawiamy przed `import app`.
+# Baza główna i replika to dwa pliki SQLite w katalogu tymczasowym.
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix='ordering-tests-')
+PRIMARY_PATH = os.path.join(TEST_DIR, 'primary.sqlite')
+REPLICA_PATH = os.path.join(TEST_DIR, 'replica.sqlite')
+
+os.environ['DATABASE_URL'] = f'sqlite:///{PRIMARY_PATH}'
+os.environ['DATABASE_REPLICA_URLS'] = f'sqlite:///{REPLICA_PATH}'
+os.environ['JOB_WORKER_MODE'] = 'external'
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+os.environ['STRIPE_WEBHOOK_SECRET'] = 'whsec_test'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app as flask_app, db, order_event_writer, User, Table, MenuItem  # noqa: E402
+
+EMPLOYEE_USERNAME = 'kelner'
+EMPLOYEE_PASSWORD = 'kelner'
+
+
+@pytest.fixture
+def app():
+    # Każdy test dostaje te same dane startowe w pustej bazie - cache procesu (menu, stoliki)
+    # są kluczowane wersjami liczników zmian, więc przy identycznych danych pozostają poprawne.
+    # Kontekst aplikacji nie jest otwarty w trakcie testu: żądania klienta testowego dostają
+    # własny kontekst i sesję bazy, jak na serwerze (sprawdzenia w teście - `with app.app_context()`).
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            db.metadata.create_all(engine)
+        db.session.add(User(username=EMPLOYEE_USERNAME, password=generate_password_hash(EMPLOYEE_PASSWORD),
+                            is_employee=True))
+        db.session.add(Table(id=1, qr_code='table_1'))
+        db.session.add(MenuItem(id=1, name='Żurek', price=12.5, category='Zupy'))
+        db.session.commit()
+    yield flask_app
+    order_event_writer.flush()
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            db.metadata.drop_all(engine)
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def replica_in_sync(app):
+    # Replika jako kopia bazy głównej z chwili wywołania (tak jak po nadrobieniu opóźnienia replikacji)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if key is not None:
+                engine.dispose()
+    shutil.copyfile(PRIMARY_PATH, REPLICA_PATH)
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from app import db, enqueue_job, Job
+
+
+def test_concurrent_enqueue_with_same_dedupe_key_returns_one_job(app):
+    # Pierwsze żądanie dodaje zadanie i trzyma transakcję; drugie nie widzi go jeszcze w SELECT,
+    # a jego INSERT czeka na blokadę zapisu i po commicie pierwszego łamie unikalność dedupe_key
+    first_added = threading.Event()
+    results = {}
+
+    def first():
+        with app.app_context():
+            job = enqueue_job('stripe_checkout_reconcile', {'checkout_id': 'c1'}, dedupe_key='reconcile:c1')
+            first_added.set()
+            time.sleep(0.5)
+            db.session.commit()
+            results['first'] = job.id
+
+    def second():
+        first_added.wait()
+        with app.app_context():
+            job = enqueue_job('stripe_checkout_reconcile', {'checkout_id': 'c1'}, dedupe_key='reconcile:c1')
+            db.session.commit()
+            results['second'] = job.id
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results['first'] == results['second']
+    with app.app_context():
+        assert Job.query.filter_by(dedupe_key='reconcile:c1').count() == 1
+
+
+def test_enqueue_returns_existing_job_for_dedupe_key(app):
+    with app.app_context():
+        job = enqueue_job('stripe_checkout_reconcile', {'checkout_id': 'c2'}, dedupe_key='reconcile:c2')
+        db.session.commit()
+
+        assert enqueue_job('stripe_checkout_reconcile', {'checkout_id': 'c2'}, dedupe_key='reconcile:c2').id == job.id
+        assert Job.query.count() == 1
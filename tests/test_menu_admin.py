@@ -0,0 +1,20 @@
+from app import db, MenuItem, ImageVariant
+
+
+def test_deleting_menu_item_removes_image_variants(app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_VARIANT_FOLDER', str(tmp_path))
+    variant_file = tmp_path / 'zurek-320.webp'
+    variant_file.write_bytes(b'webp')
+    with app.app_context():
+        db.session.get(MenuItem, 1).image_filename = 'zurek.jpg'
+        db.session.add(ImageVariant(source_filename='zurek.jpg', filename='zurek-320.webp', format='webp',
+                                    width=320, height=240, size_bytes=4))
+        db.session.commit()
+
+    response = client.post('/delete_menu_item/1')
+
+    assert response.status_code == 302
+    assert not variant_file.exists()
+    with app.app_context():
+        assert db.session.get(MenuItem, 1) is None
+        assert ImageVariant.query.count() == 0
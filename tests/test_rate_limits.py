@@ -0,0 +1,56 @@
+import pytest
+
+from app import RATE_LIMIT_BACKENDS, MemoryRateLimitBackend
+
+
+@pytest.fixture
+def limits(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_BACKEND', 'memory')
+    monkeypatch.setitem(RATE_LIMIT_BACKENDS, 'memory', MemoryRateLimitBackend())
+    limits = dict(app.config['RATE_LIMITS'])
+    monkeypatch.setitem(app.config, 'RATE_LIMITS', limits)
+    return limits
+
+
+def place_order(client, table_id):
+    return client.post('/order', json={'table_id': table_id, 'items': [{'id': 1, 'quantity': 1}],
+                                       'delivery_info': {'postal': '42-600'}})
+
+
+@pytest.mark.parametrize('table_id', [2, 999, '1', True])
+def test_unknown_table_is_rejected_before_limits(client, limits, table_id):
+    limits['order:table'] = (1, 60)
+
+    for _ in range(3):
+        response = place_order(client, table_id)
+        assert response.status_code == 400
+        assert response.json['error'] == 'Nieznany stolik'
+
+    assert place_order(client, 1).status_code == 200
+
+
+def test_table_orders_are_limited_per_table(client, limits):
+    limits['order:table'] = (2, 60)
+
+    assert [place_order(client, 1).status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_delivery_orders_share_one_bucket_without_ip_limits(app, client, limits):
+    assert not app.config['RATE_LIMIT_BY_IP']
+    limits['order:delivery'] = (2, 60)
+
+    statuses = [place_order(client, None).status_code for _ in range(3)]
+
+    assert statuses[-1] == 429
+    assert place_order(client, 1).status_code == 200
+
+
+def test_location_lookups_are_limited_without_ip_limits(client, limits):
+    limits['delivery_zone:all'] = (1, 60)
+    limits['check_location:all'] = (1, 60)
+
+    assert client.get('/delivery_zone?postal=42-600').status_code == 200
+    assert client.get('/delivery_zone?postal=42-600').status_code == 429
+    assert client.post('/check_location', json={'latitude': 50.8, 'longitude': 19.1}).status_code == 200
+    assert client.post('/check_location', json={'latitude': 50.8, 'longitude': 19.1}).status_code == 429
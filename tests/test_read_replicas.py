@@ -0,0 +1,122 @@
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app import db, Order, READ_REPLICA_COOKIE
+from conftest import EMPLOYEE_USERNAME, EMPLOYEE_PASSWORD
+
+
+@pytest.fixture
+def databases_used(app, replica_in_sync):
+    # Bazy ("primary", "replica_0"), na których wykonano zapytania
+    used = []
+    listeners = []
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        def record(*args, name=key or 'primary', **kwargs):
+            used.append(name)
+        event.listen(engine, 'before_cursor_execute', record)
+        listeners.append((engine, record))
+    yield used
+    for engine, record in listeners:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def employee(app):
+    # Tablet kelnera - osobny klient obok `client` (gość przy stoliku)
+    client = app.test_client()
+    client.post('/login', data={'username': EMPLOYEE_USERNAME, 'password': EMPLOYEE_PASSWORD})
+    client.delete_cookie(READ_REPLICA_COOKIE)
+    return client
+
+
+def databases_for(used, send):
+    used.clear()
+    response = send()
+    return response, set(used)
+
+
+def place_order(client):
+    return client.post('/order', json={'table_id': 1, 'items': [{'id': 1, 'quantity': 1}]})
+
+
+def test_read_views_use_replica(employee, databases_used):
+    for url in ('/check_new_orders', '/check_waiter_calls', '/order_history'):
+        response, used = databases_for(databases_used, lambda: employee.get(url))
+        assert response.status_code == 200, url
+        assert used == {'replica_0'}, url
+
+
+def test_writes_use_primary_and_pin_client(app, client, databases_used):
+    response, used = databases_for(databases_used, lambda: place_order(client))
+
+    assert response.status_code == 200
+    assert used == {'primary'}
+    primary_until = float(client.get_cookie(READ_REPLICA_COOKIE).value)
+    assert time.time() < primary_until <= time.time() + app.config['READ_REPLICA_STICKY_SECONDS']
+
+
+def test_pinned_client_reads_own_write_from_primary(client, databases_used):
+    place_order(client)
+
+    # Replika nie ma jeszcze tego zamówienia
+    response, used = databases_for(databases_used, lambda: client.get('/check_waiter_calls'))
+
+    assert response.status_code == 200
+    assert used == {'primary'}
+
+
+def test_other_clients_keep_reading_replica(client, employee, databases_used):
+    place_order(client)
+
+    response, used = databases_for(databases_used, lambda: employee.get('/check_new_orders'))
+
+    assert used == {'replica_0'}
+    assert response.json == []
+
+
+def test_pin_cookie_expires(app, employee, databases_used):
+    response = place_order(employee)
+
+    sticky_seconds = app.config['READ_REPLICA_STICKY_SECONDS']
+    set_cookie = next(header for header in response.headers.getlist('Set-Cookie')
+                      if header.startswith(f"{READ_REPLICA_COOKIE}="))
+    assert f"Max-Age={sticky_seconds}" in set_cookie
+    pinned_until = employee.get_cookie(READ_REPLICA_COOKIE).value
+
+    _, used = databases_for(databases_used, lambda: employee.get('/check_new_orders'))
+    assert used == {'primary'}
+
+    # Przeglądarka, która nie usunęła ciasteczka po Max-Age - decyduje zapisany w nim czas
+    employee.set_cookie(READ_REPLICA_COOKIE, str(int(time.time()) - 1))
+    _, used = databases_for(databases_used, lambda: employee.get('/check_new_orders'))
+    assert used == {'replica_0'}
+
+    employee.set_cookie(READ_REPLICA_COOKIE, pinned_until)
+    employee.delete_cookie(READ_REPLICA_COOKIE)
+    _, used = databases_for(databases_used, lambda: employee.get('/check_new_orders'))
+    assert used == {'replica_0'}
+
+
+def test_malformed_cookie_falls_back_to_replica(employee, databases_used):
+    employee.set_cookie(READ_REPLICA_COOKIE, 'jutro')
+
+    response, used = databases_for(databases_used, lambda: employee.get('/check_new_orders'))
+
+    assert response.status_code == 200
+    assert used == {'replica_0'}
+
+
+def test_locking_read_switches_request_to_primary(app, databases_used):
+    with app.test_request_context():
+        db.session().info['db_replica'] = 'replica_0'
+
+        _, used = databases_for(databases_used, lambda: db.session.execute(db.select(Order.id).with_for_update()).all())
+        assert used == {'primary'}
+
+        # Po odczycie z blokadą reszta żądania też czyta z bazy głównej
+        _, used = databases_for(databases_used, lambda: db.session.execute(db.select(Order.id)).all())
+        assert used == {'primary'}
@@ -0,0 +1,105 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app import db, MenuItem, OrderItem, SalesRollup, CategorySalesRollup
+
+
+@pytest.fixture
+def order_id(client):
+    # 2 x Żurek po 12.50 + 1 x Żurek na wynos
+    response = client.post('/order', json={'table_id': 1, 'items': [
+        {'id': 1, 'quantity': 2},
+        {'id': 1, 'quantity': 1, 'takeaway': True},
+    ]})
+    assert response.status_code == 200
+    return response.json['order_id']
+
+
+def change_price(app, price):
+    with app.app_context():
+        db.session.get(MenuItem, 1).price = price
+        db.session.commit()
+
+
+def day_rollups(app):
+    with app.app_context():
+        sales = db.session.execute(db.select(SalesRollup).filter_by(period='day')).scalar_one()
+        category = db.session.execute(db.select(CategorySalesRollup).filter_by(period='day')).scalar_one()
+        return (sales.order_count, sales.revenue), (category.item_count, category.revenue)
+
+
+def test_order_items_keep_price_from_order_time(app, order_id):
+    change_price(app, 99.99)
+
+    with app.app_context():
+        prices = db.session.scalars(db.select(OrderItem.unit_price).filter_by(order_id=order_id)).all()
+    assert prices == [Decimal('12.50'), Decimal('12.50')]
+
+
+def test_completion_records_price_charged(app, client, order_id):
+    change_price(app, 99.99)
+
+    client.post(f'/update_order_status/{order_id}')
+
+    sales, category = day_rollups(app)
+    assert sales[0] == 1
+    assert category == (3, Decimal('37.50'))
+
+
+def test_double_completion_is_recorded_once(app, client, order_id):
+    client.post(f'/update_order_status/{order_id}')
+    client.post(f'/update_order_status/{order_id}')
+
+    sales, category = day_rollups(app)
+    assert sales[0] == 1
+    assert category == (3, Decimal('37.50'))
+
+
+def test_rebuild_matches_recorded_rollups_after_price_change(app, client, order_id):
+    client.post(f'/update_order_status/{order_id}')
+    recorded = day_rollups(app)
+    change_price(app, 99.99)
+
+    result = app.test_cli_runner().invoke(args=['rebuild-sales-rollups'])
+
+    assert result.exit_code == 0, result.output
+    assert day_rollups(app) == recorded
+
+
+def test_completion_reads_items_and_categories_with_one_query(app, client, order_id):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('SELECT') and ('order_item' in statement or 'menu_item' in statement):
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client.post(f'/update_order_status/{order_id}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 1
+
+
+def test_completion_locks_change_counter_before_order(app, client, order_id):
+    # Ta sama kolejność blokad co flush i kitchen_batch_done: licznik "orders", potem zamówienie
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('UPDATE'):
+            statements.append(statement.split()[1].strip('"'))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client.post(f'/update_order_status/{order_id}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements.index('change_counter') < statements.index('order')
@@ -0,0 +1,118 @@
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+from app import db, Order, OrderItem, CheckoutSession
+
+
+def sign(payload, secret='whsec_test', timestamp=None):
+    # Nagłówek Stripe-Signature w formacie Stripe: t=<czas>,v1=<HMAC-SHA256("<czas>.<treść>")>
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def stripe_event(event_type, checkout, payment_status='paid', event_id='evt_test_1', session_id='cs_test_1'):
+    return json.dumps({
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'data': {'object': {
+            'id': session_id,
+            'object': 'checkout.session',
+            'payment_status': payment_status,
+            'status': 'complete' if payment_status == 'paid' else 'open',
+            'amount_total': checkout.amount_cents,
+            'client_reference_id': checkout.public_id,
+            'metadata': {'checkout_id': checkout.public_id},
+        }},
+    })
+
+
+def post_webhook(client, payload, signature=None):
+    return client.post('/stripe/webhook', data=payload, content_type='application/json',
+                       headers={'Stripe-Signature': signature or sign(payload)})
+
+
+@pytest.fixture
+def checkout(app, client):
+    response = client.post('/create-checkout-session', json={
+        'table_id': 1,
+        'items': [{'id': 1, 'quantity': 2}],
+    })
+    assert response.status_code == 202
+    with app.app_context():
+        checkout = CheckoutSession.query.one()
+        db.session.expunge(checkout)
+    return checkout
+
+
+def test_paid_session_creates_one_order(app, client, checkout):
+    response = post_webhook(client, stripe_event('checkout.session.completed', checkout))
+
+    assert response.status_code == 200
+    with app.app_context():
+        order = Order.query.one()
+        assert order.table_id == 1
+        assert order.total_price == 25.0
+        assert [(item.menu_item_id, item.quantity) for item in OrderItem.query.all()] == [(1, 2)]
+        paid = db.session.get(CheckoutSession, checkout.id)
+        assert paid.status == 'paid'
+        assert paid.order_id == order.id
+        assert paid.stripe_session_id == 'cs_test_1'
+
+
+def test_replayed_event_does_not_create_second_order(app, client, checkout):
+    payload = stripe_event('checkout.session.completed', checkout)
+    assert post_webhook(client, payload).status_code == 200
+    assert post_webhook(client, payload).status_code == 200
+
+    with app.app_context():
+        assert Order.query.count() == 1
+
+
+def test_second_event_for_same_session_does_not_create_second_order(app, client, checkout):
+    completed = stripe_event('checkout.session.completed', checkout, event_id='evt_test_1')
+    succeeded = stripe_event('checkout.session.async_payment_succeeded', checkout, event_id='evt_test_2')
+    assert post_webhook(client, completed).status_code == 200
+    assert post_webhook(client, succeeded).status_code == 200
+
+    with app.app_context():
+        assert Order.query.count() == 1
+        assert db.session.get(CheckoutSession, checkout.id).order_id == Order.query.one().id
+
+
+def test_bad_signature_is_rejected(app, client, checkout):
+    payload = stripe_event('checkout.session.completed', checkout)
+
+    wrong_secret = post_webhook(client, payload, sign(payload, secret='whsec_other'))
+    tampered = post_webhook(client, payload.replace('"paid"', '"paid" '), sign(payload))
+    missing = client.post('/stripe/webhook', data=payload, content_type='application/json')
+
+    assert [wrong_secret.status_code, tampered.status_code, missing.status_code] == [400, 400, 400]
+    with app.app_context():
+        assert Order.query.count() == 0
+
+
+def test_stale_signature_is_rejected(app, client, checkout):
+    payload = stripe_event('checkout.session.completed', checkout)
+
+    response = post_webhook(client, payload, sign(payload, timestamp=time.time() - 3600))
+
+    assert response.status_code == 400
+    with app.app_context():
+        assert Order.query.count() == 0
+
+
+def test_unpaid_session_creates_nothing(app, client, checkout):
+    response = post_webhook(client, stripe_event('checkout.session.completed', checkout, payment_status='unpaid'))
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert Order.query.count() == 0
+        unpaid = db.session.get(CheckoutSession, checkout.id)
+        assert unpaid.order_id is None
+        assert unpaid.status != 'paid'